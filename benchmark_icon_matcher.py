@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark for fallback icon matching (planner.views.get_fallback_icon).
+
+Compares the precompiled keyword matcher with the previous implementation,
+which rebuilt the keyword table on every call and scanned it with a Python
+loop. Names are generated locally; no network access or running server needed.
+
+Usage: python benchmark_icon_matcher.py [--names 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_planner.settings')
+django.setup()
+
+from planner.icons import POI_ICON_KEYWORDS, POI_TYPE_ICONS  # noqa: E402
+from planner.views import get_fallback_icon  # noqa: E402
+
+NAME_WORDS = [
+    'Louvre', 'Grand', 'Old', 'Royal', 'Saint', 'Central', 'Le', 'Petit', 'Blue', 'Golden', 'Café',
+    'Nord', 'Sacré', 'Coeur', 'Notre', 'Dame', 'Jardin', 'Via', 'Roma', 'Casa', 'Batlló', 'Shibuya',
+    'Crossing', 'Harbour', 'Bay', 'Hill', 'Street', 'Avenue', 'House', 'Hall', 'Opera', 'Theatre',
+]
+POI_TYPES = list(POI_TYPE_ICONS) + ['other']
+
+
+def legacy_get_fallback_icon(poi_name, poi_type):
+    """The previous implementation: rebuild the table, loop over every keyword."""
+    poi_name_lower = poi_name.lower()
+    smart_icons = dict(POI_ICON_KEYWORDS)
+    for keyword, icon in smart_icons.items():
+        if keyword in poi_name_lower:
+            return icon
+    fallback_icons = dict(POI_TYPE_ICONS)
+    return fallback_icons.get(poi_type, '📍')
+
+
+def make_names(count, seed=42):
+    """POI-like names; roughly half contain one or more keywords."""
+    rng = random.Random(seed)
+    keywords = [keyword.title() for keyword in POI_ICON_KEYWORDS]
+    names = []
+    for _ in range(count):
+        words = [rng.choice(NAME_WORDS) for _ in range(rng.randint(1, 3))]
+        for _ in range(rng.choice((0, 0, 1, 1, 2))):
+            words.insert(rng.randint(0, len(words)), rng.choice(keywords))
+        names.append((' '.join(words), rng.choice(POI_TYPES)))
+    return names
+
+
+def best_time(func, names, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name, poi_type in names:
+            func(name, poi_type)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fallback icon matching')
+    parser.add_argument('--names', type=int, default=100000, help='names per batch')
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs (best is reported)')
+    args = parser.parse_args()
+
+    names = make_names(args.names)
+
+    # Both implementations must agree before their timings mean anything
+    mismatches = [(n, t) for n, t in names if get_fallback_icon(n, t) != legacy_get_fallback_icon(n, t)]
+    assert not mismatches, f'{len(mismatches)} mismatches, e.g. {mismatches[:3]}'
+
+    legacy = best_time(legacy_get_fallback_icon, names, args.repeat)
+    compiled = best_time(get_fallback_icon, names, args.repeat)
+
+    print(f'Batch of {len(names):,} names')
+    print(f'  legacy loop:       {legacy * 1000:8.1f} ms  {len(names) / legacy:12,.0f} names/s')
+    print(f'  compiled matcher:  {compiled * 1000:8.1f} ms  {len(names) / compiled:12,.0f} names/s')
+    print(f'  speedup:           {legacy / compiled:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
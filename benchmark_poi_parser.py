@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for POI tag parsing in trip plans.
+
+Compares the single-pass parser (planner.views.parse_pois_from_plan) with the
+previous implementation, which ran re.findall and then str.replace plus a
+line-by-line search for every POI. No network access or running server needed.
+
+Usage: python benchmark_poi_parser.py [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_planner.settings')
+django.setup()
+
+from planner.views import create_poi_object, get_fallback_icon, parse_pois_from_plan  # noqa: E402
+
+
+def legacy_parse_pois_from_plan(plan_text):
+    """The regex + repeated str.replace implementation, without geocoding."""
+    pois = []
+    poi_id = 1
+    modified_plan = plan_text
+
+    def legacy_poi_object(poi_id, poi_name, poi_type, poi_text, icon):
+        lines = plan_text.split('\n')
+        line_index = -1
+        for i, line in enumerate(lines):
+            if poi_text in line:
+                line_index = i
+                break
+        line = lines[line_index] if line_index >= 0 else poi_text
+        return create_poi_object(poi_id, poi_name, poi_type, poi_text, icon, line, max(line_index, 0))
+
+    poi_pattern = r'<poi\s+type="([^"]+)"\s+name="([^"]+)"\s+icon="([^"]+)">([^<]+)</poi>'
+    matches = re.findall(poi_pattern, plan_text)
+    if matches:
+        for poi_type, poi_name, poi_icon, poi_text in matches:
+            pois.append(legacy_poi_object(poi_id, poi_name, poi_type, poi_text, poi_icon))
+            original_tag = f'<poi type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>'
+            new_tag = f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>'
+            modified_plan = modified_plan.replace(original_tag, new_tag, 1)
+            poi_id += 1
+    else:
+        poi_pattern_old = r'<poi\s+type="([^"]+)"\s+name="([^"]+)">([^<]+)</poi>'
+        for poi_type, poi_name, poi_text in re.findall(poi_pattern_old, plan_text):
+            fallback_icon = get_fallback_icon(poi_name, poi_type)
+            pois.append(legacy_poi_object(poi_id, poi_name, poi_type, poi_text, fallback_icon))
+            original_tag = f'<poi type="{poi_type}" name="{poi_name}">{poi_text}</poi>'
+            new_tag = f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{fallback_icon}">{poi_text}</poi>'
+            modified_plan = modified_plan.replace(original_tag, new_tag, 1)
+            poi_id += 1
+
+    unique_pois = []
+    seen_names = set()
+    for poi in pois:
+        if poi['name'].lower() not in seen_names:
+            unique_pois.append(poi)
+            seen_names.add(poi['name'].lower())
+    return unique_pois, modified_plan
+
+
+def make_plan(poi_count, with_icons=True, filler_lines=3):
+    """Build a synthetic plan with one POI per paragraph and some filler text."""
+    filler = 'Wander the neighbourhood, stop for coffee and enjoy the local atmosphere. ' * 3
+    lines = []
+    for i in range(poi_count):
+        if i % 5 == 0:
+            lines.append(f'## Day {i // 5 + 1}')
+        icon = ' icon="🗼"' if with_icons else ''
+        lines.append(f'- Morning: visit <poi type="attraction" name="Landmark {i}"{icon}>Landmark {i}</poi> near the old town.')
+        lines.extend(filler for _ in range(filler_lines))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark POI tag parsing')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs per case (best is reported)')
+    args = parser.parse_args()
+
+    print(f"{'POIs':>6} {'plan KB':>8} {'format':>7} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    print('-' * 60)
+    for poi_count in (10, 50, 200, 1000):
+        for with_icons in (True, False):
+            plan = make_plan(poi_count, with_icons)
+
+            # Both implementations must agree before their timings mean anything
+            legacy_pois, legacy_plan = legacy_parse_pois_from_plan(plan)
+            new_pois, new_plan = parse_pois_from_plan(plan)
+            assert legacy_plan == new_plan, 'rewritten plans differ'
+            assert legacy_pois == new_pois, 'POI objects differ'
+
+            number = max(1, 2000 // poi_count)
+            legacy = min(timeit.repeat(lambda: legacy_parse_pois_from_plan(plan), number=number, repeat=args.repeat)) / number
+            single = min(timeit.repeat(lambda: parse_pois_from_plan(plan), number=number, repeat=args.repeat)) / number
+
+            print(f"{poi_count:>6} {len(plan.encode()) / 1024:>8.1f} {'icon' if with_icons else 'old':>7} "
+                  f"{legacy * 1000:>10.3f} {single * 1000:>15.3f} {legacy / single:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the OpenAI Chat Completions API and the Google Maps
+Geocoding API, for load testing the planner offline.
+
+One threaded HTTP server answers both:
+  POST /v1/chat/completions       a plan with --pois POI tags (JSON or SSE stream)
+  GET  /maps/api/geocode/json     a deterministic location for the address
+  GET  /stats                     upstream call counts since start (or last reset)
+  POST /stats/reset               zero the counters
+
+Point the app at it with OPENAI_BASE_URL=http://HOST:PORT/v1 and
+GOOGLE_GEOCODE_URL=http://HOST:PORT/maps/api/geocode/json.
+
+Usage: python loadtest/fake_upstreams.py [--port 8100] [--openai-latency 2.0]
+       [--geocode-latency 0.05] [--error-rate 0.01] [--pois 15]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DESTINATION_PATTERN = re.compile(r'(?:trip to|destination:)\s*([^(\n.]+)', re.IGNORECASE)
+POI_TYPES = ['attraction', 'restaurant', 'museum', 'park', 'shopping', 'hotel', 'transport']
+
+
+class UpstreamConfig:
+    """Latency (seconds, plus up to `jitter` extra), error rate and plan size."""
+
+    def __init__(self, openai_latency=2.0, geocode_latency=0.05, jitter=0.2, error_rate=0.0,
+                 pois=15, days=3, seed=None):
+        self.openai_latency = openai_latency
+        self.geocode_latency = geocode_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pois = pois
+        self.days = days
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {'openai': 0, 'openai_errors': 0, 'openai_tokens': 0, 'geocode': 0, 'geocode_errors': 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def delay(self, latency):
+        with self.lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0
+            fail = self.random.random() < self.error_rate
+        time.sleep(latency + extra)
+        return fail
+
+
+def fake_plan(destination, pois, days):
+    """Plan text in the shape the prompt asks for, with `pois` POI tags."""
+    lines = [f'# Trip to {destination}', '']
+    per_day = max(1, -(-pois // days))
+    for index in range(pois):
+        if index % per_day == 0:
+            lines += ['', f'## Day {index // per_day + 1}']
+        poi_type = POI_TYPES[index % len(POI_TYPES)]
+        name = f'{destination} {poi_type.title()} {index + 1}'
+        lines.append(f'- Visit <poi type="{poi_type}" name="{name}" icon="📍">{name}</poi> and take your time.')
+    return '\n'.join(lines)
+
+
+def fake_location(address):
+    """A stable lat/lng for an address, so repeated runs geocode identically."""
+    digest = hashlib.sha1(address.lower().encode('utf-8')).digest()
+    lat = digest[0] / 255 * 120 - 60
+    lng = digest[1] / 255 * 340 - 170
+    return {'lat': round(lat, 6), 'lng': round(lng, 6)}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                return self.send_json(200, config.snapshot())
+            if url.path.endswith('/geocode/json'):
+                return self.geocode(parse_qs(url.query).get('address', [''])[0])
+            self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if url.path == '/stats/reset':
+                config.reset()
+                return self.send_json(200, config.snapshot())
+            if url.path.endswith('/chat/completions'):
+                return self.chat_completion(body)
+            self.send_json(404, {'error': 'not found'})
+
+        def geocode(self, address):
+            config.count('geocode')
+            if config.delay(config.geocode_latency):
+                config.count('geocode_errors')
+                return self.send_json(500, {'status': 'UNKNOWN_ERROR', 'results': []})
+            self.send_json(200, {
+                'status': 'OK',
+                'results': [{
+                    'formatted_address': address,
+                    'geometry': {'location': fake_location(address)},
+                }],
+            })
+
+        def chat_completion(self, body):
+            config.count('openai')
+            if config.delay(config.openai_latency):
+                config.count('openai_errors')
+                return self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+
+            prompt = '\n'.join(str(message.get('content', '')) for message in body.get('messages', []))
+            match = DESTINATION_PATTERN.search(prompt)
+            destination = match.group(1).strip() if match else 'Destination'
+            plan = fake_plan(destination[:60], config.pois, config.days)
+            completion_tokens = len(plan) // 4
+            config.count('openai_tokens', completion_tokens)
+
+            if body.get('stream'):
+                return self.stream_completion(plan, body.get('model', 'gpt-4o'))
+            self.send_json(200, {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': plan},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': len(prompt) // 4,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': len(prompt) // 4 + completion_tokens,
+                },
+            })
+
+        def stream_completion(self, plan, model):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for start in range(0, len(plan), 40):
+                chunk = {
+                    'id': 'chatcmpl-fake',
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': plan[start:start + 40]}, 'finish_reason': None}],
+                }
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.close_connection = True
+
+    return Handler
+
+
+def start_server(config, host='127.0.0.1', port=0):
+    """Start the fake upstreams on a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-upstreams', daemon=True).start()
+    return server
+
+
+def add_upstream_arguments(parser):
+    parser.add_argument('--openai-latency', type=float, default=2.0, help='seconds per chat completion')
+    parser.add_argument('--geocode-latency', type=float, default=0.05, help='seconds per geocode')
+    parser.add_argument('--jitter', type=float, default=0.2, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream calls failing with 500')
+    parser.add_argument('--pois', type=int, default=15, help='POI tags per generated plan')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args):
+    return UpstreamConfig(
+        openai_latency=args.openai_latency,
+        geocode_latency=args.geocode_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        pois=args.pois,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI and Geocoding servers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(config_from_args(args), args.host, args.port)
+    base = f'http://{args.host}:{server.server_port}'
+    print(f'OPENAI_BASE_URL={base}/v1')
+    print(f'GOOGLE_GEOCODE_URL={base}/maps/api/geocode/json')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Load test for the plan endpoint against local OpenAI and Geocoding stand-ins.
+
+Starts the fake upstreams (fake_upstreams.py) in this process, runs the app
+under gunicorn pointed at them, drives POST /api/plan-trip/ at a fixed
+concurrency and reports latency percentiles, throughput and how many upstream
+calls the run cost. Nothing leaves the machine, so runs are reproducible and
+can be compared to size workers or catch regressions.
+
+Usage:
+  python loadtest/run_loadtest.py --concurrency 32 --requests 500 --workers 4 --threads 8
+  python loadtest/run_loadtest.py --asgi --workers 2 --concurrency 64
+  python loadtest/run_loadtest.py --app-url http://127.0.0.1:8000 --upstream-url http://127.0.0.1:8100
+  python loadtest/run_loadtest.py ... --json results.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import add_upstream_arguments, config_from_args, start_server  # noqa: E402
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, upstream_url):
+    """Run the app under gunicorn with its upstreams pointed at the fakes."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY='loadtest',
+        GOOGLE_MAPS_API_KEY='loadtest',
+        OPENAI_BASE_URL=f'{upstream_url}/v1',
+        GOOGLE_GEOCODE_URL=f'{upstream_url}/maps/api/geocode/json',
+        # Measure the pipeline itself, not the plan cache or database writes
+        PLAN_CACHE_ENABLED='true' if args.plan_cache else 'false',
+        PLAN_STORE_ENABLED='true' if args.store else 'false',
+        GAZETTEER_ENABLED='true' if args.store else 'false',
+        # Every load test request comes from one address
+        PLAN_RATE_LIMIT_PER_IP='0',
+        PLAN_CONCURRENCY_PER_IP='0',
+        PLANNER_ASYNC_VIEWS='true' if args.asgi else 'false',
+    )
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+               '--timeout', '120', '--log-level', 'warning']
+    if args.asgi:
+        command += ['--worker-class', 'uvicorn.workers.UvicornWorker', 'trip_planner.asgi:application']
+    else:
+        command += ['--threads', str(args.threads), 'trip_planner.wsgi:application']
+
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'App server exited with code {process.returncode}')
+        try:
+            if requests.get(f'{url}/health/', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('App server did not become healthy within 30s')
+
+
+def plan_request(index, destinations, days):
+    """Request body for the index-th request: one of `destinations` cities, a distinct date range."""
+    start = date(2025, 1, 1) + timedelta(days=index)
+    return {
+        'destination': f'Loadtest City {index % destinations}',
+        'start_date': start.isoformat(),
+        'end_date': (start + timedelta(days=days - 1)).isoformat(),
+    }
+
+
+def run_load(url, args):
+    """Send args.requests plan requests with args.concurrency in flight; return per-request results."""
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+    local = threading.local()
+
+    def worker():
+        local.session = requests.Session()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            try:
+                response = local.session.post(
+                    f'{url}{args.path}', json=plan_request(index, args.destinations, args.days), timeout=args.timeout
+                )
+                response.content
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            with lock:
+                results.append((status, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(worker)
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(results, elapsed, upstream, args):
+    latencies = sorted(latency for status, latency in results if status == 200)
+    statuses = Counter(str(status) for status, _latency in results)
+    return {
+        'config': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'server': 'asgi' if args.asgi else 'wsgi',
+            'workers': args.workers,
+            'threads': None if args.asgi else args.threads,
+            'destinations': args.destinations,
+            'pois': args.pois,
+            'openai_latency': args.openai_latency,
+            'geocode_latency': args.geocode_latency,
+            'error_rate': args.error_rate,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else 0.0,
+        'statuses': dict(statuses),
+        'latency_s': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        'upstream': upstream,
+        'upstream_per_request': {key: round(value / len(results), 2) for key, value in upstream.items()} if results else {},
+    }
+
+
+def print_report(report):
+    config = report['config']
+    print(f"\n{config['requests']} requests, concurrency {config['concurrency']}, "
+          f"{config['server']} x{config['workers']} workers"
+          + (f" x{config['threads']} threads" if config['threads'] else ''))
+    print(f"  elapsed        {report['elapsed_s']:.2f}s")
+    print(f"  throughput     {report['throughput_rps']:.2f} req/s")
+    print(f"  statuses       {report['statuses']}")
+    latency = report['latency_s']
+    print(f"  latency (200s) p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+          f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s")
+    print('  upstream calls ' + '  '.join(f'{key} {value}' for key, value in report['upstream'].items()))
+    print('  per request    ' + '  '.join(f'{key} {value}' for key, value in report['upstream_per_request'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test /api/plan-trip/ against fake upstreams')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--destinations', type=int, default=20, help='distinct destinations to cycle through')
+    parser.add_argument('--days', type=int, default=3, help='trip length')
+    parser.add_argument('--path', default='/api/plan-trip/')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per WSGI worker')
+    parser.add_argument('--asgi', action='store_true', help='serve the async views under uvicorn workers')
+    parser.add_argument('--plan-cache', action='store_true', help='leave the plan cache enabled')
+    parser.add_argument('--store', action='store_true', help='save plans and places to the database')
+    parser.add_argument('--app-url', help='use an already running app instead of starting one')
+    parser.add_argument('--upstream-url', help='fake upstreams the running app points at (for call counts)')
+    parser.add_argument('--json', help='also write the report to this file')
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    process = None
+    if args.app_url:
+        app_url, upstream_url = args.app_url.rstrip('/'), (args.upstream_url or '').rstrip('/')
+    else:
+        server = start_server(config_from_args(args))
+        upstream_url = f'http://127.0.0.1:{server.server_port}'
+        process, app_url = start_app(args, upstream_url)
+
+    try:
+        if upstream_url:
+            requests.post(f'{upstream_url}/stats/reset', timeout=5)
+        results, elapsed = run_load(app_url, args)
+        upstream = requests.get(f'{upstream_url}/stats', timeout=5).json() if upstream_url else {}
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = summarize(results, elapsed, upstream, args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,50 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import POI, Job, Place, Plan, Trip
+
+
+class POIInline(admin.TabularInline):
+    model = POI
+    extra = 0
+    fields = ('poi_id', 'name', 'type', 'icon', 'latitude', 'longitude')
+
+
+@admin.register(Trip)
+class TripAdmin(admin.ModelAdmin):
+    list_display = ('destination', 'start_date', 'end_date', 'language', 'created_at')
+    list_filter = ('language',)
+    search_fields = ('destination',)
+    date_hierarchy = 'start_date'
+
+
+@admin.register(Plan)
+class PlanAdmin(admin.ModelAdmin):
+    list_display = ('id', 'trip', 'created_at')
+    list_select_related = ('trip',)
+    search_fields = ('trip__destination',)
+    raw_id_fields = ('trip',)
+    inlines = [POIInline]
+
+
+@admin.register(POI)
+class POIAdmin(admin.ModelAdmin):
+    list_display = ('name', 'type', 'plan', 'latitude', 'longitude')
+    list_filter = ('type',)
+    list_select_related = ('plan__trip',)
+    search_fields = ('name',)
+    raw_id_fields = ('plan',)
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'destination_key', 'latitude', 'longitude', 'source', 'created_at')
+    list_filter = ('source',)
+    search_fields = ('name', 'destination_key')
+    readonly_fields = ('name_key', 'geohash')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'queue', 'status', 'status_code', 'created_at', 'updated_at')
+    list_filter = ('queue', 'status')
+    readonly_fields = ('result', 'error')
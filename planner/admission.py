@@ -0,0 +1,224 @@
+"""
+Admission control for calls to the upstream APIs.
+
+Each upstream gets token buckets sized to its quota: Geocoding in requests
+per second, OpenAI in requests and tokens per minute. A call reserves its
+cost from every bucket before it is sent. When a bucket is short, the caller
+waits until its reservation comes due, which queues bursts in arrival order
+instead of letting them turn into OVER_QUERY_LIMIT or 429 answers. A call
+that would have to wait longer than the upstream's max wait is rejected
+straight away with AdmissionRejected.
+
+Buckets are per process by default. With ADMISSION_SHARED the reservations
+are counted in fixed windows in the Django cache (ADMISSION_CACHE_ALIAS) so
+that the limits hold across all workers; that needs a cache shared by them.
+"""
+
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import registry
+
+
+class AdmissionRejected(Exception):
+    """A call that could not be admitted to an upstream within its max wait."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f'{upstream} is over its rate limit; retry in {retry_after:.1f}s')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Up to `limit` tokens per `window` seconds, refilled continuously, in one
+    process. Reservations may take the level below zero; later callers then
+    wait for the debt to be refilled.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window
+        self._level = float(limit)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens, max_wait):
+        """
+        Take `tokens` and return (wait, cancel): the seconds until they are
+        available and a callable that gives them back. Returns (retry_after,
+        None) without taking anything when the wait would exceed `max_wait`.
+        """
+        tokens = min(tokens, self.limit)
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.limit, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._level) / self.rate)
+            if wait > max_wait:
+                return wait, None
+            self._level -= tokens
+        return wait, lambda: self._refund(tokens)
+
+    def _refund(self, tokens):
+        with self._lock:
+            self._level = min(self.limit, self._level + tokens)
+
+    def available(self):
+        with self._lock:
+            return max(0.0, min(self.limit, self._level + (time.monotonic() - self._updated) * self.rate))
+
+
+class SharedTokenBucket:
+    """
+    Up to `limit` tokens per `window` seconds across every worker, counted
+    per fixed window in the Django cache. A reservation takes the first
+    window, from now until `max_wait` ahead, that still has room.
+    """
+
+    def __init__(self, name, limit, window, alias='default'):
+        self.name = name
+        # Cache counters are integers
+        self.limit = max(1, int(limit))
+        self.window = window
+        self.alias = alias
+
+    def reserve(self, tokens, max_wait):
+        """Same contract as TokenBucket.reserve."""
+        tokens = int(min(tokens, self.limit))
+        backend = caches[self.alias]
+        now = time.time()
+        first = int(now // self.window)
+        last = int((now + max_wait) // self.window)
+        for index in range(first, last + 1):
+            key = f'planner:admission:{self.name}:{index}'
+            backend.add(key, 0, self.window * 2 + max_wait)
+            try:
+                used = backend.incr(key, tokens)
+            except ValueError:
+                # The window expired between add() and incr()
+                continue
+            if used <= self.limit:
+                return max(0.0, index * self.window - now), lambda key=key: self._release(key, tokens)
+            self._release(key, tokens)
+        return (last + 1) * self.window - now, None
+
+    def _release(self, key, tokens):
+        try:
+            caches[self.alias].decr(key, tokens)
+        except ValueError:
+            pass
+
+    def available(self):
+        used = caches[self.alias].get(f'planner:admission:{self.name}:{int(time.time() // self.window)}', 0)
+        return max(0, self.limit - used)
+
+
+class UpstreamLimiter:
+    """
+    Admission for one upstream: a call is admitted once every bucket has
+    reserved its cost, e.g. `acquire(requests=1, tokens=2500)`.
+    """
+
+    def __init__(self, upstream, buckets, max_wait, shared=False):
+        self.upstream = upstream
+        self.buckets = buckets
+        self.max_wait = max_wait
+        self.shared = shared
+
+    def reserve(self, **costs):
+        """Reserve the call's cost from every bucket; return the seconds to wait or raise AdmissionRejected."""
+        if not self.buckets:
+            return 0.0
+        wait = 0.0
+        cancels = []
+        for name, bucket in self.buckets.items():
+            bucket_wait, cancel = bucket.reserve(costs.get(name, 0), self.max_wait)
+            if cancel is None:
+                for undo in cancels:
+                    undo()
+                registry.inc('planner_admission_rejected_total', 1, 'Upstream calls rejected by admission control',
+                             upstream=self.upstream, bucket=name)
+                raise AdmissionRejected(self.upstream, bucket_wait)
+            cancels.append(cancel)
+            wait = max(wait, bucket_wait)
+        registry.observe('planner_admission_wait_seconds', wait, 'Time upstream calls waited for admission',
+                         upstream=self.upstream)
+        return wait
+
+    def acquire(self, **costs):
+        """Wait until the call is admitted; raises AdmissionRejected when that would take too long."""
+        wait = self.reserve(**costs)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, **costs):
+        """Async version of acquire()."""
+        if self.shared and self.buckets:
+            # Shared buckets talk to the cache backend
+            wait = await sync_to_async(self.reserve, thread_sensitive=False)(**costs)
+        else:
+            wait = self.reserve(**costs)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def state(self):
+        """Tokens available now in each bucket, for the metrics endpoint."""
+        return {name: bucket.available() for name, bucket in self.buckets.items()}
+
+
+def build_limiter(upstream, quotas, max_wait):
+    """
+    A limiter with one bucket per (bucket_name, limit, window) in `quotas`;
+    quotas with a limit of 0 are left out.
+    """
+    shared = settings.ADMISSION_SHARED
+    buckets = {}
+    for name, limit, window in quotas:
+        if limit > 0:
+            if shared:
+                buckets[name] = SharedTokenBucket(f'{upstream}:{name}', limit, window, settings.ADMISSION_CACHE_ALIAS)
+            else:
+                buckets[name] = TokenBucket(limit, window)
+    return UpstreamLimiter(upstream, buckets, max_wait, shared)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(upstream):
+    """Return the process-wide limiter for 'geocode' or 'openai', creating it on first use."""
+    limiter = _limiters.get(upstream)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(upstream)
+            if limiter is None:
+                if upstream == 'geocode':
+                    limiter = build_limiter(
+                        'geocode', [('requests', settings.GEOCODE_QPS, 1)], settings.GEOCODE_ADMISSION_MAX_WAIT
+                    )
+                else:
+                    limiter = build_limiter(
+                        'openai',
+                        [('requests', settings.OPENAI_RPM, 60), ('tokens', settings.OPENAI_TPM, 60)],
+                        settings.OPENAI_ADMISSION_MAX_WAIT,
+                    )
+                _limiters[upstream] = limiter
+    return limiter
+
+
+def limiter_gauges():
+    """(name, help, labels, value) gauges of the available tokens, for metrics rendering."""
+    return [
+        ('planner_admission_available_tokens', 'Tokens available in upstream admission buckets',
+         {'upstream': upstream, 'bucket': name}, value)
+        for upstream, limiter in list(_limiters.items())
+        for name, value in limiter.state().items()
+    ]
@@ -0,0 +1,280 @@
+"""
+Async implementation of the trip plan pipeline.
+
+Served through the ASGI application (trip_planner/asgi.py), a single worker
+can hold many plan requests in flight while they wait on OpenAI and the
+Geocoding API. TripPlanView in views.py remains the WSGI implementation; both
+share request parsing, prompt building and POI parsing.
+"""
+
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.translation import gettext as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from . import metrics
+from .admission import AdmissionRejected, get_limiter
+from .circuitbreaker import CircuitOpen
+from .cache import normalize_cache_key
+from .geocoding import get_async_geocoding_client
+from .jobs import plan_jobs
+from .openai_client import get_async_openai_client
+from .prompts import build_trip_prompt, plan_max_tokens
+from .views import (
+    PlanError,
+    admission_error,
+    check_circuit,
+    circuit_open_error,
+    build_plan_response,
+    chunked_plan_requests,
+    completion_token_cost,
+    gazetteer_lookup,
+    gazetteer_remember,
+    job_not_found_response,
+    job_response,
+    job_wait_seconds,
+    join_plan_parts,
+    geocode_cache,
+    geocode_flight,
+    mark_coordinates_pending,
+    openai_call,
+    parse_plan_request,
+    parse_pois_from_plan,
+    plan_cache,
+    plan_cache_key,
+    plan_flight,
+    plan_completion_kwargs,
+    plan_json_response,
+    record_token_usage,
+    store_plan,
+    timed_response,
+    use_chunked_generation,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def ageocode_with_google_maps(destination, timeout=None):
+    """Async version of geocode_with_google_maps, sharing its cache."""
+    found, cached = await geocode_cache.aget(destination)
+    if found:
+        return cached
+
+    return await geocode_flight.ado(
+        normalize_cache_key(destination),
+        lambda: afetch_geocode(destination, timeout),
+        lookup=lambda: geocode_cache.aget(destination),
+    )
+
+async def afetch_geocode(destination, timeout=None):
+    """Async version of fetch_geocode."""
+    result, status = await get_async_geocoding_client().geocode(destination, timeout=timeout)
+    if result is not None:
+        await geocode_cache.aset(destination, result)
+    elif status == 'ZERO_RESULTS':
+        await geocode_cache.aset(destination, None, negative=True)
+    return result
+
+async def ageocode_poi(poi_name, destination=None, timeout=None):
+    """Async version of geocode_poi."""
+    try:
+        search_query = f"{poi_name}, {destination}" if destination else poi_name
+        poi_location = await ageocode_with_google_maps(search_query, timeout=timeout)
+        if poi_location:
+            poi_coordinates = {
+                'lat': poi_location['latitude'],
+                'lon': poi_location['longitude']
+            }
+            logger.info(f"Successfully geocoded POI '{poi_name}' to {poi_coordinates}")
+            return poi_coordinates
+        logger.warning(f"Failed to geocode POI '{poi_name}' - no results from Google Maps")
+    except Exception as e:
+        logger.warning(f"Failed to geocode POI '{poi_name}': {str(e)}")
+    return None
+
+async def ageocode_pois(pois, destination=None):
+    """
+    Async version of geocode_pois: at most POI_GEOCODE_MAX_WORKERS geocodes in
+    flight, POIs not resolved within POI_GEOCODE_DEADLINE keep coordinates None.
+    """
+    pending = await sync_to_async(gazetteer_lookup)(pois, destination)
+    if not pending:
+        return pois
+
+    semaphore = asyncio.Semaphore(max(1, settings.POI_GEOCODE_MAX_WORKERS))
+
+    async def resolve(poi):
+        async with semaphore:
+            poi['coordinates'] = await ageocode_poi(poi['name'], destination, settings.POI_GEOCODE_TIMEOUT)
+
+    tasks = {asyncio.ensure_future(resolve(poi)): poi for poi in pending}
+    _done, not_done = await asyncio.wait(tasks, timeout=settings.POI_GEOCODE_DEADLINE)
+    for task in not_done:
+        task.cancel()
+        poi = tasks[task]
+        poi['coordinates'] = None
+        logger.warning(f"Geocoding POI '{poi['name']}' missed the {settings.POI_GEOCODE_DEADLINE}s deadline")
+
+    await sync_to_async(gazetteer_remember)(pending, destination)
+    return pois
+
+async def aextract_pois_from_plan(plan_text, language='en', destination=None, defer_geocoding=False):
+    """Async version of extract_pois_from_plan."""
+    with metrics.stage('parse_pois'):
+        unique_pois, modified_plan = parse_pois_from_plan(plan_text, destination)
+    metrics.count('pois', len(unique_pois), 'POIs extracted from generated plans')
+    if defer_geocoding:
+        mark_coordinates_pending(unique_pois)
+    else:
+        with metrics.stage('geocode_pois'):
+            await ageocode_pois(unique_pois, destination)
+    return unique_pois, modified_plan
+
+async def ageocode_destination(destination):
+    """Async version of geocode_destination."""
+    try:
+        with metrics.stage('geocode_destination'):
+            location_data = await ageocode_with_google_maps(destination)
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except CircuitOpen as e:
+        raise circuit_open_error(e)
+    if not location_data:
+        raise PlanError(_('Unable to locate the destination. Please try again later.'), 'GEOCODING_ERROR')
+    return location_data
+
+async def aadmit_openai_call(completion_kwargs):
+    """Async version of admit_openai_call."""
+    try:
+        with metrics.stage('openai_admission'):
+            await get_limiter('openai').aacquire(requests=1, tokens=completion_token_cost(completion_kwargs))
+    except AdmissionRejected as e:
+        logger.warning(f"OpenAI call rejected by admission control: {str(e)}")
+        raise admission_error(e)
+
+async def agenerate_plan(prompt, max_tokens=None, stage_name='openai'):
+    """Async version of generate_plan."""
+    completion_kwargs = plan_completion_kwargs(prompt, max_tokens)
+    check_circuit('openai')
+    await aadmit_openai_call(completion_kwargs)
+    try:
+        client = get_async_openai_client()
+        with metrics.stage(stage_name), openai_call():
+            response = await client.chat.completions.create(**completion_kwargs)
+        record_token_usage(response)
+        return response.choices[0].message.content.strip()
+    except CircuitOpen as e:
+        raise circuit_open_error(e)
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        raise PlanError(_('Unable to generate trip plan. Please try again later.'), 'OPENAI_ERROR')
+
+async def agenerate_trip_plan(params, location_data):
+    """Async version of generate_trip_plan."""
+    if use_chunked_generation(params):
+        return await agenerate_chunked_plan(params, location_data)
+    return await agenerate_plan(build_trip_prompt(params, location_data), plan_max_tokens(params))
+
+async def agenerate_chunked_plan(params, location_data):
+    """Async version of generate_chunked_plan."""
+    requests = chunked_plan_requests(params, location_data)
+    metrics.count('openai_plan_chunks', len(requests), 'Completions made for chunked plans')
+    semaphore = asyncio.Semaphore(settings.PLAN_CHUNK_MAX_WORKERS)
+
+    async def generate(prompt, max_tokens):
+        async with semaphore:
+            return await agenerate_plan(prompt, max_tokens, 'openai_chunk')
+
+    tasks = [asyncio.ensure_future(generate(prompt, max_tokens)) for prompt, max_tokens in requests]
+    try:
+        with metrics.stage('openai'):
+            parts = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return join_plan_parts(parts)
+
+async def arun_plan_pipeline(params):
+    """Async version of run_plan_pipeline."""
+    location_data = await ageocode_destination(params['destination'])
+    plan = await agenerate_trip_plan(params, location_data)
+
+    # Extract POIs from the plan
+    pois, modified_plan = await aextract_pois_from_plan(
+        plan, params['language'], params['destination'], defer_geocoding=params['defer_geocoding']
+    )
+
+    payload = build_plan_response(params, location_data, modified_plan, pois)
+    with metrics.stage('store'):
+        return await sync_to_async(store_plan)(params, payload)
+
+async def acached_plan_pipeline(params):
+    """Async version of cached_plan_pipeline."""
+    key = plan_cache_key(params)
+    if not settings.PLAN_CACHE_ENABLED:
+        return await plan_flight.ado(key, lambda: arun_plan_pipeline(params)), None
+
+    found, payload = await plan_cache.aget(key)
+    if found and payload is not None:
+        metrics.count('plan_cache_hits', help_text='Plan requests answered from the plan cache')
+        return payload, 'HIT'
+
+    metrics.count('plan_cache_misses', help_text='Plan requests not found in the plan cache')
+
+    async def compute():
+        payload = await arun_plan_pipeline(params)
+        await plan_cache.aset(key, payload)
+        return payload
+
+    return await plan_flight.ado(key, compute, lookup=lambda: plan_cache.aget(key)), 'MISS'
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTripPlanView(View):
+    """Async counterpart of TripPlanView with the same request and response."""
+
+    async def post(self, request):
+        with metrics.track_request('plan_trip') as timings:
+            response = await self.plan(request)
+        return timed_response(response, timings)
+
+    async def plan(self, request):
+        try:
+            params = parse_plan_request(request)
+            return plan_json_response(*await acached_plan_pipeline(params))
+
+        except PlanError as e:
+            return e.to_response()
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'error': _('Invalid JSON data provided'),
+                'error_code': 'INVALID_JSON'
+            }, status=400)
+        except Exception as e:
+            logger.error(f"Unexpected error in AsyncTripPlanView: {str(e)}")
+            return JsonResponse({
+                'error': _('An unexpected error occurred. Please try again later.'),
+                'error_code': 'UNEXPECTED_ERROR'
+            }, status=500)
+
+class AsyncTripPlanJobStatusView(View):
+    """
+    Async counterpart of TripPlanJobStatusView: a ?wait= long poll (up to
+    PLAN_JOB_MAX_WAIT) waits on the event loop instead of holding a thread.
+    """
+
+    async def get(self, request, job_id):
+        wait_seconds = job_wait_seconds(request, settings.PLAN_JOB_MAX_WAIT)
+        if wait_seconds:
+            job = await plan_jobs.await_job(job_id, wait_seconds)
+        else:
+            job = await sync_to_async(plan_jobs.get)(job_id)
+        if job is None:
+            return job_not_found_response()
+        return job_response(request, job)
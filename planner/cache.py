@@ -0,0 +1,147 @@
+"""
+Two-tier caching used by the planner.
+
+A small in-process LRU sits in front of a shared Django cache backend, so the
+hottest keys are served without any I/O while every worker still benefits from
+results computed by the others.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+# Marker stored for cached negative results (e.g. a geocode with no results)
+_NEGATIVE = '__negative__'
+_MISSING = object()
+
+
+def normalize_cache_key(text):
+    """Normalize a free-form query: lowercase and collapse whitespace."""
+    return ' '.join(str(text).lower().split())
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of a shared Django cache backend.
+
+    Positive entries live for `ttl` seconds and negative entries for
+    `negative_ttl` seconds in both tiers. `get` returns a (found, value) tuple so
+    that a cached negative result (value None) can be told apart from a miss.
+    """
+
+    def __init__(self, namespace, ttl, negative_ttl=None, max_entries=1024, alias='default'):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.max_entries = max_entries
+        self.alias = alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'negative_hits': 0, 'sets': 0}
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        # Hash the key so that arbitrary text is safe for every cache backend
+        digest = hashlib.sha1(normalize_cache_key(key).encode('utf-8')).hexdigest()
+        return f'planner:{self.namespace}:{digest}'
+
+    def get(self, key):
+        cache_key = self.make_key(key)
+        found, value = self._get_local(cache_key)
+        if found:
+            return True, value
+        return self._from_shared(cache_key, self.backend.get(cache_key, _MISSING))
+
+    async def aget(self, key):
+        """Async version of get() for the async views."""
+        cache_key = self.make_key(key)
+        found, value = self._get_local(cache_key)
+        if found:
+            return True, value
+        return self._from_shared(cache_key, await self.backend.aget(cache_key, _MISSING))
+
+    def set(self, key, value, negative=False):
+        cache_key, value, timeout = self._prepare_set(key, value, negative)
+        self.backend.set(cache_key, _NEGATIVE if value is None else value, timeout)
+        self._finish_set(cache_key, value)
+
+    async def aset(self, key, value, negative=False):
+        """Async version of set() for the async views."""
+        cache_key, value, timeout = self._prepare_set(key, value, negative)
+        await self.backend.aset(cache_key, _NEGATIVE if value is None else value, timeout)
+        self._finish_set(cache_key, value)
+
+    def delete(self, key):
+        cache_key = self.make_key(key)
+        self.backend.delete(cache_key)
+        with self._lock:
+            self._local.pop(cache_key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _get_local(self, cache_key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(cache_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._local.move_to_end(cache_key)
+                    self._count('local_hits', value)
+                    return True, value
+                del self._local[cache_key]
+        return False, None
+
+    def _from_shared(self, cache_key, value):
+        if value is _MISSING:
+            with self._lock:
+                self._stats['misses'] += 1
+            return False, None
+
+        if value == _NEGATIVE:
+            value = None
+        with self._lock:
+            self._store_local(cache_key, value, time.monotonic())
+            self._count('shared_hits', value)
+        return True, value
+
+    def _prepare_set(self, key, value, negative):
+        if negative:
+            value = None
+        timeout = self.negative_ttl if value is None else self.ttl
+        return self.make_key(key), value, timeout
+
+    def _finish_set(self, cache_key, value):
+        with self._lock:
+            self._store_local(cache_key, value, time.monotonic())
+            self._stats['sets'] += 1
+
+    def _store_local(self, cache_key, value, now):
+        # Caller must hold self._lock
+        timeout = self.negative_ttl if value is None else self.ttl
+        self._local[cache_key] = (now + timeout, value)
+        self._local.move_to_end(cache_key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def _count(self, tier, value):
+        # Caller must hold self._lock
+        self._stats[tier] += 1
+        if value is None:
+            self._stats['negative_hits'] += 1
@@ -0,0 +1,151 @@
+"""
+Circuit breakers for the upstream APIs.
+
+When Geocoding or OpenAI is failing, waiting for every call to time out ties
+up workers exactly when capacity is scarce. A breaker counts consecutive
+failed calls; after `failure_threshold` of them it opens and calls fail at
+once with CircuitOpen for `reset_timeout` seconds. Then it lets a single
+trial call through (half-open): a success closes it again, a failure opens
+it for another `reset_timeout`. Cached answers (geocode cache, gazetteer,
+plan cache) are looked up before the client is called, so they are still
+served while a breaker is open.
+
+Breakers are per worker process, like the upstream health windows.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import registry
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """A call refused because the upstream's circuit breaker is open."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f'{upstream} circuit breaker is open; retry in {retry_after:.1f}s')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one upstream. Call `before_call()`
+    before each upstream call and `record(ok)` with its outcome, or
+    `release()` when the call failed through the caller's own fault. A
+    failure_threshold of 0 disables the breaker.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go to the upstream now."""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            now = time.monotonic()
+            if self._state == OPEN:
+                retry_after = self._opened_at + self.reset_timeout - now
+                if retry_after > 0:
+                    raise CircuitOpen(self.name, retry_after)
+                self._set_state(HALF_OPEN)
+            # Half-open: one trial call at a time; a trial that never reported
+            # back (e.g. a cancelled task) is replaced after reset_timeout
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                raise CircuitOpen(self.name, self.reset_timeout - (now - self._trial_started))
+            self._trial_started = now
+
+    def record(self, ok):
+        """Record the outcome of a call let through by before_call()."""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if ok:
+                self._failures = 0
+                if self._state != CLOSED:
+                    self._set_state(CLOSED)
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """
+        End a call let through by before_call() whose outcome says nothing
+        about the upstream's health, such as a rejected bad request: the
+        state is unchanged and a half-open trial slot is freed.
+        """
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_started = None
+
+    def retry_after(self):
+        """Seconds until an open breaker lets a trial call through, or 0."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def snapshot(self):
+        """State, consecutive failures and remaining cool-down, for the health endpoints."""
+        with self._lock:
+            state, failures = self._state, self._failures
+        return {
+            'state': state,
+            'consecutive_failures': failures,
+            'failure_threshold': self.failure_threshold,
+            'retry_after_seconds': round(self.retry_after(), 1),
+        }
+
+    def _set_state(self, state):
+        self._state = state
+        self._trial_started = None
+        registry.inc('planner_circuit_breaker_transitions_total', 1, 'Circuit breaker state changes',
+                      upstream=self.name, state=state)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream):
+    """Return the process-wide breaker for 'geocode' or 'openai', creating it on first use."""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(upstream)
+            if breaker is None:
+                if upstream == 'geocode':
+                    breaker = CircuitBreaker(
+                        'geocode', settings.GEOCODE_BREAKER_FAILURES, settings.GEOCODE_BREAKER_RESET_TIMEOUT
+                    )
+                else:
+                    breaker = CircuitBreaker(
+                        'openai', settings.OPENAI_BREAKER_FAILURES, settings.OPENAI_BREAKER_RESET_TIMEOUT
+                    )
+                _breakers[upstream] = breaker
+    return breaker
+
+
+def breaker_states():
+    """Snapshot of both upstream breakers."""
+    return {upstream: get_breaker(upstream).snapshot() for upstream in ('geocode', 'openai')}
@@ -0,0 +1,296 @@
+"""
+Google Maps Geocoding API client.
+
+A single client per worker process owns a pooled requests.Session, so geocode
+calls reuse keep-alive connections to maps.googleapis.com instead of doing a
+fresh TCP and TLS handshake every time. The async views get an equivalent
+httpx-based client per event loop.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .admission import get_limiter
+from .circuitbreaker import get_breaker
+from .metrics import observe_upstream
+
+logger = logging.getLogger(__name__)
+
+# Answers that mean the API itself worked; anything else counts as an upstream error
+SUCCESS_STATUSES = ('OK', 'ZERO_RESULTS')
+# Outcomes that say Google is failing, as opposed to one bad request
+# (INVALID_REQUEST, REQUEST_DENIED, CLIENT_ERROR for other HTTP 4xx):
+# only these count against the circuit breaker
+UPSTREAM_FAILURE_STATUSES = ('REQUEST_ERROR', 'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+
+
+class GoogleGeocodingClient:
+    """
+    Thin wrapper around the Geocoding API with connection pooling, timeouts and
+    retries. 5xx responses are retried by the transport adapter; OVER_QUERY_LIMIT
+    answers (which come back as HTTP 200) are retried here with the same backoff.
+    Each call is first checked by `breaker` (a circuitbreaker.CircuitBreaker),
+    which raises CircuitOpen while Google is failing, and then admitted by
+    `limiter` (an admission.UpstreamLimiter), which raises AdmissionRejected
+    when the QPS budget is used up.
+    """
+
+    def __init__(self, api_key, url, pool_size=16, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.5, limiter=None, breaker=None):
+        self.api_key = api_key
+        self.url = url
+        self.limiter = limiter
+        self.breaker = breaker
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.GOOGLE_MAPS_API_KEY,
+            url=settings.GOOGLE_GEOCODE_URL,
+            pool_size=settings.GEOCODE_POOL_SIZE,
+            connect_timeout=settings.GEOCODE_CONNECT_TIMEOUT,
+            read_timeout=settings.GEOCODE_READ_TIMEOUT,
+            max_retries=settings.GEOCODE_MAX_RETRIES,
+            backoff_factor=settings.GEOCODE_BACKOFF_FACTOR,
+            limiter=get_limiter('geocode'),
+            breaker=get_breaker('geocode'),
+        )
+
+    def geocode(self, address, timeout=None):
+        """
+        Geocode an address.
+        Returns a (result, status) tuple; result is None when geocoding failed.
+        `timeout` overrides the read timeout for this call.
+        """
+        params = {
+            'address': address,
+            'key': self.api_key
+        }
+        timeouts = (self.connect_timeout, timeout if timeout is not None else self.read_timeout)
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if self.limiter is not None:
+            self.limiter.acquire(requests=1)
+        started = time.perf_counter()
+        result, status = self._geocode(address, params, timeouts)
+        record_geocode(self.breaker, started, status)
+        return result, status
+
+    def _geocode(self, address, params, timeouts):
+        try:
+            for attempt in range(self.max_retries + 1):
+                response = self.session.get(self.url, params=params, timeout=timeouts)
+                response.raise_for_status()
+                data = response.json()
+
+                if data['status'] != 'OVER_QUERY_LIMIT' or attempt == self.max_retries:
+                    break
+
+                delay = self.backoff_factor * (2 ** attempt)
+                logger.warning(f"Google Maps over query limit for '{address}', retrying in {delay}s")
+                time.sleep(delay)
+
+            return parse_geocode_response(data, address)
+
+        except requests.RequestException as e:
+            logger.error(f"Google Maps API request error for destination '{address}': {str(e)}")
+            return None, request_error_status(e.response)
+        except Exception as e:
+            logger.error(f"Unexpected error in Google Maps geocoding for destination '{address}': {str(e)}")
+            return None, 'UNKNOWN_ERROR'
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGoogleGeocodingClient:
+    """
+    asyncio counterpart of GoogleGeocodingClient built on a pooled
+    httpx.AsyncClient. Retries 5xx and OVER_QUERY_LIMIT with the same backoff.
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, api_key, url, pool_size=16, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.5, limiter=None, breaker=None):
+        self.api_key = api_key
+        self.url = url
+        self.limiter = limiter
+        self.breaker = breaker
+        self.read_timeout = read_timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.GOOGLE_MAPS_API_KEY,
+            url=settings.GOOGLE_GEOCODE_URL,
+            pool_size=settings.GEOCODE_POOL_SIZE,
+            connect_timeout=settings.GEOCODE_CONNECT_TIMEOUT,
+            read_timeout=settings.GEOCODE_READ_TIMEOUT,
+            max_retries=settings.GEOCODE_MAX_RETRIES,
+            backoff_factor=settings.GEOCODE_BACKOFF_FACTOR,
+            limiter=get_limiter('geocode'),
+            breaker=get_breaker('geocode'),
+        )
+
+    async def geocode(self, address, timeout=None):
+        """Async version of GoogleGeocodingClient.geocode."""
+        params = {
+            'address': address,
+            'key': self.api_key
+        }
+        timeouts = httpx.Timeout(timeout if timeout is not None else self.read_timeout, connect=self.connect_timeout)
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if self.limiter is not None:
+            await self.limiter.aacquire(requests=1)
+        started = time.perf_counter()
+        result, status = await self._geocode(address, params, timeouts)
+        record_geocode(self.breaker, started, status)
+        return result, status
+
+    async def _geocode(self, address, params, timeouts):
+        try:
+            for attempt in range(self.max_retries + 1):
+                response = await self.client.get(self.url, params=params, timeout=timeouts)
+                retry = response.status_code in self.RETRY_STATUSES
+                if not retry:
+                    response.raise_for_status()
+                    data = response.json()
+                    retry = data['status'] == 'OVER_QUERY_LIMIT'
+
+                if not retry or attempt == self.max_retries:
+                    break
+
+                delay = self.backoff_factor * (2 ** attempt)
+                logger.warning(f"Google Maps geocoding for '{address}' will be retried in {delay}s")
+                await asyncio.sleep(delay)
+
+            response.raise_for_status()
+            return parse_geocode_response(data, address)
+
+        except httpx.HTTPError as e:
+            logger.error(f"Google Maps API request error for destination '{address}': {str(e)}")
+            return None, request_error_status(getattr(e, 'response', None))
+        except Exception as e:
+            logger.error(f"Unexpected error in Google Maps geocoding for destination '{address}': {str(e)}")
+            return None, 'UNKNOWN_ERROR'
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def request_error_status(response):
+    """
+    Status for a failed request: CLIENT_ERROR when Google answered with a 4xx
+    other than 429 (e.g. 414 for an overlong address), REQUEST_ERROR for
+    timeouts, connection errors, 5xx and 429.
+    """
+    if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+        return 'CLIENT_ERROR'
+    return 'REQUEST_ERROR'
+
+
+def record_geocode(breaker, started, status):
+    """Report a finished geocode to the upstream metrics and the circuit breaker."""
+    observe_upstream('geocode', time.perf_counter() - started, status in SUCCESS_STATUSES)
+    if breaker is None:
+        return
+    if status in UPSTREAM_FAILURE_STATUSES:
+        breaker.record(False)
+    elif status in SUCCESS_STATUSES:
+        breaker.record(True)
+    else:
+        breaker.release()
+
+
+def parse_geocode_response(data, address):
+    """Turn a Geocoding API response body into a (result, status) tuple."""
+    if data['status'] == 'OK' and data['results']:
+        result = data['results'][0]
+        location = result['geometry']['location']
+
+        return {
+            'latitude': location['lat'],
+            'longitude': location['lng'],
+            'address': result['formatted_address'],
+            'raw': result
+        }, data['status']
+
+    logger.error(f"Google Maps geocoding failed for '{address}': {data.get('status')} - {data.get('error_message', 'Unknown error')}")
+    return None, data.get('status')
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_geocoding_client():
+    """Return the process-wide geocoding client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GoogleGeocodingClient.from_settings()
+    return _client
+
+
+# httpx async clients are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_geocoding_client():
+    """Return the async geocoding client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncGoogleGeocodingClient.from_settings()
+    return client
+
+
+def _reset_client():
+    # Pooled sockets must not be shared with a forked child
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _async_clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client)
@@ -0,0 +1,82 @@
+"""
+Geohash helpers for the place gazetteer.
+
+A geohash names a lat/lon cell; every character narrows it down, so places
+in the same cell share a prefix and "what is near here" becomes a handful of
+indexed prefix lookups instead of a distance computation over the table.
+"""
+
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 9  # ~5m cells
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    """Geohash of the cell containing (latitude, longitude)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        coordinate, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) spanned by a cell of the given precision."""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def search_precision(latitude, radius_km):
+    """
+    The finest precision whose cells are at least radius_km across at this
+    latitude, so a circle of that radius fits in the 3x3 block of cells
+    around its centre.
+    """
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    lon_scale = max(math.cos(math.radians(latitude)), 1e-6)
+    for precision in range(MAX_PRECISION, 0, -1):
+        lat_deg, lon_deg = cell_size(precision)
+        if lat_deg * km_per_degree >= radius_km and lon_deg * km_per_degree * lon_scale >= radius_km:
+            return precision
+    return 1
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes of the cell containing the point and its eight neighbours."""
+    precision = search_precision(latitude, radius_km)
+    lat_deg, lon_deg = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        for dlon in (-lon_deg, 0, lon_deg):
+            lat = latitude + dlat
+            if -90 <= lat <= 90:
+                lon = (longitude + dlon + 180) % 360 - 180
+                cells.add(encode(lat, lon, precision))
+    return cells
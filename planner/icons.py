@@ -0,0 +1,108 @@
+"""
+Fallback icons for POIs whose tag has no icon attribute.
+
+The keyword table is compiled once, at import time, into a single regular
+expression shaped like a trie, so matching a POI name is one C-level scan
+instead of a Python loop over every keyword.
+"""
+
+import re
+
+# Smart icon mapping based on common POI names and types.
+# Order matters: when several keywords occur in a name, the first one listed wins.
+POI_ICON_KEYWORDS = {
+    # Attractions
+    'tower': '🗼', 'eiffel': '🗼', 'monument': '🗽', 'statue': '🗽', 'bridge': '🌉', 'palace': '🏰',
+    'castle': '🏰', 'church': '⛪', 'cathedral': '⛪', 'temple': '🛕', 'mosque': '🕌', 'synagogue': '🕍',
+    'plaza': '🏛️', 'square': '🏛️', 'fountain': '⛲', 'museum': '🏛️', 'gallery': '🖼️',
+
+    # Restaurants
+    'restaurant': '🍽️', 'cafe': '☕', 'bistro': '🍽️', 'pub': '🍺', 'bar': '🍺', 'tavern': '🍺',
+    'diner': '🍽️', 'eatery': '🍽️', 'pizzeria': '🍕', 'bakery': '🥐', 'ice cream': '🍦',
+
+    # Hotels
+    'hotel': '🏨', 'hostel': '🏨', 'inn': '🏨', 'lodge': '🏨', 'resort': '🏖️', 'guesthouse': '🏨',
+    'motel': '🏨', 'apartment': '🏢', 'villa': '🏡',
+
+    # Parks
+    'park': '🌳', 'garden': '🌺', 'botanical': '🌺', 'zoo': '🦁', 'aquarium': '🐠', 'forest': '🌲',
+    'beach': '🏖️', 'lake': '🏞️', 'mountain': '⛰️', 'trail': '🥾',
+
+    # Shopping
+    'mall': '🛍️', 'market': '🛒', 'shop': '🛍️', 'store': '🛍️', 'boutique': '👗', 'shopping': '🛍️',
+    'outlet': '🛍️', 'department': '🏬',
+
+    # Transport
+    'airport': '✈️', 'station': '🚉', 'metro': '🚇', 'subway': '🚇', 'bus': '🚌', 'train': '🚂',
+    'port': '🚢', 'terminal': '🚉', 'garage': '🅿️', 'parking': '🅿️'
+}
+
+# Fallback to type-based icons
+POI_TYPE_ICONS = {
+    'attraction': '🗽',
+    'restaurant': '🍽️',
+    'hotel': '🏨',
+    'museum': '🏛️',
+    'park': '🌳',
+    'shopping': '🛍️',
+    'transport': '🚇'
+}
+
+DEFAULT_POI_ICON = '📍'
+
+
+def _trie_pattern(words):
+    """Regex alternation for `words` with common prefixes factored out."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word ending here makes the longer continuations optional
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordIconMatcher:
+    """
+    Finds the icon for the highest-priority keyword contained in a name.
+
+    Gives the same answer as checking `keyword in name` for each keyword in
+    table order. The compiled pattern reports the longest keyword starting at
+    every position of the name (a zero-width lookahead, so overlapping matches
+    are found too); every shorter keyword starting there is a prefix of it, so
+    each keyword is mapped to the best priority among its prefixes.
+    """
+
+    def __init__(self, keywords):
+        priorities = {}
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if keyword and keyword not in priorities:
+                priorities[keyword] = len(priorities)
+        icons = {keyword.lower(): icon for keyword, icon in reversed(list(keywords.items()))}
+
+        self._best = {}
+        for keyword in priorities:
+            prefixes = [keyword[:i] for i in range(1, len(keyword) + 1) if keyword[:i] in priorities]
+            best = min(prefixes, key=priorities.__getitem__)
+            self._best[keyword] = (priorities[best], icons[best])
+
+        self._pattern = re.compile('(?=(' + _trie_pattern(priorities) + '))') if priorities else None
+
+    def match(self, name):
+        """Return the icon for the best keyword found in `name`, or None."""
+        if self._pattern is None:
+            return None
+        found = self._pattern.findall(name.lower())
+        if not found:
+            return None
+        return min(map(self._best.__getitem__, found))[1]
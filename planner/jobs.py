@@ -0,0 +1,157 @@
+"""
+Background jobs for plan generation.
+
+A job is submitted, gets an ID immediately and runs on a worker pool; its state
+and result are stored in the database (the Job model), so any worker process
+can answer status polls. Jobs older than the queue's TTL are treated as expired
+and deleted as new jobs come in. The default thread-pool executor runs jobs
+inside the web process, which is enough for development and small deployments;
+the 'sync' executor runs them inline and is meant for tests.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = Job.STATUS_PENDING
+JOB_RUNNING = Job.STATUS_RUNNING
+JOB_SUCCEEDED = Job.STATUS_SUCCEEDED
+JOB_FAILED = Job.STATUS_FAILED
+JOB_FINISHED = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobQueue:
+    """
+    Stores jobs in the database and runs them on an executor.
+
+    `submit(function, *args)` runs `function(*args)`, which must return a
+    (status_code, payload) tuple; the payload is stored as the job's result.
+    """
+
+    def __init__(self, name, ttl=3600, executor='thread', max_workers=4, poll_interval=0.5):
+        self.name = name
+        self.ttl = ttl
+        self.executor_type = executor
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self._executor = None
+        self._lock = threading.Lock()
+        self._events = {}
+
+    def submit(self, function, *args):
+        self._purge_expired()
+        job = Job.objects.create(queue=self.name)
+        job_id = job.id.hex
+
+        with self._lock:
+            self._events[job_id] = threading.Event()
+
+        if self.executor_type == 'sync':
+            self._run(job_id, function, args)
+        else:
+            self._get_executor().submit(self._run, job_id, function, args)
+        return self.get(job_id) or job.to_dict()
+
+    def get(self, job_id):
+        """The job as a dict, or None when it doesn't exist or has expired."""
+        try:
+            job = Job.objects.filter(
+                queue=self.name, updated_at__gte=timezone.now() - timedelta(seconds=self.ttl)
+            ).get(pk=job_id)
+        except (Job.DoesNotExist, ValidationError):
+            return None
+        return job.to_dict()
+
+    def wait(self, job_id, timeout):
+        """
+        Return the job once it has finished or `timeout` seconds have passed.
+        Jobs run by this process wake the waiter immediately; jobs run by other
+        workers are polled every `poll_interval` seconds. This blocks the
+        calling thread; async views use `await_job()`.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in JOB_FINISHED or remaining <= 0:
+                return job
+
+            with self._lock:
+                event = self._events.get(job_id)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+
+    async def await_job(self, job_id, timeout):
+        """Async version of wait(), polling every `poll_interval` seconds without holding a thread."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await sync_to_async(self.get)(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in JOB_FINISHED or remaining <= 0:
+                return job
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    def _run(self, job_id, function, args):
+        try:
+            self._save(job_id, status=JOB_RUNNING)
+            try:
+                status_code, payload = function(*args)
+                outcome = {'status': JOB_SUCCEEDED if status_code < 400 else JOB_FAILED, 'status_code': status_code}
+                outcome['result' if status_code < 400 else 'error'] = payload
+            except Exception as e:
+                logger.error(f"Unexpected error in {self.name} job {job_id}: {str(e)}")
+                outcome = {
+                    'status': JOB_FAILED,
+                    'status_code': 500,
+                    'error': {'error': 'An unexpected error occurred.', 'error_code': 'UNEXPECTED_ERROR'}
+                }
+            self._save(job_id, **outcome)
+        except DatabaseError as e:
+            logger.error(f"Failed to save {self.name} job {job_id}: {str(e)}")
+        finally:
+            with self._lock:
+                event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+            if self.executor_type != 'sync':
+                # Pool threads are long-lived; don't keep a connection open per thread
+                connections.close_all()
+
+    def _save(self, job_id, **fields):
+        Job.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+    def _purge_expired(self):
+        try:
+            Job.objects.filter(queue=self.name, updated_at__lt=timezone.now() - timedelta(seconds=self.ttl)).delete()
+        except DatabaseError as e:
+            logger.warning(f"Failed to purge expired {self.name} jobs: {str(e)}")
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'{self.name}-job')
+        return self._executor
+
+
+plan_jobs = JobQueue(
+    'plan',
+    ttl=settings.PLAN_JOB_TTL,
+    executor=settings.PLAN_JOB_EXECUTOR,
+    max_workers=settings.PLAN_JOB_WORKERS,
+)
@@ -0,0 +1,67 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.cache import normalize_cache_key
+from planner.models import Place
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-load known places into the gazetteer, e.g. to preload popular cities. '
+        'Reads CSV with a header row (name,destination,lat,lon) or a JSON list of '
+        'objects with the same keys.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file to import')
+        parser.add_argument('--destination', default='', help='destination for rows that have none')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--update', action='store_true', help='overwrite coordinates of places already known')
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(options['path'])
+        places = (self.build_place(number, row, options['destination']) for number, row in enumerate(rows, 1))
+
+        kwargs = {'ignore_conflicts': True}
+        if options['update']:
+            kwargs = {
+                'update_conflicts': True,
+                'unique_fields': ['destination_key', 'name_key'],
+                'update_fields': ['name', 'latitude', 'longitude', 'geohash', 'source'],
+            }
+
+        total = 0
+        while True:
+            batch = list(islice(places, options['batch_size']))
+            if not batch:
+                break
+            Place.objects.bulk_create(batch, batch_size=options['batch_size'], **kwargs)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {total} places'))
+
+    def read_rows(self, path):
+        try:
+            if path.endswith('.json'):
+                with open(path, encoding='utf-8') as f:
+                    yield from json.load(f)
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    yield from csv.DictReader(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def build_place(self, number, row, default_destination):
+        try:
+            coordinates = {'lat': float(row['lat']), 'lon': float(row['lon'])}
+            name = row['name'].strip()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise CommandError(f'Row {number}: expected name, lat and lon')
+        if not name or not (-90 <= coordinates['lat'] <= 90 and -180 <= coordinates['lon'] <= 180):
+            raise CommandError(f'Row {number}: invalid name or coordinates')
+
+        destination = row.get('destination') or default_destination
+        return Place.build(name, coordinates, normalize_cache_key(destination), Place.SOURCE_IMPORT)
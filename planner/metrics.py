@@ -0,0 +1,249 @@
+"""
+Request timings and process metrics for the plan pipeline.
+
+`track_request()` opens a per-request Timings object in a context variable;
+`stage()` and `count()` add to it (and to the process-wide registry) from
+anywhere in the pipeline. Worker threads see the request's Timings when the
+work is submitted through `submit_with_context()`. The registry renders in
+the Prometheus text format for the /metrics/ endpoint; each worker process
+keeps its own numbers, so scrape every worker or aggregate by instance.
+Upstream calls also feed a RollingWindow per upstream, which the readiness
+check summarizes.
+"""
+
+import collections
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Upper bounds, in seconds, of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('counter', help_text))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help_text))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition of every metric, plus `gauges`: an iterable
+        of (name, help_text, labels dict, value) read at scrape time.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            help_texts = dict(self._help)
+
+        described = set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                if help_text:
+                    lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter', help_texts[name][1])
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+        for (name, labels), (bucket_counts, total, count) in histograms:
+            describe(name, 'histogram', help_texts[name][1])
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", format_value(bound)),))} {bucket_count}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        for name, help_text, labels, value in gauges:
+            describe(name, 'gauge', help_text)
+            lines.append(f'{name}{format_labels(tuple(sorted(labels.items())))} {format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+
+class Timings:
+    """Stage durations (seconds) and counters collected for one request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage_name, seconds):
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def add(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Value for the Server-Timing response header (durations in ms)."""
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f'{stage_name};dur={seconds * 1000:.1f}' for stage_name, seconds in stages]
+        entries.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(entries)
+
+    def log_fields(self):
+        """Flat dict of the request's timings (ms) and counters for structured logs."""
+        with self._lock:
+            fields = {f'{stage_name}_ms': round(seconds * 1000, 1) for stage_name, seconds in self.stages.items()}
+            fields.update(self.counters)
+        fields['total_ms'] = round(self.total * 1000, 1)
+        return fields
+
+
+_current = contextvars.ContextVar('planner_timings', default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def track_request(name):
+    """Collect stage timings and counters for the code run inside the block."""
+    timings = Timings(name)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        registry.observe('planner_request_seconds', timings.total, 'Plan request duration', endpoint=name)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage for the current request and the stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe('planner_stage_seconds', seconds, 'Duration of plan pipeline stages', stage=name)
+        timings = _current.get()
+        if timings is not None:
+            timings.add_stage(name, seconds)
+
+
+def count(name, value=1, help_text=''):
+    """Add to the current request's counter `name` and the planner_<name>_total counter."""
+    registry.inc(f'planner_{name}_total', value, help_text)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, value)
+
+
+def observe_upstream(upstream, seconds, ok):
+    """Record one call to an upstream API (after retries) and its outcome."""
+    outcome = 'ok' if ok else 'error'
+    registry.inc('planner_upstream_requests_total', 1, 'Calls to upstream APIs', upstream=upstream, outcome=outcome)
+    registry.observe('planner_upstream_seconds', seconds, 'Upstream API call duration', upstream=upstream)
+    upstream_windows[upstream].add(seconds, ok)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(f'{upstream}_calls')
+        if not ok:
+            timings.add(f'{upstream}_errors')
+
+
+def submit_with_context(executor, fn, *args):
+    """executor.submit() that runs `fn` with the caller's request timings."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class RollingWindow:
+    """
+    Outcomes of the most recent calls to one upstream, kept for `window`
+    seconds (at most `max_samples` of them), for cheap health summaries.
+    """
+
+    def __init__(self, window=60.0, max_samples=1000):
+        self.window = window
+        self._samples = collections.deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, seconds, ok):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds, ok))
+
+    def summary(self):
+        """Calls, error rate and latency percentiles (seconds) within the window."""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            samples = list(self._samples)
+
+        if not samples:
+            return {'calls': 0, 'error_rate': 0.0, 'p50_seconds': None, 'p95_seconds': None}
+        latencies = sorted(seconds for _at, seconds, _ok in samples)
+        errors = sum(1 for _at, _seconds, ok in samples if not ok)
+        return {
+            'calls': len(samples),
+            'error_rate': round(errors / len(samples), 4),
+            'p50_seconds': round(latencies[(len(latencies) - 1) // 2], 4),
+            'p95_seconds': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4),
+        }
+
+
+upstream_windows = collections.defaultdict(lambda: RollingWindow(settings.UPSTREAM_HEALTH_WINDOW))
@@ -0,0 +1,268 @@
+"""
+Per-client limits and load shedding for the plan endpoints.
+
+Plan requests hold a worker for as long as the OpenAI call takes, so they
+are checked before the view runs:
+
+1. Load shedding: when this process already has PLAN_MAX_IN_FLIGHT plan
+   requests running, the request gets a 503 straight away.
+2. Rate: each client may start PLAN_RATE_LIMIT_PER_IP (or, with a known API
+   key, PLAN_RATE_LIMIT_PER_KEY) requests per PLAN_RATE_LIMIT_WINDOW seconds.
+3. Concurrency: each client may have PLAN_CONCURRENCY_PER_IP (or
+   PLAN_CONCURRENCY_PER_KEY) requests in flight across all workers.
+
+Rate and concurrency are counted in the Django cache named by
+PLAN_LIMIT_CACHE_ALIAS, so they only hold across workers with a shared cache.
+A limit of 0 turns that check off. Rejections are 429 (client limits) or 503
+(shedding) JSON errors with Retry-After. A request's concurrency slot is held
+until its response has been sent, including the whole body of a streamed
+response.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.translation import gettext as _
+
+from .metrics import registry
+
+
+class InFlight:
+    """Count of plan requests currently running in this process."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self, limit):
+        with self._lock:
+            if limit and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.count -= 1
+
+
+in_flight = InFlight()
+
+
+def client_identity(request):
+    """
+    ('key', digest) for a request carrying one of PLAN_API_KEYS in the
+    PLAN_API_KEY_HEADER header, otherwise ('ip', address). The address comes
+    from CLIENT_IP_HEADER when set (e.g. X-Real-IP behind nginx).
+    """
+    api_key = request.headers.get(settings.PLAN_API_KEY_HEADER)
+    if api_key and api_key in settings.PLAN_API_KEYS:
+        return 'key', hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:16]
+    address = ''
+    if settings.CLIENT_IP_HEADER:
+        address = request.headers.get(settings.CLIENT_IP_HEADER, '').split(',')[0].strip()
+    return 'ip', address or request.META.get('REMOTE_ADDR', 'unknown')
+
+
+def client_limits(kind):
+    """(requests per window, concurrent requests) for a client kind."""
+    if kind == 'key':
+        return settings.PLAN_RATE_LIMIT_PER_KEY, settings.PLAN_CONCURRENCY_PER_KEY
+    return settings.PLAN_RATE_LIMIT_PER_IP, settings.PLAN_CONCURRENCY_PER_IP
+
+
+def limit_response(status, message, error_code, retry_after):
+    registry.inc('planner_requests_limited_total', 1, 'Plan requests rejected by rate limits and load shedding',
+                 reason=error_code)
+    response = JsonResponse({'error': message, 'error_code': error_code}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def shed_response():
+    return limit_response(503, _('The server is busy. Please try again shortly.'), 'SERVER_BUSY',
+                          settings.PLAN_LIMIT_RETRY_AFTER)
+
+
+def rate_limited_response(retry_after):
+    return limit_response(429, _('Too many requests. Please try again later.'), 'RATE_LIMITED', retry_after)
+
+
+def concurrency_limited_response():
+    return limit_response(429, _('Too many requests in progress. Please wait for them to finish.'),
+                          'TOO_MANY_CONCURRENT_REQUESTS', settings.PLAN_LIMIT_RETRY_AFTER)
+
+
+class PlanRequestLimitMiddleware:
+    """
+    Applies the limits above to POST requests under PLAN_LIMIT_PATHS. Works
+    in both WSGI and ASGI deployments.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.applies_to(request):
+            return self.get_response(request)
+
+        if not in_flight.try_enter(settings.PLAN_MAX_IN_FLIGHT):
+            return shed_response()
+        release = Release(in_flight.leave)
+        try:
+            rejection = check_client(request, release)
+            if rejection is not None:
+                release()
+                return rejection
+            response = self.get_response(request)
+        except BaseException:
+            release()
+            raise
+        return release_after_response(response, release)
+
+    async def __acall__(self, request):
+        if not self.applies_to(request):
+            return await self.get_response(request)
+
+        if not in_flight.try_enter(settings.PLAN_MAX_IN_FLIGHT):
+            return shed_response()
+        release = Release(in_flight.leave)
+        # The cache work runs in a thread: the backends' async incr() is a
+        # non-atomic get and set, and sync calls would block the event loop
+        arelease = sync_to_async(release, thread_sensitive=False)
+        try:
+            rejection = await sync_to_async(check_client, thread_sensitive=False)(request, release)
+            if rejection is not None:
+                await arelease()
+                return rejection
+            response = await self.get_response(request)
+        except BaseException:
+            await arelease()
+            raise
+        if response.streaming:
+            return release_after_response(response, release)
+        await arelease()
+        return response
+
+    @staticmethod
+    def applies_to(request):
+        return request.method == 'POST' and request.path.startswith(tuple(settings.PLAN_LIMIT_PATHS))
+
+
+class Release:
+    """Callbacks that free a request's slots, run once."""
+
+    def __init__(self, callback):
+        self._callbacks = [callback]
+        self._lock = threading.Lock()
+
+    def add(self, callback):
+        self._callbacks.append(callback)
+
+    def __call__(self):
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def release_after_response(response, release):
+    """
+    Free the slots now or, for a streamed response, once its body has been
+    sent: the content is wrapped in a generator that releases them when it is
+    exhausted or closed (WSGI servers and the ASGI handler close the response
+    after the last chunk or when the client goes away).
+    """
+    if not response.streaming:
+        release()
+    elif response.is_async:
+        response.streaming_content = arelease_after_stream(response.streaming_content, release)
+    else:
+        response.streaming_content = release_after_stream(response.streaming_content, release)
+    return response
+
+
+def release_after_stream(content, release):
+    try:
+        yield from content
+    finally:
+        release()
+
+
+async def arelease_after_stream(content, release):
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        await sync_to_async(release, thread_sensitive=False)()
+
+
+def check_client(request, release):
+    """
+    Count the request against its client's rate and concurrency limits.
+    Returns a 429 response when it is over one, otherwise None and adds the
+    concurrency slot to `release`.
+    """
+    kind, client = client_identity(request)
+    rate_limit, concurrency_limit = client_limits(kind)
+    backend = caches[settings.PLAN_LIMIT_CACHE_ALIAS]
+
+    if rate_limit:
+        key, window_ends = rate_key(kind, client)
+        if incr(backend, key, settings.PLAN_RATE_LIMIT_WINDOW) > rate_limit:
+            return rate_limited_response(window_ends - time.time())
+
+    if concurrency_limit:
+        key = concurrency_key(kind, client)
+        in_use = incr(backend, key, settings.PLAN_CONCURRENCY_TTL)
+        # Keep the counter alive while the client has requests running
+        backend.touch(key, settings.PLAN_CONCURRENCY_TTL)
+        if in_use > concurrency_limit:
+            decr(backend, key)
+            return concurrency_limited_response()
+        release.add(lambda: decr(backend, key))
+    return None
+
+
+def rate_key(kind, client):
+    """Cache key of the client's current rate window and the time that window ends."""
+    window = settings.PLAN_RATE_LIMIT_WINDOW
+    index = int(time.time() // window)
+    return f'planner:ratelimit:{kind}:{client}:{index}', (index + 1) * window
+
+
+def concurrency_key(kind, client):
+    return f'planner:concurrency:{kind}:{client}'
+
+
+def incr(backend, key, timeout):
+    """Increment a counter in the cache, creating it with `timeout` if needed."""
+    backend.add(key, 0, timeout)
+    try:
+        return backend.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        backend.add(key, 1, timeout)
+        return 1
+
+
+def decr(backend, key):
+    try:
+        backend.decr(key)
+    except ValueError:
+        pass
+
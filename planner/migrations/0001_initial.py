@@ -0,0 +1,75 @@
+# Generated by Django 4.2.23 on 2026-10-18 00:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.CharField(max_length=255)),
+                ('destination_key', models.CharField(max_length=255)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('language', models.CharField(default='en', max_length=10)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('formatted_address', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['destination_key', 'start_date', 'end_date', 'language'], name='trip_lookup_idx'), models.Index(fields=['start_date', 'end_date'], name='trip_dates_idx'), models.Index(fields=['language'], name='trip_language_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Plan',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('generated_at', models.CharField(blank=True, max_length=64)),
+                ('attribution', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plans', to='planner.trip')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='POI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('poi_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('type', models.CharField(max_length=50)),
+                ('icon', models.CharField(blank=True, max_length=16)),
+                ('keyword', models.CharField(max_length=500)),
+                ('line', models.TextField(blank=True)),
+                ('line_index', models.PositiveIntegerField(default=0)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pois', to='planner.plan')),
+            ],
+            options={
+                'verbose_name': 'POI',
+                'verbose_name_plural': 'POIs',
+                'ordering': ['plan', 'poi_id'],
+                'indexes': [models.Index(fields=['name'], name='poi_name_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='poi',
+            constraint=models.UniqueConstraint(fields=('plan', 'poi_id'), name='poi_unique_per_plan'),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['trip', '-created_at'], name='plan_trip_created_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-18 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('name_key', models.CharField(max_length=255)),
+                ('destination_key', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('geohash', models.CharField(db_index=True, max_length=9)),
+                ('source', models.CharField(choices=[('google', 'Google Geocoding'), ('import', 'Import')], default='google', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='place',
+            constraint=models.UniqueConstraint(fields=('destination_key', 'name_key'), name='place_unique_name'),
+        ),
+    ]
@@ -1,3 +1,310 @@
-from django.db import models
+import uuid
+from functools import reduce
+from operator import or_
 
-# Create your models here.
+from django.db import models, transaction
+
+from . import geohash as geo
+from .cache import normalize_cache_key
+
+
+class Trip(models.Model):
+    """A destination and date range a plan was generated for."""
+    destination = models.CharField(max_length=255)
+    # Lowercased, whitespace-collapsed destination used for lookups
+    destination_key = models.CharField(max_length=255)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    language = models.CharField(max_length=10, default='en')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    formatted_address = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['destination_key', 'start_date', 'end_date', 'language'], name='trip_lookup_idx'),
+            models.Index(fields=['start_date', 'end_date'], name='trip_dates_idx'),
+            models.Index(fields=['language'], name='trip_language_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.destination} ({self.start_date} - {self.end_date})'
+
+
+class PlanManager(models.Manager):
+    def with_pois(self):
+        """Plans with their trip joined and POIs prefetched: two queries in total."""
+        return self.select_related('trip').prefetch_related('pois')
+
+    def store(self, params, payload):
+        """
+        Save a generated plan payload (see build_plan_response) with its trip
+        and POIs, and return the new Plan.
+        """
+        coordinates = payload.get('coordinates') or {}
+        with transaction.atomic():
+            trip = Trip.objects.create(
+                destination=params['destination'],
+                destination_key=normalize_cache_key(params['destination']),
+                start_date=params['start_date'],
+                end_date=params['end_date'],
+                language=params['language'],
+                latitude=coordinates.get('lat'),
+                longitude=coordinates.get('lon'),
+                formatted_address=coordinates.get('formatted_address') or '',
+            )
+            plan = self.create(
+                trip=trip,
+                content=payload['plan'],
+                generated_at=payload.get('generated_at') or '',
+                attribution=payload.get('attribution') or '',
+            )
+            POI.objects.bulk_create([POI.from_dict(plan, poi) for poi in payload.get('pois', [])])
+        return plan
+
+
+class Plan(models.Model):
+    """The text of a generated trip plan. The UUID doubles as a shareable id."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='plans')
+    content = models.TextField()
+    generated_at = models.CharField(max_length=64, blank=True)
+    attribution = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PlanManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', '-created_at'], name='plan_trip_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Plan {self.id} for {self.trip}'
+
+    def to_payload(self):
+        """The same JSON shape returned by the plan endpoints."""
+        trip = self.trip
+        return {
+            'plan_id': str(self.id),
+            'destination': trip.destination,
+            'coordinates': {
+                'lat': trip.latitude,
+                'lon': trip.longitude,
+                'formatted_address': trip.formatted_address
+            },
+            'dates': {
+                'start': trip.start_date.isoformat(),
+                'end': trip.end_date.isoformat()
+            },
+            'language': trip.language,
+            'plan': self.content,
+            'generated_at': self.generated_at,
+            'attribution': self.attribution,
+            # Uses the prefetched POIs when loaded through Plan.objects.with_pois()
+            'pois': [poi.to_dict() for poi in self.pois.all()]
+        }
+
+
+class POI(models.Model):
+    """A point of interest tagged in a plan; poi_id is its id within the plan text."""
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name='pois')
+    poi_id = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    type = models.CharField(max_length=50)
+    icon = models.CharField(max_length=16, blank=True)
+    keyword = models.CharField(max_length=500)
+    line = models.TextField(blank=True)
+    line_index = models.PositiveIntegerField(default=0)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['plan', 'poi_id']
+        constraints = [
+            models.UniqueConstraint(fields=['plan', 'poi_id'], name='poi_unique_per_plan'),
+        ]
+        indexes = [
+            models.Index(fields=['name'], name='poi_name_idx'),
+        ]
+        verbose_name = 'POI'
+        verbose_name_plural = 'POIs'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_dict(cls, plan, poi):
+        """Build an unsaved POI from a dict made by create_poi_object."""
+        coordinates = poi.get('coordinates') or {}
+        return cls(
+            plan=plan,
+            poi_id=poi['id'],
+            name=poi['name'],
+            type=poi['type'],
+            icon=poi.get('icon') or '',
+            keyword=poi.get('keyword') or '',
+            line=poi.get('line') or '',
+            line_index=poi.get('line_index') or 0,
+            latitude=coordinates.get('lat'),
+            longitude=coordinates.get('lon'),
+        )
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return {'lat': self.latitude, 'lon': self.longitude}
+
+    def to_dict(self):
+        """The same shape as create_poi_object."""
+        return {
+            'id': self.poi_id,
+            'name': self.name,
+            'type': self.type,
+            'keyword': self.keyword,
+            'line': self.line,
+            'line_index': self.line_index,
+            'context': self.line,
+            'icon': self.icon,
+            'coordinates': self.coordinates
+        }
+
+
+class PlaceManager(models.Manager):
+    def lookup(self, names, destination=None):
+        """
+        Known coordinates for POI names near a destination, in one query.
+        Returns {normalized name: {'lat', 'lon'}}.
+        """
+        keys = {normalize_cache_key(name) for name in names}
+        if not keys:
+            return {}
+        places = self.filter(destination_key=normalize_cache_key(destination or ''), name_key__in=keys)
+        return {
+            name_key: {'lat': latitude, 'lon': longitude}
+            for name_key, latitude, longitude in places.values_list('name_key', 'latitude', 'longitude')
+        }
+
+    def remember(self, places, destination=None, source='google'):
+        """
+        Save (name, {'lat', 'lon'}) pairs resolved for a destination; places
+        that are already known keep their stored coordinates.
+        """
+        destination_key = normalize_cache_key(destination or '')
+        self.bulk_create(
+            [Place.build(name, coordinates, destination_key, source) for name, coordinates in places],
+            ignore_conflicts=True,
+        )
+
+    def nearby(self, latitude, longitude, radius_km=1.0, limit=50):
+        """
+        Known places within radius_km of a point, nearest first. Candidates
+        come from indexed geohash prefix lookups over the nine cells around
+        the point; only those are checked for exact distance.
+        """
+        cells = geo.covering_cells(latitude, longitude, radius_km)
+        candidates = self.filter(reduce(or_, (models.Q(geohash__startswith=cell) for cell in cells)))
+        found = []
+        for place in candidates:
+            place.distance_km = geo.haversine_km(latitude, longitude, place.latitude, place.longitude)
+            if place.distance_km <= radius_km:
+                found.append(place)
+        found.sort(key=lambda place: place.distance_km)
+        return found[:limit]
+
+
+class Place(models.Model):
+    """
+    A gazetteer entry: a place name already resolved to coordinates, so
+    landmarks that recur across plans are geocoded only once.
+    """
+    SOURCE_GOOGLE = 'google'
+    SOURCE_IMPORT = 'import'
+    SOURCE_CHOICES = [(SOURCE_GOOGLE, 'Google Geocoding'), (SOURCE_IMPORT, 'Import')]
+
+    name = models.CharField(max_length=255)
+    # Normalized name and destination (see normalize_cache_key) used for lookups
+    name_key = models.CharField(max_length=255)
+    destination_key = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    # db_index rather than Meta.indexes so PostgreSQL also gets the
+    # pattern-ops index that prefix (LIKE 'abc%') lookups need
+    geohash = models.CharField(max_length=geo.MAX_PRECISION, db_index=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=SOURCE_GOOGLE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PlaceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['destination_key', 'name_key'], name='place_unique_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def build(cls, name, coordinates, destination_key='', source=SOURCE_GOOGLE):
+        """An unsaved Place for `name` at {'lat', 'lon'}."""
+        return cls(
+            name=name,
+            name_key=normalize_cache_key(name),
+            destination_key=destination_key,
+            latitude=coordinates['lat'],
+            longitude=coordinates['lon'],
+            geohash=geo.encode(coordinates['lat'], coordinates['lon']),
+            source=source,
+        )
+
+
+class Job(models.Model):
+    """
+    A background job (see planner.jobs) and, once finished, its result. Kept
+    in the database so that every worker process can answer status polls.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    queue = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='job_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.queue} job {self.id} ({self.status})'
+
+    def to_dict(self):
+        """The job as returned by the job endpoints."""
+        job = {
+            'job_id': self.id.hex,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+        }
+        if self.status_code is not None:
+            job['status_code'] = self.status_code
+        if self.status == self.STATUS_SUCCEEDED:
+            job['result'] = self.result
+        elif self.status == self.STATUS_FAILED:
+            job['error'] = self.error
+        return job
@@ -0,0 +1,105 @@
+"""
+Process-wide OpenAI client.
+
+Building an OpenAI client creates a new httpx connection pool, so doing it per
+request means a new TLS handshake to the API on every plan. The client is
+created once per worker process instead and closed when the process exits.
+Async views get one AsyncOpenAI client per event loop.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, OpenAI
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# AsyncOpenAI clients are bound to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_options():
+    timeout = httpx.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+    limits = httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    options = {
+        'api_key': settings.OPENAI_API_KEY,
+        # Point OPENAI_BASE_URL at a local stand-in to exercise the pipeline offline
+        'base_url': settings.OPENAI_BASE_URL or None,
+        'max_retries': settings.OPENAI_MAX_RETRIES,
+        'timeout': timeout,
+    }
+    return options, timeout, limits
+
+
+def create_openai_client():
+    """Build an OpenAI client from the OPENAI_* settings."""
+    options, timeout, limits = _client_options()
+    return OpenAI(http_client=httpx.Client(limits=limits, timeout=timeout), **options)
+
+
+def create_async_openai_client():
+    """Build an AsyncOpenAI client from the OPENAI_* settings."""
+    options, timeout, limits = _client_options()
+    return AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits, timeout=timeout), **options)
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_openai_client()
+    return _client
+
+
+def get_async_openai_client():
+    """Return the AsyncOpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = create_async_openai_client()
+    return client
+
+
+def is_upstream_failure(error):
+    """
+    Whether an error from an OpenAI call means the service is failing (5xx,
+    429, timeouts and connection errors) rather than that the request was bad.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, APIConnectionError)
+
+
+def close_openai_client():
+    """Close the process-wide client and its connection pool."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+def _reset_client():
+    # Connections must not be shared with a forked child; the parent still owns them
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _async_clients.clear()
+
+
+atexit.register(close_openai_client)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client)
@@ -0,0 +1,48 @@
+"""
+Scanner for the <poi ...>...</poi> tags in generated plans, shared by the
+plan endpoints and the streaming parser.
+"""
+
+import re
+
+# Attributes inside an opening <poi ...> tag, in any order
+POI_ATTRIBUTE_PATTERN = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+
+
+def iter_poi_tags(plan_text):
+    """
+    Scan the plan once and yield (start, end, attributes, text, line_index) for
+    each well-formed <poi ...>text</poi> tag. Attributes may appear in any order;
+    tags without a type or name are skipped and left in the text unchanged, as
+    is a '<poi' followed by another '<' before its '>' (a stray '<poi' in the
+    prose). Scanning stops at a '<poi' that isn't closed yet.
+    """
+    pos = 0
+    line_index = 0
+    line_counted_to = 0
+
+    while True:
+        start = plan_text.find('<poi', pos)
+        if start == -1:
+            return
+
+        open_end = plan_text.find('>', start + 4)
+        if '<' in plan_text[start + 4:open_end]:
+            pos = start + 4
+            continue
+        close = plan_text.find('</poi>', open_end) if open_end != -1 else -1
+        if close == -1:
+            return
+
+        text = plan_text[open_end + 1:close]
+        attributes = dict(POI_ATTRIBUTE_PATTERN.findall(plan_text, start + 4, open_end))
+        if (not plan_text[start + 4].isspace() or not text or '<' in text
+                or not attributes.get('type') or not attributes.get('name')):
+            pos = start + 4
+            continue
+
+        line_index += plan_text.count('\n', line_counted_to, start)
+        line_counted_to = start
+        end = close + len('</poi>')
+        yield start, end, attributes, text, line_index
+        pos = end
@@ -0,0 +1,173 @@
+"""
+Prompt construction for trip plans.
+
+The instructions and POI-format examples are the same for every request, so
+they are compiled once into a system message that is always sent first; the
+per-request data (destination, coordinates, dates, language) follows in a
+short user message. Dedenting the instructions stops indentation from being
+billed as input tokens.
+
+OpenAI only caches prompts of at least 1024 tokens. The system message is
+about 600 tokens, so today nothing is cached and openai_cached_prompt_tokens
+stays at 0. Padding it up to the minimum would cost more than the cache
+discount saves. Keeping the static part first as an identical prefix means
+caching starts without further changes once the instructions grow past the
+minimum.
+
+Long trips are generated in parts (see generate_chunked_plan): one prompt per
+chunk of days and one for the overview, all behind the same system message.
+"""
+
+import math
+import textwrap
+from datetime import date, timedelta
+
+from django.conf import settings
+
+# Map language code to language name for OpenAI prompt
+LANGUAGE_NAMES = {
+    'en': 'English', 'es': 'Spanish', 'fr': 'French', 'de': 'German', 'it': 'Italian',
+    'pt': 'Portuguese', 'ru': 'Russian', 'ja': 'Japanese', 'ko': 'Korean', 'zh-cn': 'Chinese',
+    'zh-tw': 'Chinese', 'zh': 'Chinese', 'ar': 'Arabic', 'hi': 'Hindi', 'tr': 'Turkish',
+    'nl': 'Dutch', 'pl': 'Polish', 'sv': 'Swedish', 'da': 'Danish', 'no': 'Norwegian',
+    'fi': 'Finnish', 'cs': 'Czech', 'sk': 'Slovak', 'hu': 'Hungarian', 'ro': 'Romanian',
+    'bg': 'Bulgarian', 'el': 'Greek', 'he': 'Hebrew', 'th': 'Thai', 'vi': 'Vietnamese',
+    'id': 'Indonesian', 'ms': 'Malay', 'uk': 'Ukrainian', 'fa': 'Persian', 'sr': 'Serbian',
+    'hr': 'Croatian', 'sl': 'Slovenian', 'et': 'Estonian', 'lv': 'Latvian', 'lt': 'Lithuanian'
+}
+
+SYSTEM_PROMPT = textwrap.dedent("""
+    You are a travel planner. Plan a detailed trip for the destination, coordinates and dates given by the user.
+
+    Provide a comprehensive itinerary that includes:
+    1. Day-by-day activities and attractions
+    2. Local restaurants and food recommendations
+    3. Transportation tips within the destination
+    4. Cultural insights and local customs
+    5. Practical travel tips (weather, what to pack, etc.)
+    6. Budget-friendly and luxury options where applicable
+
+    CRITICAL: For each point of interest (POI) mentioned in your plan, you MUST highlight it using this exact format:
+    <poi type="attraction" name="Eiffel Tower" icon="🗼">Eiffel Tower</poi>
+    <poi type="restaurant" name="Le Jules Verne" icon="🍽️">Le Jules Verne restaurant</poi>
+    <poi type="hotel" name="Hotel Ritz" icon="🏨">Hotel Ritz</poi>
+    <poi type="museum" name="Louvre Museum" icon="🏛️">Louvre Museum</poi>
+    <poi type="park" name="Luxembourg Gardens" icon="🌳">Luxembourg Gardens</poi>
+    <poi type="shopping" name="Champs-Élysées" icon="🛍️">Champs-Élysées shopping district</poi>
+    <poi type="transport" name="Charles de Gaulle Airport" icon="✈️">Charles de Gaulle Airport</poi>
+
+    POI types and suggested icons:
+    - attraction: landmarks, monuments, towers, bridges, palaces, castles, churches, temples (🗽🗼🏰⛪🛕🕌🕍🏛️⛲)
+    - restaurant: restaurants, cafes, bars, bistros, pubs (🍽️☕🍺🍕🥐🍦)
+    - hotel: hotels, hostels, inns, resorts, guesthouses (🏨🏖️🏢🏡)
+    - museum: museums, galleries, exhibitions (🏛️🖼️)
+    - park: parks, gardens, zoos, aquariums (🌳🌺🦁🐠🌲🏖️🏞️⛰️)
+    - shopping: malls, markets, shopping districts, boutiques (🛍️🛒👗🏬)
+    - transport: airports, train stations, metro stations, ports (✈️🚉🚇🚌🚂🚢🅿️)
+
+    IMPORTANT: You MUST include at least 5-10 POIs in your plan, each wrapped in the <poi> tags with appropriate icons. Choose the most relevant emoji for each specific place.
+
+    Make the plan engaging, practical, and culturally sensitive. Include specific place names, addresses, and estimated costs where possible.
+
+    Answer in the language the user asks for and format the response in a clear, readable structure.
+""").strip()
+
+
+def trip_days(params):
+    """Number of days in the trip, counting both the start and end date."""
+    try:
+        days = (date.fromisoformat(params['end_date']) - date.fromisoformat(params['start_date'])).days + 1
+    except (KeyError, TypeError, ValueError):
+        return 1
+    return max(days, 1)
+
+
+def build_trip_prompt(params, location_data):
+    """The per-request part of the plan prompt, sent after SYSTEM_PROMPT."""
+    days = trip_days(params)
+    return (
+        f"{destination_line(params, location_data)}\n"
+        f"Dates: {params['start_date']} to {params['end_date']} ({days} day{'s' if days != 1 else ''})\n"
+        f"Answer in: {language_line(params)}"
+    )
+
+
+def destination_line(params, location_data):
+    return (
+        f"Destination: {params['destination']} "
+        f"(latitude: {location_data['latitude']}, longitude: {location_data['longitude']})"
+    )
+
+
+def language_line(params):
+    return LANGUAGE_NAMES.get(params['language'], 'English')
+
+
+def day_chunks(params, chunk_days, max_chunks=None):
+    """
+    Split the trip into consecutive chunks of at most `chunk_days` days, made
+    longer where needed so that there are at most `max_chunks` of them.
+    Each chunk is a dict with first_day, last_day (1-based day numbers),
+    start_date and end_date, usable as params for trip_days and plan_max_tokens.
+    """
+    start = date.fromisoformat(params['start_date'])
+    days = trip_days(params)
+    if max_chunks:
+        chunk_days = max(chunk_days, math.ceil(days / max_chunks))
+    chunks = []
+    for first in range(0, days, chunk_days):
+        last = min(first + chunk_days, days) - 1
+        chunks.append({
+            'first_day': first + 1,
+            'last_day': last + 1,
+            'start_date': (start + timedelta(days=first)).isoformat(),
+            'end_date': (start + timedelta(days=last)).isoformat(),
+        })
+    return chunks
+
+
+def build_chunk_prompt(params, location_data, chunk):
+    """Request data for the day-by-day itinerary of one chunk of a long trip."""
+    if chunk['first_day'] == chunk['last_day']:
+        day_range = f"Day {chunk['first_day']}"
+    else:
+        day_range = f"Day {chunk['first_day']} to Day {chunk['last_day']}"
+    return (
+        f"{destination_line(params, location_data)}\n"
+        f"Dates: {chunk['start_date']} to {chunk['end_date']}, "
+        f"part of a {trip_days(params)}-day trip from {params['start_date']} to {params['end_date']}\n"
+        f"Write only the day-by-day itinerary for these dates, headed {day_range}, "
+        f"with restaurants for each day. The trip overview and general tips are written separately.\n"
+        f"Answer in: {language_line(params)}"
+    )
+
+
+def build_overview_prompt(params, location_data):
+    """Request data for the overview that precedes the chunked itinerary."""
+    days = trip_days(params)
+    return (
+        f"{destination_line(params, location_data)}\n"
+        f"Dates: {params['start_date']} to {params['end_date']} ({days} days)\n"
+        f"Write only a short trip overview: highlights, transportation within the destination, "
+        f"cultural insights and local customs, practical tips and budget options. "
+        f"The day-by-day itinerary is written separately.\n"
+        f"Answer in: {language_line(params)}"
+    )
+
+
+def plan_messages(prompt):
+    """Chat messages for a plan: the shared system prompt first, request data last."""
+    return [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': prompt},
+    ]
+
+
+def plan_max_tokens(params):
+    """
+    Completion budget for a trip: PLAN_MAX_TOKENS_BASE plus
+    PLAN_MAX_TOKENS_PER_DAY for each day, within PLAN_MAX_TOKENS_MIN and
+    PLAN_MAX_TOKENS_MAX.
+    """
+    budget = settings.PLAN_MAX_TOKENS_BASE + settings.PLAN_MAX_TOKENS_PER_DAY * trip_days(params)
+    return max(settings.PLAN_MAX_TOKENS_MIN, min(budget, settings.PLAN_MAX_TOKENS_MAX))
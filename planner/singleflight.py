@@ -0,0 +1,167 @@
+"""
+Request coalescing ("single-flight") for expensive upstream work.
+
+Concurrent callers asking for the same key wait on one in-flight computation
+and share its result instead of each starting their own OpenAI call or
+geocode. Within a process this works across threads (and, for the async views,
+across tasks on an event loop). Across workers it can optionally take a lock
+in the shared Django cache: workers that lose the race poll the result cache
+until the winner has stored its result.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+
+from django.core.cache import caches
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent computations by key.
+
+    `do(key, fn, lookup=None)` runs `fn()` once per key at a time; callers that
+    arrive while it is running block until it finishes and get the same result
+    (or exception). With `shared_lock=True` and a `lookup` callable returning a
+    (found, value) tuple from a shared result cache, the leader also takes a
+    lock in the Django cache so that only one worker computes the key.
+    """
+
+    def __init__(self, name, shared_lock=False, lock_timeout=60, poll_interval=0.2, alias='default'):
+        self.name = name
+        self.shared_lock = shared_lock
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.alias = alias
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._async_calls = weakref.WeakKeyDictionary()
+        self._stats = {'leaders': 0, 'followers': 0}
+
+    def do(self, key, fn, lookup=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats['leaders' if leader else 'followers'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_with_shared_lock(key, fn, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, coro_fn, lookup=None):
+        """
+        Async version of do(); `coro_fn` and `lookup` are coroutine functions.
+        The computation runs as its own task: a caller that is cancelled (say,
+        at its request's deadline) stops waiting without cancelling it for the
+        others, and it is only cancelled once every caller has gone.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.setdefault(loop, {})
+        call = calls.get(key)
+        if call is None:
+            self._stats['leaders'] += 1
+            call = calls[key] = _AsyncCall(loop.create_task(self._arun_with_shared_lock(key, coro_fn, lookup)))
+            call.task.add_done_callback(lambda task: self._forget(calls, key, call))
+        else:
+            self._stats['followers'] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(calls, key, call)
+                call.task.cancel()
+
+    @staticmethod
+    def _forget(calls, key, call):
+        if calls.get(key) is call:
+            del calls[key]
+        if call.task.done() and not call.task.cancelled():
+            # Mark the exception as retrieved when nobody else was waiting
+            call.task.exception()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+    def _lock_key(self, key):
+        digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+        return f'planner:singleflight:{self.name}:{digest}'
+
+    def _run_with_shared_lock(self, key, fn, lookup):
+        if not (self.shared_lock and lookup):
+            return fn()
+
+        backend = caches[self.alias]
+        lock_key = self._lock_key(key)
+        deadline = time.monotonic() + self.lock_timeout
+        # Another worker holds the lock: wait for its result to show up
+        while not backend.add(lock_key, 1, self.lock_timeout):
+            found, value = lookup()
+            if found:
+                return value
+            if time.monotonic() >= deadline:
+                # The other worker is taking too long; compute it ourselves
+                return fn()
+            time.sleep(self.poll_interval)
+
+        try:
+            found, value = lookup()
+            return value if found else fn()
+        finally:
+            backend.delete(lock_key)
+
+    async def _arun_with_shared_lock(self, key, coro_fn, lookup):
+        if not (self.shared_lock and lookup):
+            return await coro_fn()
+
+        backend = caches[self.alias]
+        lock_key = self._lock_key(key)
+        deadline = time.monotonic() + self.lock_timeout
+        while not await backend.aadd(lock_key, 1, self.lock_timeout):
+            found, value = await lookup()
+            if found:
+                return value
+            if time.monotonic() >= deadline:
+                return await coro_fn()
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            found, value = await lookup()
+            return value if found else await coro_fn()
+        finally:
+            await backend.adelete(lock_key)
@@ -0,0 +1,170 @@
+"""
+Helpers for streaming trip plans as Server-Sent Events.
+"""
+
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIRequest
+
+from .poi_tags import iter_poi_tags
+
+# A '<poi' that hasn't closed within this many characters is treated as plain text
+MAX_PENDING_TAG_LENGTH = 1000
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def response_stream(request, iterable):
+    """
+    Content for a StreamingHttpResponse that sends each item as soon as it is
+    produced: `iterable` itself under WSGI, an async iterator over it under
+    ASGI. Django serves a sync iterator under ASGI by reading it into a list
+    first, which would hold the whole stream back until its last item.
+    """
+    if isinstance(request, ASGIRequest):
+        return iterate_in_thread(iterable)
+    return iterable
+
+
+async def iterate_in_thread(iterable):
+    """
+    Async iterator over a sync iterable, advanced one item at a time on a
+    thread of its own so the event loop isn't blocked. All items come from the
+    same thread, so generators that rely on thread-local state (such as
+    translation.override) keep working; context variables are carried over.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream')
+    context = contextvars.copy_context()
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, context.run, next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await loop.run_in_executor(executor, context.run, close)
+        executor.shutdown(wait=False)
+
+
+class IncrementalPoiParser:
+    """
+    Finds POI tags in plan text as it arrives chunk by chunk.
+
+    Each complete tag is assigned the next POI ID and rewritten to include it,
+    the same way extract_pois_from_plan does for a finished plan; both use
+    iter_poi_tags, so attributes may come in any order and the icon may be
+    missing. Only text that may still turn into a tag is kept in the pending
+    buffer, so every chunk is scanned once.
+    """
+
+    def __init__(self, fallback_icon):
+        self.fallback_icon = fallback_icon
+        self.next_id = 1
+        self.pois = []
+        self._ids_by_name = {}
+        self._parts = []
+        self._raw = []
+        self._pending = ''
+        self._pending_offset = 0
+        self._line_index = 0
+        self._spans = {}
+
+    def feed(self, text):
+        """Consume a chunk of text and return the new unique POIs it completed."""
+        self._raw.append(text)
+        pending = self._pending + text
+        new_pois = []
+        last = 0
+
+        for start, end, attributes, poi_text, _line_index in iter_poi_tags(pending):
+            poi_type = attributes['type']
+            poi_name = attributes['name']
+            poi_icon = attributes.get('icon') or self.fallback_icon(poi_name, poi_type)
+
+            # Duplicate names are tagged with the first POI's ID and aren't reported again
+            poi_id = self._ids_by_name.get(poi_name.lower())
+            is_new = poi_id is None
+            if is_new:
+                poi_id = self._ids_by_name[poi_name.lower()] = self.next_id
+                self.next_id += 1
+
+            self._flush(pending[last:start])
+            self._parts.append(f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>')
+            line_index = self._line_index
+            self._line_index += poi_text.count('\n')
+
+            if is_new:
+                poi = {
+                    'id': poi_id,
+                    'name': poi_name,
+                    'type': poi_type,
+                    'keyword': poi_text,
+                    'line': poi_text,
+                    'line_index': line_index,
+                    'context': poi_text,
+                    'icon': poi_icon,
+                    'coordinates': None
+                }
+                self.pois.append(poi)
+                new_pois.append(poi)
+                self._spans[poi_id] = (self._pending_offset + start, self._pending_offset + end)
+
+            last = end
+
+        pending = pending[last:]
+        keep_from = self._tag_start(pending)
+        self._flush(pending[:keep_from])
+        self._pending_offset += last + keep_from
+        self._pending = pending[keep_from:]
+        return new_pois
+
+    def finish(self):
+        """
+        Flush any remaining text and return (pois, modified_plan).
+        POI line and context fields are filled in from the complete plan.
+        """
+        self._flush(self._pending)
+        self._pending = ''
+        modified_plan = ''.join(self._parts).strip()
+
+        # Line indices refer to the stripped plan, like extract_pois_from_plan
+        raw = ''.join(self._raw)
+        stripped = raw.strip()
+        leading = len(raw) - len(raw.lstrip())
+        leading_lines = raw[:leading].count('\n')
+        for poi in self.pois:
+            start, end = self._spans[poi['id']]
+            poi['line_index'] -= leading_lines
+            # The lines the tag is on, as parse_pois_from_plan takes them
+            line_start = stripped.rfind('\n', 0, start - leading) + 1
+            line_end = stripped.find('\n', end - leading)
+            poi['line'] = poi['context'] = stripped[line_start:line_end if line_end != -1 else len(stripped)]
+        return self.pois, modified_plan
+
+    def _flush(self, text):
+        if text:
+            self._parts.append(text)
+            self._line_index += text.count('\n')
+
+    @staticmethod
+    def _tag_start(pending):
+        """Index from which `pending` may still be part of an unfinished tag."""
+        start = pending.rfind('<poi')
+        if start != -1 and len(pending) - start <= MAX_PENDING_TAG_LENGTH:
+            return start
+        # A chunk may end in the middle of '<poi'
+        for prefix in ('<po', '<p', '<'):
+            if pending.endswith(prefix):
+                return len(pending) - len(prefix)
+        return len(pending)
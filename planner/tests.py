@@ -1,3 +1,1187 @@
-from django.test import TestCase
+import asyncio
+import collections
+import gzip
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+import requests
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from trip_planner.assets import AssetRegistry
+from trip_planner.views import static_asset_serve
+
+from . import metrics, views
+from .admission import AdmissionRejected, SharedTokenBucket, TokenBucket, UpstreamLimiter
+from .async_views import AsyncTripPlanView
+from .cache import TwoTierCache
+from .circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from .geocoding import AsyncGoogleGeocodingClient, GoogleGeocodingClient
+from .jobs import JOB_FAILED, JOB_SUCCEEDED, JobQueue
+from .middleware import PlanRequestLimitMiddleware, in_flight
+from .models import Place, Plan
+from .prompts import day_chunks
+from .singleflight import SingleFlight
+from .streaming import IncrementalPoiParser, response_stream
+from .views import (
+    PlanError,
+    TripPlanView,
+    geocode_with_google_maps,
+    get_fallback_icon,
+    mark_coordinates_pending,
+    openai_call,
+    parse_pois_from_plan,
+    run_plan_batch,
+    store_plan,
+    validate_plan_params,
+)
+
+
+class FakeClock:
+    """Stands in for the `time` module of the code under test."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def wait_until(condition, timeout=5):
+    """Spin until `condition()` is true; fail the test if it takes longer than `timeout` seconds."""
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        event.wait(0.01)
+    raise AssertionError('condition not reached')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, flight, fn, followers=3):
+        """Call flight.do('key', fn) from a leader and `followers` threads; return each outcome."""
+        outcomes = [None] * (followers + 1)
+
+        def call(index):
+            try:
+                outcomes[index] = ('result', flight.do('key', fn))
+            except Exception as e:
+                outcomes[index] = ('error', e)
+
+        leader = threading.Thread(target=call, args=(0,))
+        leader.start()
+        wait_until(lambda: flight.stats()['in_flight'] == 1)
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(1, followers + 1)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight.stats()['followers'] == followers)
+        return leader, threads, outcomes
+
+    def test_followers_share_the_leaders_result(self):
+        flight = SingleFlight('test')
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'plan': 'text'}
+
+        leader, threads, outcomes = self.run_concurrently(flight, compute)
+        release.set()
+        for thread in [leader, *threads]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [('result', {'plan': 'text'})] * 4)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_followers_share_the_leaders_error(self):
+        flight = SingleFlight('test')
+        release = threading.Event()
+        error = PlanError('Upstream failed', 'OPENAI_ERROR')
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            raise error
+
+        leader, threads, outcomes = self.run_concurrently(flight, compute)
+        release.set()
+        for thread in [leader, *threads]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [('error', error)] * 4)
+
+        # A failed call isn't remembered: the next caller computes again
+        self.assertEqual(flight.do('key', lambda: 'retried'), 'retried')
+
+    def test_async_followers_share_the_leaders_error(self):
+        flight = SingleFlight('test')
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise PlanError('Upstream failed', 'OPENAI_ERROR')
+
+        async def run():
+            return await asyncio.gather(*(flight.ado('key', compute) for _ in range(4)), return_exceptions=True)
+
+        results = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, PlanError) for result in results))
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = SingleFlight('test')
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'plan'
+
+        async def run():
+            leader = asyncio.ensure_future(flight.ado('key', compute))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.ado('key', compute))
+            await asyncio.sleep(0)
+            # The leader's request hit its deadline
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), 'plan')
+        self.assertEqual(len(calls), 1)
+
+    def test_computation_is_cancelled_when_every_caller_has_gone(self):
+        flight = SingleFlight('test')
+        cancelled = []
+
+        async def compute():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def run():
+            waiters = [asyncio.ensure_future(flight.ado('key', compute)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            await asyncio.sleep(0)
+            # A new caller starts a fresh computation
+            return await flight.ado('key', lambda: asyncio.sleep(0, 'again'))
+
+        self.assertEqual(asyncio.run(run()), 'again')
+        self.assertEqual(cancelled, [1])
+
+
+class PoiParserTests(SimpleTestCase):
+    PLAN = (
+        'Day 1\n'
+        '- <poi name="Louvre" type="museum">Louvre</poi> and <poi type="park" name="Tuileries" icon="🌳">gardens</poi>\n'
+        '- <poi icon="🗼" name="Eiffel Tower" type="attraction">Eiffel Tower</poi>\n'
+        'Day 2\n'
+        '- Back to <poi type="museum" name="louvre">the Louvre</poi>'
+    )
+
+    def stream(self, plan, chunk_size=7):
+        parser = IncrementalPoiParser(get_fallback_icon)
+        for start in range(0, len(plan), chunk_size):
+            parser.feed(plan[start:start + chunk_size])
+        return parser.finish()
+
+    def test_streaming_parser_matches_full_parser(self):
+        expected_pois, expected_plan = parse_pois_from_plan(self.PLAN)
+        pois, plan = self.stream(self.PLAN)
+
+        self.assertEqual(plan, expected_plan)
+        self.assertEqual([poi['name'] for poi in pois], ['Louvre', 'Tuileries', 'Eiffel Tower'])
+        self.assertEqual(pois, expected_pois)
+
+    def test_stray_poi_before_a_tag_is_left_as_text(self):
+        text = 'Use <poi tags. Visit <poi type="museum" name="Louvre">Louvre</poi> today'
+        expected = 'Use <poi tags. Visit <poi id="1" type="museum" name="Louvre" icon="🏛️">Louvre</poi> today'
+
+        pois, plan = parse_pois_from_plan(text)
+        self.assertEqual(plan, expected)
+        self.assertEqual(pois[0]['keyword'], 'Louvre')
+        for chunk_size in (1, 3, 16):
+            self.assertEqual(self.stream(text, chunk_size), (pois, plan))
+
+    def test_tag_text_across_lines(self):
+        text = 'A\n<poi type="park" name="P">Big\npark</poi> here\n<poi type="museum" name="M">M</poi>'
+        expected_pois, _plan = parse_pois_from_plan(text)
+
+        self.assertEqual([poi['line_index'] for poi in expected_pois], [1, 3])
+        self.assertEqual(self.stream(text, 5)[0], expected_pois)
+
+
+class JobQueueTests(TestCase):
+    def test_runs_job_and_stores_its_result(self):
+        queue = JobQueue('test', executor='sync')
+        job = queue.submit(lambda value: (200, {'value': value}), 3)
+
+        self.assertEqual(job['status'], JOB_SUCCEEDED)
+        self.assertEqual(queue.get(job['job_id'])['result'], {'value': 3})
+
+    def test_failed_job_reports_its_error(self):
+        queue = JobQueue('test', executor='sync')
+        job = queue.submit(lambda: (400, {'error_code': 'MISSING_DESTINATION'}))
+
+        self.assertEqual(job['status'], JOB_FAILED)
+        self.assertEqual(job['status_code'], 400)
+        self.assertEqual(job['error'], {'error_code': 'MISSING_DESTINATION'})
+
+    def test_unknown_and_expired_jobs_are_not_found(self):
+        job = JobQueue('test', executor='sync').submit(lambda: (200, {}))
+
+        self.assertIsNone(JobQueue('test').get('not-a-job-id'))
+        self.assertIsNone(JobQueue('test', ttl=-1).get(job['job_id']))
+
+    def test_body_that_is_not_an_object_is_rejected(self):
+        for body in ('[]', '"Paris"', '3'):
+            response = self.client.post(reverse('trip_plan_jobs'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error_code'], 'INVALID_JSON')
+
+    def test_unknown_job_status_is_404(self):
+        response = self.client.get(reverse('trip_plan_job', args=['0' * 32]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error_code'], 'JOB_NOT_FOUND')
+
+
+class ValidatePlanParamsTests(SimpleTestCase):
+    def params(self, start_date='2025-05-01', end_date='2025-05-03', **fields):
+        return {'destination': 'Paris', 'start_date': start_date, 'end_date': end_date, **fields}
+
+    def assertRejected(self, data, error_code):
+        with self.assertRaises(PlanError) as error:
+            validate_plan_params(data)
+        self.assertEqual((error.exception.status, error.exception.error_code), (400, error_code))
+
+    def test_normalizes_valid_params(self):
+        params = validate_plan_params(self.params(destination='  Paris ', language=None), 'fr-FR,fr;q=0.9')
+        self.assertEqual(
+            (params['destination'], params['start_date'], params['end_date'], params['language']),
+            ('Paris', '2025-05-01', '2025-05-03', 'fr')
+        )
+        self.assertEqual(validate_plan_params(self.params(language=''))['language'], 'en')
+
+    def test_rejects_dates_that_cannot_be_stored(self):
+        self.assertRejected(self.params(start_date='May 1 2025'), 'INVALID_START_DATE')
+        self.assertRejected(self.params(end_date=20250503), 'INVALID_END_DATE')
+        self.assertRejected(self.params('2025-05-03', '2025-05-01'), 'INVALID_DATE_RANGE')
+
+    def test_rejects_destination_and_language_that_cannot_be_stored(self):
+        self.assertRejected(self.params(destination='   '), 'MISSING_DESTINATION')
+        self.assertRejected(self.params(destination=['Paris']), 'INVALID_DESTINATION')
+        self.assertRejected(self.params(destination='x' * 256), 'INVALID_DESTINATION')
+        self.assertRejected(self.params(language='english-please'), 'INVALID_LANGUAGE')
+        self.assertRejected(self.params(language=['en']), 'INVALID_LANGUAGE')
+
+    @override_settings(PLAN_MAX_TRIP_DAYS=30)
+    def test_rejects_trips_longer_than_the_limit(self):
+        self.assertEqual(validate_plan_params(self.params('2025-05-01', '2025-05-30'))['end_date'], '2025-05-30')
+        self.assertRejected(self.params('2020-01-01', '2030-01-01'), 'TRIP_TOO_LONG')
+
+
+@override_settings(PLAN_STORE_ENABLED=True)
+class PlanDetailViewTests(TestCase):
+    def setUp(self):
+        pois, plan_text = parse_pois_from_plan(
+            'Day 1: <poi type="museum" name="Louvre">Louvre</poi>, <poi type="park" name="Tuileries">Tuileries</poi>'
+        )
+        pois[0]['coordinates'] = {'lat': 48.86, 'lon': 2.34}
+        params = validate_plan_params({'destination': 'Paris', 'start_date': '2025-05-01', 'end_date': '2025-05-02'})
+        self.payload = store_plan(params, {
+            'plan': plan_text,
+            'pois': pois,
+            'coordinates': {'lat': 48.85, 'lon': 2.35, 'formatted_address': 'Paris, France'},
+        })
+
+    def test_serves_a_stored_plan_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('plan_detail', args=[self.payload['plan_id']]))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['plan'], self.payload['plan'])
+        self.assertEqual([poi['name'] for poi in data['pois']], ['Louvre', 'Tuileries'])
+        self.assertEqual(data['pois'][0]['coordinates'], {'lat': 48.86, 'lon': 2.34})
+
+    def test_unknown_plan_is_404(self):
+        Plan.objects.all().delete()
+        response = self.client.get(reverse('plan_detail', args=[self.payload['plan_id']]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error_code'], 'PLAN_NOT_FOUND')
+
+
+class FakeOpenAI:
+    """
+    Chat completions client that answers with `content` and records how many
+    calls run at once. Streamed completions come in `chunk_size` pieces.
+    """
+
+    def __init__(self, delay=0.02, content='Day 1', chunk_size=8):
+        self.delay = delay
+        self.content = content
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if kwargs.get('stream'):
+            return FakeStream([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.content[start:start + self.chunk_size]))], usage=None)
+                for start in range(0, len(self.content), self.chunk_size)
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))], usage=None)
+
+
+class FakeStream(list):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+LOCATION = {'latitude': 48.85, 'longitude': 2.35, 'address': 'Paris, France', 'raw': {}}
+
+
+class ChunkedPlanTests(SimpleTestCase):
+    def test_chunk_count_is_capped(self):
+        params = {'start_date': '2025-05-01', 'end_date': '2025-05-30'}
+        self.assertEqual(len(day_chunks(params, 3)), 10)
+
+        chunks = day_chunks(params, 2, max_chunks=4)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual((chunks[0]['first_day'], chunks[-1]['last_day']), (1, 30))
+
+    @override_settings(
+        PLAN_CHUNKED_MIN_DAYS=6, PLAN_CHUNK_DAYS=2, PLAN_CHUNK_MAX_WORKERS=4,
+        PLAN_BATCH_CONCURRENCY=2, PLAN_STORE_ENABLED=False,
+    )
+    def test_batch_bounds_chunk_completions(self):
+        openai = FakeOpenAI()
+        items = [
+            {'destination': f'City {index}', 'start_date': '2025-05-01', 'end_date': '2025-05-08'}
+            for index in range(3)
+        ]
+        with mock.patch('planner.views.get_openai_client', return_value=openai), \
+                mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION):
+            results = list(run_plan_batch(items))
+
+        self.assertEqual([result['status'] for result in results], [200] * 3)
+        # An overview and four chunks per plan, never more than two at a time
+        self.assertEqual(openai.calls, 15)
+        self.assertEqual(openai.max_running, 2)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('planner.admission.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waits_for_refill_and_rejects_past_max_wait(self):
+        bucket = TokenBucket(limit=2, window=2)
+        self.assertEqual(bucket.reserve(2, max_wait=0)[0], 0)
+
+        wait, cancel = bucket.reserve(1, max_wait=5)
+        self.assertEqual(wait, 1)
+        self.assertIsNotNone(cancel)
+
+        # Two tokens are owed now; a third would have to wait 2s
+        wait, cancel = bucket.reserve(1, max_wait=1)
+        self.assertEqual(wait, 2)
+        self.assertIsNone(cancel)
+
+        self.clock.advance(3)
+        self.assertEqual(bucket.reserve(1, max_wait=0)[0], 0)
+
+    def test_rejected_call_refunds_the_buckets_it_already_reserved(self):
+        requests = TokenBucket(limit=10, window=60)
+        tokens = TokenBucket(limit=100, window=60)
+        limiter = UpstreamLimiter('openai', {'requests': requests, 'tokens': tokens}, max_wait=0)
+
+        limiter.acquire(requests=1, tokens=100)
+        self.assertEqual(requests.available(), 9)
+        self.assertEqual(tokens.available(), 0)
+
+        with self.assertRaises(AdmissionRejected) as rejected:
+            limiter.acquire(requests=1, tokens=50)
+        self.assertEqual(rejected.exception.upstream, 'openai')
+        self.assertGreater(rejected.exception.retry_after, 0)
+        # The request token taken before the tokens bucket refused is given back
+        self.assertEqual(requests.available(), 9)
+        self.assertEqual(tokens.available(), 0)
+
+    def test_shared_bucket_refunds_on_rejection(self):
+        cache.clear()
+        requests = SharedTokenBucket('test:requests', limit=5, window=60)
+        tokens = SharedTokenBucket('test:tokens', limit=10, window=60)
+        limiter = UpstreamLimiter('openai', {'requests': requests, 'tokens': tokens}, max_wait=0, shared=True)
+
+        limiter.acquire(requests=1, tokens=10)
+        with self.assertRaises(AdmissionRejected):
+            limiter.acquire(requests=1, tokens=1)
+
+        self.assertEqual(requests.available(), 4)
+        self.assertEqual(tokens.available(), 0)
+
+    @override_settings(PLAN_STORE_ENABLED=False)
+    def test_batch_item_reports_a_refused_destination_geocode(self):
+        items = [{'destination': 'Paris', 'start_date': '2025-05-01', 'end_date': '2025-05-02'}] * 2
+        with mock.patch('planner.views.geocode_with_google_maps', side_effect=AdmissionRejected('geocode', 2.5)):
+            results = list(run_plan_batch(items))
+
+        self.assertEqual(
+            [(result['index'], result['status'], result['error_code']) for result in results],
+            [(0, 503, 'GEOCODING_RATE_LIMITED'), (1, 503, 'GEOCODING_RATE_LIMITED')]
+        )
+
+
+@override_settings(
+    PLAN_LIMIT_PATHS=['/api/plan-trip/'],
+    PLAN_MAX_IN_FLIGHT=0,
+    PLAN_RATE_LIMIT_PER_IP=0,
+    PLAN_CONCURRENCY_PER_IP=1,
+    PLAN_API_KEYS=frozenset(),
+    CLIENT_IP_HEADER='',
+)
+class PlanRequestLimitMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.baseline = in_flight.count
+
+    def request(self):
+        return self.factory.post('/api/plan-trip/stream/', REMOTE_ADDR='203.0.113.7')
+
+    def test_json_response_releases_immediately(self):
+        middleware = PlanRequestLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.assertEqual(middleware(self.request()).status_code, 200)
+        self.assertEqual(middleware(self.request()).status_code, 200)
+        self.assertEqual(in_flight.count, self.baseline)
+
+    def test_streamed_response_holds_its_slot_until_sent(self):
+        middleware = PlanRequestLimitMiddleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+
+        response = middleware(self.request())
+        self.assertEqual(in_flight.count, self.baseline + 1)
+        self.assertEqual(middleware(self.request()).status_code, 429)
+
+        self.assertEqual(b''.join(response), b'ab')
+        self.assertEqual(in_flight.count, self.baseline)
+        self.assertEqual(b''.join(middleware(self.request())), b'ab')
+
+    def test_closed_stream_releases_its_slot(self):
+        middleware = PlanRequestLimitMiddleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+
+        response = middleware(self.request())
+        next(iter(response))
+        # The client went away; the server closes the response
+        response.close()
+
+        self.assertEqual(in_flight.count, self.baseline)
+        self.assertEqual(cache.get('planner:concurrency:ip:203.0.113.7'), 0)
+
+    @override_settings(PLAN_MAX_IN_FLIGHT=1, PLAN_CONCURRENCY_PER_IP=0)
+    def test_sheds_load_past_max_in_flight(self):
+        middleware = PlanRequestLimitMiddleware(lambda request: StreamingHttpResponse(iter([b'a'])))
+
+        response = middleware(self.request())
+        shed = middleware(self.request())
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed['Retry-After'], '5')
+
+        list(response)
+        self.assertEqual(b''.join(middleware(self.request())), b'a')
+        self.assertEqual(in_flight.count, self.baseline)
+
+    def test_async_streamed_response_holds_its_slot_until_sent(self):
+        async def content():
+            yield b'a'
+            yield b'b'
+
+        async def get_response(request):
+            return StreamingHttpResponse(content())
+
+        middleware = PlanRequestLimitMiddleware(get_response)
+
+        async def run():
+            response = await middleware(self.request())
+            self.assertEqual(in_flight.count, self.baseline + 1)
+            self.assertEqual((await middleware(self.request())).status_code, 429)
+
+            chunks = [chunk async for chunk in response]
+            self.assertEqual(b''.join(chunks), b'ab')
+            self.assertEqual(in_flight.count, self.baseline)
+
+            response = await middleware(self.request())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([chunk async for chunk in response], [b'a', b'b'])
+            self.assertEqual(in_flight.count, self.baseline)
+
+        asyncio.run(run())
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('planner.circuitbreaker.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('openai', failure_threshold=3, reset_timeout=30)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record(False)
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.breaker.before_call()
+        self.breaker.record(True)
+        self.fail(2)
+        self.assertEqual(self.breaker.snapshot()['state'], CLOSED)
+
+        self.fail(1)
+        self.assertEqual(self.breaker.snapshot()['state'], OPEN)
+        with self.assertRaises(CircuitOpen) as refused:
+            self.breaker.before_call()
+        self.assertEqual(refused.exception.retry_after, 30)
+
+    def test_half_open_trial_success_closes(self):
+        self.fail(3)
+        self.clock.advance(30)
+
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.snapshot()['state'], HALF_OPEN)
+        # Only one trial call at a time
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.snapshot()['state'], CLOSED)
+        self.breaker.before_call()
+
+    def test_half_open_trial_failure_reopens(self):
+        self.fail(3)
+        self.clock.advance(30)
+
+        self.breaker.before_call()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.snapshot()['state'], OPEN)
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+    def test_lost_trial_is_replaced_after_reset_timeout(self):
+        self.fail(3)
+        self.clock.advance(30)
+        self.breaker.before_call()
+
+        self.clock.advance(30)
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.snapshot()['state'], HALF_OPEN)
+
+    def test_zero_threshold_disables_the_breaker(self):
+        breaker = CircuitBreaker('geocode', failure_threshold=0)
+        for _ in range(10):
+            breaker.before_call()
+            breaker.record(False)
+        self.assertEqual(breaker.snapshot()['state'], CLOSED)
+
+    def test_released_trial_leaves_the_breaker_half_open(self):
+        self.fail(3)
+        self.clock.advance(30)
+
+        self.breaker.before_call()
+        self.breaker.release()
+        self.assertEqual(self.breaker.snapshot()['state'], HALF_OPEN)
+        # The next call may try again straight away
+        self.breaker.before_call()
+
+
+def http_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = 'https://maps.example/geocode'
+    response._content = json.dumps(body or {}).encode()
+    return response
+
+
+def openai_error(status_code):
+    response = httpx.Response(status_code, request=httpx.Request('POST', 'https://api.example/v1/chat/completions'))
+    return openai.APIStatusError('error', response=response, body=None)
+
+
+class BreakerFailureTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+
+    def geocode(self, response):
+        client = GoogleGeocodingClient('key', 'https://maps.example/geocode', max_retries=0, breaker=self.breaker)
+        with mock.patch.object(client.session, 'get', return_value=response), \
+                self.assertLogs('planner.geocoding', 'ERROR'):
+            return client.geocode('x' * 10000)
+
+    def test_rejected_geocode_requests_do_not_open_the_breaker(self):
+        for _ in range(3):
+            self.assertEqual(self.geocode(http_response(414)), (None, 'CLIENT_ERROR'))
+            self.assertEqual(self.geocode(http_response(200, {'status': 'INVALID_REQUEST'}))[1], 'INVALID_REQUEST')
+        self.assertEqual(self.breaker.snapshot()['state'], CLOSED)
+
+        for _ in range(2):
+            self.assertEqual(self.geocode(http_response(503)), (None, 'REQUEST_ERROR'))
+        self.assertEqual(self.breaker.snapshot()['state'], OPEN)
+
+    def test_rejected_openai_requests_do_not_open_the_breaker(self):
+        def call(error):
+            with self.assertRaises(type(error)), openai_call():
+                raise error
+
+        with mock.patch('planner.views.get_breaker', return_value=self.breaker):
+            for status_code in (400, 413, 400):
+                call(openai_error(status_code))
+            self.assertEqual(self.breaker.snapshot()['state'], CLOSED)
+
+            call(openai_error(429))
+            call(openai.APITimeoutError(request=httpx.Request('POST', 'https://api.example/')))
+        self.assertEqual(self.breaker.snapshot()['state'], OPEN)
+
+
+
+class StaticAssetTests(SimpleTestCase):
+    CONTENT = b'console.log("trip planner");\n' * 100
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        os.makedirs(os.path.join(root.name, 'js'))
+        with open(os.path.join(root.name, 'js', 'main.js'), 'wb') as f:
+            f.write(self.CONTENT)
+        registry = AssetRegistry(
+            root.name, aliases={}, fallback_dirs=(), content_types={}, cache_settings={}, asset_cache={},
+            max_file_size=1024 * 1024,
+        )
+        patcher = mock.patch('trip_planner.views.get_asset_registry', return_value=registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        return static_asset_serve(self.factory.get('/static/js/main.js', **headers), 'js/main.js')
+
+    def test_serves_a_compressed_variant_with_an_etag(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), self.CONTENT)
+
+        identity = self.get()
+        self.assertEqual(identity.content, self.CONTENT)
+        self.assertNotEqual(identity['ETag'], response['ETag'])
+
+    def test_matching_conditional_request_is_304(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING='gzip')['ETag']
+
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_registry_is_only_warmed_when_static_serving_is_routed(self):
+        # The ASGI module sets PLANNER_ASYNC_VIEWS in the environment
+        with mock.patch.dict(os.environ):
+            for name in ('trip_planner.wsgi', 'trip_planner.asgi'):
+                module = importlib.import_module(name)
+                with override_settings(DEBUG=False):
+                    importlib.reload(module)
+                with override_settings(DEBUG=True):
+                    importlib.reload(module)
+        from trip_planner.views import get_asset_registry
+        self.assertEqual(get_asset_registry.call_count, 2)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('planner.cache.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TwoTierCache('test', ttl=60, negative_ttl=10, max_entries=2)
+
+    def test_keys_are_normalized_and_negative_results_found(self):
+        self.cache.set('Paris,  France', {'lat': 1})
+        self.cache.set('Atlantis', None, negative=True)
+
+        self.assertEqual(self.cache.get(' paris, FRANCE'), (True, {'lat': 1}))
+        self.assertEqual(self.cache.get('atlantis'), (True, None))
+        self.assertEqual(self.cache.get('Rome'), (False, None))
+        self.assertEqual(self.cache.stats()['negative_hits'], 1)
+
+    def test_entries_expire_after_their_ttl(self):
+        with mock.patch.object(TwoTierCache, 'backend', new_callable=mock.PropertyMock) as backend:
+            backend.return_value.get.return_value = None
+            self.cache.set('Paris', {'lat': 1})
+            self.cache.set('Atlantis', None, negative=True)
+            self.assertEqual([call.args[2] for call in backend.return_value.set.call_args_list], [60, 10])
+
+            self.clock.advance(11)
+            self.cache.backend.get.side_effect = lambda key, default: default
+            self.assertEqual(self.cache.get('Paris'), (True, {'lat': 1}))
+            self.assertEqual(self.cache.get('Atlantis'), (False, None))
+
+            self.clock.advance(50)
+            self.assertEqual(self.cache.get('Paris'), (False, None))
+
+    def test_local_tier_evicts_least_recently_used(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        self.assertEqual(self.cache.stats()['local_entries'], 2)
+
+        self.cache.get('a')
+        self.assertEqual(self.cache.stats()['shared_hits'], 1)
+
+
+class GeocodeCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        views.geocode_cache.clear_local()
+        self.addCleanup(views.geocode_cache.clear_local)
+
+    def geocode_twice(self, outcome):
+        client = mock.Mock()
+        client.geocode.return_value = outcome
+        with mock.patch('planner.views.get_geocoding_client', return_value=client):
+            results = [geocode_with_google_maps('Paris'), geocode_with_google_maps('  PARIS ')]
+        return results, client.geocode.call_count
+
+    def test_results_are_cached(self):
+        self.assertEqual(self.geocode_twice((LOCATION, 'OK')), ([LOCATION, LOCATION], 1))
+
+    def test_zero_results_are_cached(self):
+        self.assertEqual(self.geocode_twice((None, 'ZERO_RESULTS')), ([None, None], 1))
+
+    def test_request_errors_are_not_cached(self):
+        self.assertEqual(self.geocode_twice((None, 'REQUEST_ERROR')), ([None, None], 2))
+
+
+GEOCODE_OK = {
+    'status': 'OK',
+    'results': [{'formatted_address': 'Paris, France', 'geometry': {'location': {'lat': 48.85, 'lng': 2.35}}}],
+}
+
+
+class GeocodingRetryTests(SimpleTestCase):
+    def test_over_query_limit_is_retried_with_backoff(self):
+        client = GoogleGeocodingClient('key', 'https://maps.example/geocode', max_retries=2, backoff_factor=0.5)
+        responses = [http_response(200, {'status': 'OVER_QUERY_LIMIT'})] * 2 + [http_response(200, GEOCODE_OK)]
+        with mock.patch.object(client.session, 'get', side_effect=responses) as get, \
+                mock.patch('planner.geocoding.time.sleep') as sleep, \
+                self.assertLogs('planner.geocoding', 'WARNING'):
+            result, status = client.geocode('Paris')
+
+        self.assertEqual((status, result['address']), ('OK', 'Paris, France'))
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1.0])
+
+    def test_server_errors_are_retried_by_the_session(self):
+        client = GoogleGeocodingClient('key', 'https://maps.example/geocode', max_retries=3)
+        retry = client.session.get_adapter('https://maps.example/').max_retries
+
+        self.assertEqual(retry.status, 3)
+        self.assertIn(503, retry.status_forcelist)
+        # A timed-out read may have reached Google; it isn't repeated
+        self.assertEqual(retry.read, 0)
+
+    def test_async_client_retries_server_errors(self):
+        statuses = [503, 502, 200]
+
+        def handler(request):
+            status = statuses.pop(0)
+            return httpx.Response(status, json=GEOCODE_OK if status == 200 else {})
+
+        async def run():
+            client = AsyncGoogleGeocodingClient('key', 'https://maps.example/geocode', max_retries=2, backoff_factor=0)
+            client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                with self.assertLogs('planner.geocoding', 'WARNING'):
+                    return await client.geocode('Paris')
+            finally:
+                await client.aclose()
+
+        result, status = asyncio.run(run())
+        self.assertEqual((status, result['latitude']), ('OK', 48.85))
+        self.assertEqual(statuses, [])
+
+
+def parse_sse(content):
+    """(event, data) pairs from a Server-Sent Events body."""
+    events = []
+    for block in content.decode().strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+PLAN_TEXT = (
+    'Day 1: the <poi type="museum" name="Louvre">Louvre</poi>\n'
+    'Day 2: <poi type="park" name="Tuileries">Tuileries garden</poi>'
+)
+PLAN_REQUEST = {'destination': 'Paris', 'start_date': '2025-05-01', 'end_date': '2025-05-02'}
+
+
+@override_settings(PLAN_CACHE_ENABLED=False, PLAN_STORE_ENABLED=False, GAZETTEER_ENABLED=False)
+class TripPlanStreamViewTests(TestCase):
+    def post(self, body):
+        return self.client.post(reverse('trip_plan_stream'), json.dumps(body), content_type='application/json')
+
+    def test_streams_tokens_and_pois_before_the_finished_plan(self):
+        openai = FakeOpenAI(delay=0, content=PLAN_TEXT)
+        with mock.patch('planner.views.get_openai_client', return_value=openai), \
+                mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION):
+            response = self.post(PLAN_REQUEST)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = parse_sse(b''.join(response.streaming_content))
+
+        names = [event for event, _data in events]
+        self.assertEqual((names[0], names[-1]), ('meta', 'done'))
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'token'), PLAN_TEXT)
+        # Each POI is sent when its tag completes and again once geocoded
+        pois = [data for event, data in events if event == 'poi']
+        self.assertLess(names.index('poi'), len(names) - 1 - names[::-1].index('token'))
+        self.assertEqual({poi['name'] for poi in pois}, {'Louvre', 'Tuileries'})
+
+        done = events[-1][1]
+        self.assertEqual([poi['coordinates'] for poi in done['pois']], [{'lat': 48.85, 'lon': 2.35}] * 2)
+        self.assertEqual(done['plan'], parse_pois_from_plan(PLAN_TEXT)[1])
+
+    def test_invalid_request_is_a_json_error(self):
+        response = self.post({'destination': 'Paris'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error_code'], 'MISSING_START_DATE')
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """FakeOpenAI for the AsyncOpenAI client."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.acreate))
+
+    async def acreate(self, **kwargs):
+        return self.create(**kwargs)
+
+
+@override_settings(PLAN_CACHE_ENABLED=False, PLAN_STORE_ENABLED=False, GAZETTEER_ENABLED=False)
+class AsyncTripPlanViewTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        views.geocode_cache.clear_local()
+        self.addCleanup(views.geocode_cache.clear_local)
+        self.factory = AsyncRequestFactory()
+
+    async def test_plans_a_trip_without_blocking_the_event_loop(self):
+        geocoder = mock.Mock()
+        geocoder.geocode = mock.AsyncMock(return_value=(LOCATION, 'OK'))
+        request = self.factory.post('/api/plan-trip/', json.dumps(PLAN_REQUEST), content_type='application/json')
+        with mock.patch('planner.async_views.get_async_openai_client', return_value=FakeAsyncOpenAI(content=PLAN_TEXT)), \
+                mock.patch('planner.async_views.get_async_geocoding_client', return_value=geocoder):
+            response = await AsyncTripPlanView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['plan'], parse_pois_from_plan(PLAN_TEXT)[1])
+        self.assertEqual([poi['coordinates'] for poi in data['pois']], [{'lat': 48.85, 'lon': 2.35}] * 2)
+        # The destination and both POIs
+        self.assertEqual(geocoder.geocode.await_count, 3)
+
+    async def test_invalid_request_is_a_json_error(self):
+        request = self.factory.post('/api/plan-trip/', '[]', content_type='application/json')
+        response = await AsyncTripPlanView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['error_code'], 'INVALID_JSON')
+
+    async def test_asgi_responses_stream_from_a_thread(self):
+        closed = []
+        caller = threading.get_ident()
+
+        def events():
+            try:
+                for index in range(3):
+                    yield (index, threading.get_ident())
+            finally:
+                closed.append(threading.get_ident())
+
+        stream = response_stream(self.factory.get('/'), events())
+        items = [item async for item in stream]
+
+        self.assertEqual([index for index, _thread in items], [0, 1, 2])
+        threads = {thread for _index, thread in items} | set(closed)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads, {caller})
+
+        wsgi_events = events()
+        self.assertIs(response_stream(RequestFactory().get('/'), wsgi_events), wsgi_events)
+
+
+@override_settings(PLAN_CACHE_ENABLED=True, PLAN_STORE_ENABLED=False, GAZETTEER_ENABLED=False)
+class PlanCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        for two_tier in (views.plan_cache, views.geocode_cache):
+            two_tier.clear_local()
+            self.addCleanup(two_tier.clear_local)
+        self.openai = FakeOpenAI(delay=0, content=PLAN_TEXT)
+        for target, value in (('get_openai_client', self.openai), ('geocode_with_google_maps', LOCATION)):
+            patcher = mock.patch(f'planner.views.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, **fields):
+        body = json.dumps(dict(PLAN_REQUEST, **fields))
+        return TripPlanView.as_view()(RequestFactory().post('/api/plan-trip/', body, content_type='application/json'))
+
+    def test_identical_request_is_served_from_the_cache(self):
+        first = self.post()
+        second = self.post(destination='  PARIS ')
+
+        self.assertEqual((first['X-Plan-Cache'], second['X-Plan-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(json.loads(second.content)['cached'], True)
+        self.assertEqual(json.loads(first.content)['plan'], json.loads(second.content)['plan'])
+        self.assertEqual(self.openai.calls, 1)
+
+    def test_other_dates_or_language_miss(self):
+        self.post()
+        self.assertEqual(self.post(end_date='2025-05-03')['X-Plan-Cache'], 'MISS')
+        self.assertEqual(self.post(language='fr')['X-Plan-Cache'], 'MISS')
+        self.assertEqual(self.openai.calls, 3)
+
+    @override_settings(PLAN_CACHE_ENABLED=False)
+    def test_disabled_cache_is_not_reported(self):
+        self.assertFalse(self.post().has_header('X-Plan-Cache'))
+        self.post()
+        self.assertEqual(self.openai.calls, 2)
+
+
+@override_settings(PLAN_CACHE_ENABLED=False, PLAN_STORE_ENABLED=False, GAZETTEER_ENABLED=False)
+class TripPlanBatchViewTests(TestCase):
+    def setUp(self):
+        views.geocode_cache.clear_local()
+        self.addCleanup(views.geocode_cache.clear_local)
+
+    def post(self, body):
+        return self.client.post(reverse('trip_plan_batch'), json.dumps(body), content_type='application/json')
+
+    def test_streams_one_line_per_request(self):
+        openai = FakeOpenAI(delay=0, content=PLAN_TEXT)
+        items = [PLAN_REQUEST, {'destination': 'Paris'}, dict(PLAN_REQUEST, destination='paris ')]
+        with mock.patch('planner.views.get_openai_client', return_value=openai), \
+                mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION):
+            response = self.post({'requests': items})
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        results = {line['index']: line for line in lines}
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual((results[1]['status'], results[1]['error_code']), (400, 'MISSING_START_DATE'))
+        for index in (0, 2):
+            self.assertEqual(results[index]['status'], 200)
+            self.assertEqual(results[index]['result']['plan'], parse_pois_from_plan(PLAN_TEXT)[1])
+        # The two identical requests are planned once
+        self.assertEqual(openai.calls, 1)
+
+    def test_rejects_a_missing_or_oversized_batch(self):
+        self.assertEqual(self.post({'requests': []}).json()['error_code'], 'MISSING_REQUESTS')
+        self.assertEqual(self.post([PLAN_REQUEST]).json()['error_code'], 'MISSING_REQUESTS')
+        with self.settings(PLAN_BATCH_MAX_REQUESTS=1):
+            response = self.post({'requests': [PLAN_REQUEST, PLAN_REQUEST]})
+        self.assertEqual((response.status_code, response.json()['error_code']), (400, 'BATCH_TOO_LARGE'))
+
+
+@override_settings(PLAN_STORE_ENABLED=True, GAZETTEER_ENABLED=False)
+class POICoordinatesViewTests(TestCase):
+    def setUp(self):
+        pois, plan_text = parse_pois_from_plan(PLAN_TEXT)
+        mark_coordinates_pending(pois)
+        params = validate_plan_params(dict(PLAN_REQUEST, defer_geocoding=True))
+        self.payload = store_plan(params, {
+            'plan': plan_text,
+            'pois': pois,
+            'coordinates': {'lat': 48.85, 'lon': 2.35, 'formatted_address': 'Paris, France'},
+        })
+        patcher = mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION)
+        self.geocode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body):
+        return self.client.post(reverse('poi_coordinates'), json.dumps(body), content_type='application/json')
+
+    def test_geocodes_each_unique_name_once(self):
+        response = self.post({'destination': 'Paris', 'names': ['Louvre', 'louvre', 'Tuileries']})
+
+        self.assertEqual(response.status_code, 200)
+        pois = response.json()['pois']
+        self.assertEqual([poi['name'] for poi in pois], ['Louvre', 'louvre', 'Tuileries'])
+        self.assertEqual([poi['coordinates'] for poi in pois], [{'lat': 48.85, 'lon': 2.35}] * 3)
+        self.assertEqual(self.geocode.call_count, 2)
+
+    def test_resolves_and_saves_the_pois_of_a_stored_plan(self):
+        response = self.post({'plan_id': self.payload['plan_id'], 'ids': [self.payload['pois'][0]['id']]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([poi['name'] for poi in response.json()['pois']], ['Louvre'])
+        stored = self.client.get(reverse('plan_detail', args=[self.payload['plan_id']])).json()
+        self.assertEqual([poi['coordinates'] for poi in stored['pois']], [{'lat': 48.85, 'lon': 2.35}, None])
+
+    def test_rejects_invalid_pois(self):
+        self.assertEqual(self.post({'names': 'Louvre'}).json()['error_code'], 'MISSING_POIS')
+        self.assertEqual(self.post({'pois': [{'id': 1}]}).json()['error_code'], 'MISSING_POI_NAME')
+        response = self.post({'plan_id': self.payload['plan_id'], 'ids': ['1', True]})
+        self.assertEqual((response.status_code, response.json()['error_code']), (400, 'INVALID_POI_IDS'))
+        self.geocode.assert_not_called()
+
+
+@override_settings(GAZETTEER_ENABLED=True)
+class GazetteerTests(TestCase):
+    def test_known_places_are_not_geocoded_again(self):
+        with mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION) as geocode:
+            views.geocode_pois([{'name': 'Louvre', 'coordinates': None}], 'Paris')
+            pois = [{'name': ' LOUVRE', 'coordinates': None}, {'name': 'Tuileries', 'coordinates': None}]
+            with self.assertNumQueries(2):
+                views.geocode_pois(pois, 'paris')
+
+        self.assertEqual([poi['coordinates'] for poi in pois], [{'lat': 48.85, 'lon': 2.35}] * 2)
+        self.assertEqual([call.args[0] for call in geocode.call_args_list], ['Louvre, Paris', 'Tuileries, paris'])
+        # Known per destination
+        self.assertEqual(Place.objects.lookup(['Louvre'], 'Lyon'), {})
+
+    def test_nearby_places_nearest_first(self):
+        Place.objects.remember([('Louvre', {'lat': 48.8606, 'lon': 2.3376}), ('Notre-Dame', {'lat': 48.853, 'lon': 2.3499}),
+                                ('Versailles', {'lat': 48.8049, 'lon': 2.1204})], 'Paris')
+
+        places = Place.objects.nearby(48.8584, 2.3376, radius_km=2)
+        self.assertEqual([place.name for place in places], ['Louvre', 'Notre-Dame'])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_registry_renders_prometheus_text(self):
+        registry = metrics.MetricsRegistry(buckets=(0.1, 1))
+        registry.inc('planner_pois_total', 3, 'POIs', endpoint='plan')
+        registry.observe('planner_stage_seconds', 0.5, 'Stages', stage='openai')
+
+        self.assertEqual(registry.render([('planner_in_flight', 'In flight', {}, 2)]).splitlines(), [
+            '# HELP planner_pois_total POIs',
+            '# TYPE planner_pois_total counter',
+            'planner_pois_total{endpoint="plan"} 3',
+            '# HELP planner_stage_seconds Stages',
+            '# TYPE planner_stage_seconds histogram',
+            'planner_stage_seconds_bucket{stage="openai",le="0.1"} 0',
+            'planner_stage_seconds_bucket{stage="openai",le="1"} 1',
+            'planner_stage_seconds_bucket{stage="openai",le="+Inf"} 1',
+            'planner_stage_seconds_sum{stage="openai"} 0.5',
+            'planner_stage_seconds_count{stage="openai"} 1',
+            '# HELP planner_in_flight In flight',
+            '# TYPE planner_in_flight gauge',
+            'planner_in_flight 2',
+        ])
+
+    @override_settings(PLAN_CACHE_ENABLED=False, PLAN_STORE_ENABLED=False, GAZETTEER_ENABLED=False)
+    def test_plan_requests_report_stage_timings(self):
+        request = RequestFactory().post('/api/plan-trip/', json.dumps(PLAN_REQUEST), content_type='application/json')
+        with mock.patch('planner.views.get_openai_client', return_value=FakeOpenAI(delay=0, content=PLAN_TEXT)), \
+                mock.patch('planner.views.geocode_with_google_maps', return_value=LOCATION):
+            response = TripPlanView.as_view()(request)
+
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages[-1], 'total')
+        self.assertTrue({'geocode_destination', 'openai', 'parse_pois', 'geocode_pois'} <= set(stages))
+
+        scrape = self.client.get(reverse('metrics'))
+        self.assertTrue(scrape['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = scrape.content.decode().splitlines()
+        self.assertIn('planner_plan_requests_in_flight 0', lines)
+        self.assertTrue(any(line.startswith('planner_request_seconds_count{endpoint="plan_trip"}') for line in lines))
+        self.assertTrue(any(line.startswith('planner_upstream_requests_total{outcome="ok",upstream="openai"}') for line in lines))
+
+
+class HealthProbeTests(TestCase):
+    def setUp(self):
+        windows = collections.defaultdict(metrics.RollingWindow)
+        patcher = mock.patch.object(metrics, 'upstream_windows', windows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_liveness(self):
+        response = self.client.get(reverse('liveness'))
+        self.assertEqual((response.status_code, response.json()), (200, {'status': 'alive'}))
+
+    def test_ready_when_every_check_passes(self):
+        metrics.upstream_windows['openai'].add(1.0, False)
+        response = self.client.get(reverse('readiness'))
+
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()['checks']
+        self.assertEqual(set(checks), {'database', 'cache', 'geocode', 'openai'})
+        # Too few calls to judge the upstream
+        self.assertEqual((checks['openai']['ok'], checks['openai']['calls']), (True, 1))
+
+    @override_settings(READINESS_MIN_CALLS=4, READINESS_MAX_ERROR_RATE=0.5)
+    def test_failing_upstream_is_unavailable(self):
+        for ok in (True, False, False, False):
+            metrics.upstream_windows['geocode'].add(0.1, ok)
+        response = self.client.get(reverse('readiness'))
+
+        self.assertEqual(response.status_code, 503)
+        data = response.json()
+        self.assertEqual(data['status'], 'unavailable')
+        self.assertEqual((data['checks']['geocode']['ok'], data['checks']['geocode']['error_rate']), (False, 0.75))
+        self.assertTrue(data['checks']['openai']['ok'])
+
+    def test_database_failure_is_unavailable(self):
+        with mock.patch('trip_planner.views.connection') as connection:
+            connection.cursor.side_effect = DatabaseError('connection refused')
+            response = self.client.get(reverse('readiness'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database'], {'ok': False, 'error': 'connection refused'})
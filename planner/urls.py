@@ -1,6 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from .views import TripPlanView
+from .async_views import AsyncTripPlanJobStatusView, AsyncTripPlanView
+from .views import (
+    TripPlanView,
+    TripPlanStreamView,
+    TripPlanBatchView,
+    TripPlanJobView,
+    TripPlanJobStatusView,
+    POICoordinatesView,
+    PlanDetailView,
+)
+
+# ASGI deployments serve the async pipeline; WSGI workers keep the sync view
+plan_trip_view = AsyncTripPlanView if settings.PLANNER_ASYNC_VIEWS else TripPlanView
+job_status_view = AsyncTripPlanJobStatusView if settings.PLANNER_ASYNC_VIEWS else TripPlanJobStatusView
 
 urlpatterns = [
-    path('plan-trip/', TripPlanView.as_view(), name='trip_plan'),
+    path('plan-trip/', plan_trip_view.as_view(), name='trip_plan'),
+    path('plan-trip/stream/', TripPlanStreamView.as_view(), name='trip_plan_stream'),
+    path('plan-trip/batch/', TripPlanBatchView.as_view(), name='trip_plan_batch'),
+    path('plan-trip/jobs/', TripPlanJobView.as_view(), name='trip_plan_jobs'),
+    path('plan-trip/jobs/<str:job_id>/', job_status_view.as_view(), name='trip_plan_job'),
+    path('plans/<uuid:plan_id>/', PlanDetailView.as_view(), name='plan_detail'),
+    path('pois/coordinates/', POICoordinatesView.as_view(), name='poi_coordinates'),
 ] 
\ No newline at end of file
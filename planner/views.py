@@ -1,348 +1,1190 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views import View
+from django.urls import reverse
 from django.utils.decorators import method_decorator
+from django.utils import translation
 from django.utils.translation import gettext as _
 from django.conf import settings
-from openai import OpenAI
-import os
-import requests
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+import contextvars
 import json
 import logging
-import re
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from .admission import AdmissionRejected, get_limiter
+from .cache import TwoTierCache, normalize_cache_key
+from .circuitbreaker import CircuitOpen, get_breaker
+from .geocoding import get_geocoding_client
+from . import metrics
+from .jobs import plan_jobs
+from .models import POI, Place, Plan, Trip
+from .icons import DEFAULT_POI_ICON, POI_ICON_KEYWORDS, POI_TYPE_ICONS, KeywordIconMatcher
+from .openai_client import get_openai_client, is_upstream_failure
+from .poi_tags import iter_poi_tags
+from .prompts import (
+    build_chunk_prompt, build_overview_prompt, build_trip_prompt, day_chunks, plan_max_tokens, plan_messages,
+    trip_days,
+)
+from .singleflight import SingleFlight
+from .streaming import IncrementalPoiParser, response_stream, sse_event
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Define Google Maps API key at module level
-GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', 'YOUR_GOOGLE_MAPS_API_KEY')
+# Geocoding results cache (in-process LRU in front of the shared Django cache)
+geocode_cache = TwoTierCache(
+    'geocode',
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_CACHE_NEGATIVE_TTL,
+    max_entries=settings.GEOCODE_CACHE_LOCAL_MAX_ENTRIES,
+    alias=settings.GEOCODE_CACHE_ALIAS,
+)
 
-def geocode_with_google_maps(destination):
+# Keyword -> icon matcher, compiled once; POI_ICON_EXTRA_KEYWORDS adds keywords
+# (e.g. for other languages) after the built-in ones
+poi_icon_matcher = KeywordIconMatcher({**POI_ICON_KEYWORDS, **settings.POI_ICON_EXTRA_KEYWORDS})
+
+# Opt-in cache of complete plan responses, keyed on the normalized request
+plan_cache = TwoTierCache(
+    'plan',
+    ttl=settings.PLAN_CACHE_TTL,
+    max_entries=settings.PLAN_CACHE_MAX_ENTRIES,
+    alias=settings.PLAN_CACHE_ALIAS,
+)
+
+# Coalesce concurrent identical geocodes and plan requests
+geocode_flight = SingleFlight(
+    'geocode',
+    shared_lock=settings.GEOCODE_SINGLE_FLIGHT_SHARED,
+    lock_timeout=settings.GEOCODE_SINGLE_FLIGHT_LOCK_TIMEOUT,
+    alias=settings.GEOCODE_CACHE_ALIAS,
+)
+plan_flight = SingleFlight(
+    'plan',
+    shared_lock=settings.PLAN_SINGLE_FLIGHT_SHARED,
+    lock_timeout=settings.PLAN_SINGLE_FLIGHT_LOCK_TIMEOUT,
+    alias=settings.PLAN_CACHE_ALIAS,
+)
+
+def geocode_with_google_maps(destination, timeout=None):
     """
-    Geocode destination using Google Maps Geocoding API
+    Geocode destination using Google Maps Geocoding API.
+    Results are cached by normalized query; queries Google reports as having no
+    results are cached for a shorter time, request errors are not cached.
+    Concurrent lookups of the same query share a single upstream call.
     """
-    try:
-        url = f"https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            'address': destination,
-            'key': GOOGLE_MAPS_API_KEY
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data['status'] == 'OK' and data['results']:
-            result = data['results'][0]
-            location = result['geometry']['location']
-            
-            return {
-                'latitude': location['lat'],
-                'longitude': location['lng'],
-                'address': result['formatted_address'],
-                'raw': result
-            }
-        else:
-            logger.error(f"Google Maps geocoding failed for '{destination}': {data.get('status')} - {data.get('error_message', 'Unknown error')}")
-            return None
-            
-    except requests.RequestException as e:
-        logger.error(f"Google Maps API request error for destination '{destination}': {str(e)}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error in Google Maps geocoding for destination '{destination}': {str(e)}")
-        return None
+    found, cached = geocode_cache.get(destination)
+    if found:
+        return cached
+    
+    return geocode_flight.do(
+        normalize_cache_key(destination),
+        lambda: fetch_geocode(destination, timeout),
+        lookup=lambda: geocode_cache.get(destination),
+    )
+
+def fetch_geocode(destination, timeout=None):
+    """Geocode through the Google client and store the outcome in the cache."""
+    result, status = get_geocoding_client().geocode(destination, timeout=timeout)
+    if result is not None:
+        geocode_cache.set(destination, result)
+    elif status == 'ZERO_RESULTS':
+        geocode_cache.set(destination, None, negative=True)
+    return result
 
-def extract_pois_from_plan(plan_text, language='en', destination=None):
+def extract_pois_from_plan(plan_text, language='en', destination=None, defer_geocoding=False):
     """
     Extract Points of Interest from the trip plan text using OpenAI-generated POI tags.
     Returns a list of POI objects with id, name, type, context info, and generated icon.
     Also replaces the POI tags in the plan text with ones that include the POI ID.
+    With defer_geocoding the POIs are returned with coordinates_pending set and
+    are geocoded later through POICoordinatesView.
     """
-    pois = []
-    poi_id = 1
-    modified_plan = plan_text
-    
-    # First try the new format with icons
-    poi_pattern = r'<poi\s+type="([^"]+)"\s+name="([^"]+)"\s+icon="([^"]+)">([^<]+)</poi>'
-    matches = re.findall(poi_pattern, plan_text)
-    
-    if matches:
-        # New format with icons found
-        for match in matches:
-            poi_type, poi_name, poi_icon, poi_text = match
-            poi_object = create_poi_object(poi_id, poi_name, poi_type, poi_text, plan_text, poi_icon, destination)
-            pois.append(poi_object)
-            
-            # Replace the original tag with one that includes the POI ID
-            original_tag = f'<poi type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>'
-            new_tag = f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>'
-            modified_plan = modified_plan.replace(original_tag, new_tag, 1)  # Replace only the first occurrence
-            
-            poi_id += 1
+    with metrics.stage('parse_pois'):
+        unique_pois, modified_plan = parse_pois_from_plan(plan_text, destination)
+    metrics.count('pois', len(unique_pois), 'POIs extracted from generated plans')
+    
+    if defer_geocoding:
+        mark_coordinates_pending(unique_pois)
     else:
-        # Fallback to old format without icons
-        poi_pattern_old = r'<poi\s+type="([^"]+)"\s+name="([^"]+)">([^<]+)</poi>'
-        matches_old = re.findall(poi_pattern_old, plan_text)
-        
-        if matches_old:
-            for match in matches_old:
-                poi_type, poi_name, poi_text = match
-                # Generate fallback icon
-                fallback_icon = get_fallback_icon(poi_name, poi_type)
-                poi_object = create_poi_object(poi_id, poi_name, poi_type, poi_text, plan_text, fallback_icon, destination)
-                pois.append(poi_object)
-                
-                # Replace the original tag with one that includes the POI ID and icon
-                original_tag = f'<poi type="{poi_type}" name="{poi_name}">{poi_text}</poi>'
-                new_tag = f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{fallback_icon}">{poi_text}</poi>'
-                modified_plan = modified_plan.replace(original_tag, new_tag, 1)  # Replace only the first occurrence
-                
-                poi_id += 1
-    
-    # Remove duplicates based on name
-    unique_pois = []
-    seen_names = set()
-    for poi in pois:
-        if poi['name'].lower() not in seen_names:
-            unique_pois.append(poi)
-            seen_names.add(poi['name'].lower())
+        # Geocode the unique POIs concurrently
+        with metrics.stage('geocode_pois'):
+            geocode_pois(unique_pois, destination)
     
     return unique_pois, modified_plan
 
-def create_poi_object(poi_id, poi_name, poi_type, poi_text, plan_text, icon, destination=None):
-    """Create a POI object with all necessary fields."""
-    # Find the line containing this POI
-    lines = plan_text.split('\n')
-    line_index = -1
-    for i, line in enumerate(lines):
-        if poi_text in line:
-            line_index = i
-            break
-    
-    # Geocode the POI to get its actual coordinates
-    poi_coordinates = None
+def mark_coordinates_pending(pois):
+    """Flag POIs whose coordinates are left for the client to request."""
+    for poi in pois:
+        poi['coordinates'] = None
+        poi['coordinates_pending'] = True
+    return pois
+
+def parse_pois_from_plan(plan_text, destination=None):
+    """
+    Parse the POI tags of a plan without geocoding them.
+    Returns the unique POI objects (coordinates set to None) and the plan text
+    with the POI tags rewritten to include their IDs.
+    
+    Tags are found, numbered and rewritten in a single pass over the plan; a
+    missing icon attribute is filled in with get_fallback_icon. IDs run from 1
+    over the unique POIs, and a repeated POI (same name, e.g. on another day
+    of a chunked plan) is merged into the first one and tagged with its ID.
+    """
+    pois = []
+    ids_by_name = {}
+    parts = []
+    last = 0
+    
+    for start, end, attributes, poi_text, line_index in iter_poi_tags(plan_text):
+        poi_type = attributes['type']
+        poi_name = attributes['name']
+        poi_icon = attributes.get('icon') or get_fallback_icon(poi_name, poi_type)
+        
+        # Remove duplicates based on name
+        poi_id = ids_by_name.get(poi_name.lower())
+        is_new = poi_id is None
+        if is_new:
+            poi_id = ids_by_name[poi_name.lower()] = len(ids_by_name) + 1
+        
+        parts.append(plan_text[last:start])
+        parts.append(f'<poi id="{poi_id}" type="{poi_type}" name="{poi_name}" icon="{poi_icon}">{poi_text}</poi>')
+        last = end
+        
+        if not is_new:
+            continue
+        
+        line_start = plan_text.rfind('\n', 0, start) + 1
+        line_end = plan_text.find('\n', end)
+        line = plan_text[line_start:line_end if line_end != -1 else len(plan_text)]
+        pois.append(create_poi_object(poi_id, poi_name, poi_type, poi_text, poi_icon, line, line_index))
+    
+    parts.append(plan_text[last:])
+    return pois, ''.join(parts)
+
+def geocode_poi(poi_name, destination=None, timeout=None):
+    """Geocode a single POI name, returning {'lat', 'lon'} or None."""
     try:
         # Try to geocode the POI name with the destination context
         search_query = f"{poi_name}, {destination}" if destination else poi_name
-        poi_location = geocode_with_google_maps(search_query)
+        poi_location = geocode_with_google_maps(search_query, timeout=timeout)
         if poi_location:
             poi_coordinates = {
                 'lat': poi_location['latitude'],
                 'lon': poi_location['longitude']
             }
             logger.info(f"Successfully geocoded POI '{poi_name}' to {poi_coordinates}")
-        else:
-            logger.warning(f"Failed to geocode POI '{poi_name}' - no results from Google Maps")
+            return poi_coordinates
+        logger.warning(f"Failed to geocode POI '{poi_name}' - no results from Google Maps")
     except Exception as e:
         logger.warning(f"Failed to geocode POI '{poi_name}': {str(e)}")
+    return None
+
+def geocode_pois(pois, destination=None):
+    """
+    Fill in the 'coordinates' of each POI object, geocoding them concurrently.
+    At most POI_GEOCODE_MAX_WORKERS geocodes run at once, each call is bounded by
+    POI_GEOCODE_TIMEOUT and the whole batch by POI_GEOCODE_DEADLINE. POIs that are
+    not resolved in time keep coordinates set to None, like a failed geocode.
+    """
+    # Places seen in earlier plans come from the gazetteer in one query
+    pending = gazetteer_lookup(pois, destination)
+    if not pending:
+        return pois
     
+    max_workers = max(1, min(settings.POI_GEOCODE_MAX_WORKERS, len(pending)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='poi-geocode')
+    try:
+        futures = {
+            metrics.submit_with_context(executor, geocode_poi, poi['name'], destination, settings.POI_GEOCODE_TIMEOUT): poi
+            for poi in pending
+        }
+        done, not_done = wait(futures, timeout=settings.POI_GEOCODE_DEADLINE)
+        
+        for future in done:
+            futures[future]['coordinates'] = future.result()
+        for future in not_done:
+            poi = futures[future]
+            poi['coordinates'] = None
+            logger.warning(f"Geocoding POI '{poi['name']}' missed the {settings.POI_GEOCODE_DEADLINE}s deadline")
+    finally:
+        # Don't block the request on stragglers; they are bounded by the per-call timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    gazetteer_remember(pending, destination)
+    return pois
+
+def gazetteer_lookup(pois, destination=None):
+    """
+    Fill in the coordinates of POIs already in the place gazetteer and return
+    the POIs that still need geocoding.
+    """
+    if not (settings.GAZETTEER_ENABLED and pois):
+        return list(pois)
+    try:
+        known = Place.objects.lookup([poi['name'] for poi in pois], destination)
+    except DatabaseError as e:
+        logger.warning(f"Gazetteer lookup failed: {str(e)}")
+        return list(pois)
+    
+    pending = []
+    for poi in pois:
+        coordinates = known.get(normalize_cache_key(poi['name']))
+        if coordinates:
+            poi['coordinates'] = coordinates
+        else:
+            pending.append(poi)
+    return pending
+
+def gazetteer_remember(pois, destination=None):
+    """Add the POIs that were geocoded successfully to the place gazetteer."""
+    resolved = [(poi['name'], poi['coordinates']) for poi in pois if poi.get('coordinates')]
+    if not (settings.GAZETTEER_ENABLED and resolved):
+        return
+    try:
+        Place.objects.remember(resolved, destination)
+    except DatabaseError as e:
+        logger.warning(f"Failed to save {len(resolved)} places to the gazetteer: {str(e)}")
+
+def create_poi_object(poi_id, poi_name, poi_type, poi_text, icon, line=None, line_index=0):
+    """
+    Create a POI object with all necessary fields.
+    Coordinates are left as None to be filled in by geocode_pois.
+    """
     return {
         'id': poi_id,
         'name': poi_name,
         'type': poi_type,
         'keyword': poi_text,
-        'line': lines[line_index] if line_index >= 0 else poi_text,
-        'line_index': line_index if line_index >= 0 else 0,
-        'context': lines[line_index] if line_index >= 0 else poi_text,
+        'line': line if line is not None else poi_text,
+        'line_index': line_index,
+        'context': line if line is not None else poi_text,
         'icon': icon,
-        'coordinates': poi_coordinates
+        'coordinates': None
     }
 
 def get_fallback_icon(poi_name, poi_type):
     """Generate a fallback icon based on POI name and type."""
-    poi_name_lower = poi_name.lower()
-    
-    # Smart icon mapping based on common POI names and types
-    smart_icons = {
-        # Attractions
-        'tower': '🗼', 'eiffel': '🗼', 'monument': '🗽', 'statue': '🗽', 'bridge': '🌉', 'palace': '🏰',
-        'castle': '🏰', 'church': '⛪', 'cathedral': '⛪', 'temple': '🛕', 'mosque': '🕌', 'synagogue': '🕍',
-        'plaza': '🏛️', 'square': '🏛️', 'fountain': '⛲', 'museum': '🏛️', 'gallery': '🖼️',
-        
-        # Restaurants
-        'restaurant': '🍽️', 'cafe': '☕', 'bistro': '🍽️', 'pub': '🍺', 'bar': '🍺', 'tavern': '🍺',
-        'diner': '🍽️', 'eatery': '🍽️', 'pizzeria': '🍕', 'bakery': '🥐', 'ice cream': '🍦',
-        
-        # Hotels
-        'hotel': '🏨', 'hostel': '🏨', 'inn': '🏨', 'lodge': '🏨', 'resort': '🏖️', 'guesthouse': '🏨',
-        'motel': '🏨', 'apartment': '🏢', 'villa': '🏡',
-        
-        # Parks
-        'park': '🌳', 'garden': '🌺', 'botanical': '🌺', 'zoo': '🦁', 'aquarium': '🐠', 'forest': '🌲',
-        'beach': '🏖️', 'lake': '🏞️', 'mountain': '⛰️', 'trail': '🥾',
-        
-        # Shopping
-        'mall': '🛍️', 'market': '🛒', 'shop': '🛍️', 'store': '🛍️', 'boutique': '👗', 'shopping': '🛍️',
-        'outlet': '🛍️', 'department': '🏬',
-        
-        # Transport
-        'airport': '✈️', 'station': '🚉', 'metro': '🚇', 'subway': '🚇', 'bus': '🚌', 'train': '🚂',
-        'port': '🚢', 'terminal': '🚉', 'garage': '🅿️', 'parking': '🅿️'
-    }
-    
     # Check for specific keywords in the POI name
-    for keyword, icon in smart_icons.items():
-        if keyword in poi_name_lower:
-            return icon
+    icon = poi_icon_matcher.match(poi_name)
+    if icon:
+        return icon
     
     # Fallback to type-based icons
-    fallback_icons = {
-        'attraction': '🗽',
-        'restaurant': '🍽️',
-        'hotel': '🏨',
-        'museum': '🏛️',
-        'park': '🌳',
-        'shopping': '🛍️',
-        'transport': '🚇'
+    return POI_TYPE_ICONS.get(poi_type, DEFAULT_POI_ICON)
+
+class PlanError(Exception):
+    """A trip plan failure that maps to an error JSON response."""
+    
+    def __init__(self, message, error_code, status=500, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.error_code = error_code
+        self.status = status
+        self.retry_after = retry_after
+    
+    def to_dict(self):
+        return {
+            'error': self.message,
+            'error_code': self.error_code
+        }
+    
+    def to_response(self):
+        response = JsonResponse(self.to_dict(), status=self.status)
+        if self.retry_after is not None:
+            response['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return response
+
+def admission_error(rejection):
+    """PlanError for an upstream call that admission control turned away."""
+    if rejection.upstream == 'geocode':
+        message, error_code = _('The geocoding service is busy. Please try again shortly.'), 'GEOCODING_RATE_LIMITED'
+    else:
+        message, error_code = _('The trip planner is busy. Please try again shortly.'), 'OPENAI_RATE_LIMITED'
+    return PlanError(message, error_code, status=503, retry_after=rejection.retry_after)
+
+def circuit_open_error(error):
+    """PlanError for a call refused by an upstream's open circuit breaker."""
+    if error.upstream == 'geocode':
+        message, error_code = _('The geocoding service is unavailable. Please try again shortly.'), 'GEOCODING_UNAVAILABLE'
+    else:
+        message, error_code = _('Trip generation is unavailable. Please try again shortly.'), 'OPENAI_UNAVAILABLE'
+    return PlanError(message, error_code, status=503, retry_after=error.retry_after)
+
+def check_circuit(upstream):
+    """Raise PlanError right away while the upstream's circuit breaker is open."""
+    retry_after = get_breaker(upstream).retry_after()
+    if retry_after > 0:
+        raise circuit_open_error(CircuitOpen(upstream, retry_after))
+
+def parse_plan_request(request):
+    """
+    Parse and validate a trip plan request body.
+    Returns a dict with destination, start_date, end_date and language.
+    Raises PlanError for missing fields or a body that isn't a JSON object and
+    json.JSONDecodeError for a bad body.
+    """
+    data = json.loads(request.body)
+    if not isinstance(data, dict):
+        raise PlanError(_('Invalid JSON data provided'), 'INVALID_JSON', status=400)
+    return validate_plan_params(data, request.headers.get('Accept-Language', ''))
+
+MAX_DESTINATION_LENGTH = Trip._meta.get_field('destination').max_length
+MAX_LANGUAGE_LENGTH = Trip._meta.get_field('language').max_length
+
+def validate_plan_params(data, accept_language=''):
+    """Validate the fields of a single trip plan request."""
+    destination = data.get('destination')
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    language = data.get('language', 'en')  # Get language from frontend, default to English
+    
+    # Also check Accept-Language header
+    if not language and accept_language:
+        # Parse Accept-Language header (e.g., "en-US,en;q=0.9,es;q=0.8")
+        primary_lang = accept_language.split(',')[0].split(';')[0].split('-')[0]
+        if primary_lang in [lang[0] for lang in settings.LANGUAGES]:
+            language = primary_lang
+    language = language or 'en'
+
+    # Validate required fields
+    if isinstance(destination, str):
+        destination = destination.strip()
+    if not destination:
+        raise PlanError(_('Destination is required'), 'MISSING_DESTINATION', status=400)
+    
+    # Both are stored with the plan and the destination is sent to Google
+    if not isinstance(destination, str) or len(destination) > MAX_DESTINATION_LENGTH:
+        raise PlanError(
+            _('Destination must be text of at most %(length)d characters') % {'length': MAX_DESTINATION_LENGTH},
+            'INVALID_DESTINATION', status=400
+        )
+    
+    if not isinstance(language, str) or len(language) > MAX_LANGUAGE_LENGTH:
+        raise PlanError(_('Language must be a language code'), 'INVALID_LANGUAGE', status=400)
+    
+    if not start_date:
+        raise PlanError(_('Start date is required'), 'MISSING_START_DATE', status=400)
+    
+    if not end_date:
+        raise PlanError(_('End date is required'), 'MISSING_END_DATE', status=400)
+    
+    # Dates are stored with the plan, so they have to be real YYYY-MM-DD dates
+    start = parse_plan_date(start_date)
+    if start is None:
+        raise PlanError(_('Start date must be a date in YYYY-MM-DD format'), 'INVALID_START_DATE', status=400)
+    
+    end = parse_plan_date(end_date)
+    if end is None:
+        raise PlanError(_('End date must be a date in YYYY-MM-DD format'), 'INVALID_END_DATE', status=400)
+    
+    if end < start:
+        raise PlanError(_('End date must not be before the start date'), 'INVALID_DATE_RANGE', status=400)
+    
+    # Every day is paid for in completion tokens (and chunked completions)
+    if (end - start).days + 1 > settings.PLAN_MAX_TRIP_DAYS:
+        raise PlanError(
+            _('Trips can be at most %(days)d days long') % {'days': settings.PLAN_MAX_TRIP_DAYS},
+            'TRIP_TOO_LONG', status=400
+        )
+    
+    return {
+        'destination': destination,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'language': language,
+        # Return POIs without coordinates; they are fetched from /api/pois/coordinates/
+        'defer_geocoding': bool(data.get('defer_geocoding', settings.POI_GEOCODE_DEFERRED))
+    }
+
+def parse_plan_date(value):
+    """The date in a YYYY-MM-DD request field, or None if it isn't one."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+def geocode_destination(destination):
+    """Geocode the trip destination, raising PlanError if it cannot be located."""
+    try:
+        with metrics.stage('geocode_destination'):
+            location_data = geocode_with_google_maps(destination)
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except CircuitOpen as e:
+        raise circuit_open_error(e)
+    if not location_data:
+        raise PlanError(_('Unable to locate the destination. Please try again later.'), 'GEOCODING_ERROR')
+    return location_data
+
+def plan_completion_kwargs(prompt, max_tokens=None):
+    """
+    Arguments for the OpenAI chat completion that generates a plan: the shared
+    system prompt followed by the request's data (see planner.prompts).
+    """
+    return {
+        'model': "gpt-4o",
+        'messages': plan_messages(prompt),
+        'max_tokens': max_tokens or settings.PLAN_MAX_TOKENS_MIN,
+        'temperature': 0.7
     }
+
+def completion_token_cost(completion_kwargs):
+    """
+    Tokens a completion counts against the tokens-per-minute quota: the
+    prompt (estimated at 4 characters per token) plus max_tokens.
+    """
+    prompt_chars = sum(len(message['content']) for message in completion_kwargs['messages'])
+    return prompt_chars // 4 + completion_kwargs['max_tokens']
+
+def admit_openai_call(completion_kwargs):
+    """Wait for OpenAI admission control to let the completion through, or raise PlanError."""
+    try:
+        with metrics.stage('openai_admission'):
+            get_limiter('openai').acquire(requests=1, tokens=completion_token_cost(completion_kwargs))
+    except AdmissionRejected as e:
+        logger.warning(f"OpenAI call rejected by admission control: {str(e)}")
+        raise admission_error(e)
+
+# Semaphore bounding the completions of a batch or of the plan jobs, which
+# run several plans at once, each possibly as several chunk completions.
+# The chunk workers copy the caller's context, so they share it.
+completion_slots = contextvars.ContextVar('completion_slots', default=None)
+
+@contextmanager
+def using_completion_slots(slots):
+    """Make the OpenAI calls in this block (and its chunk workers) share `slots`."""
+    token = completion_slots.set(slots)
+    try:
+        yield
+    finally:
+        completion_slots.reset(token)
+
+@contextmanager
+def completion_slot():
+    """Hold one of the current completion_slots, if any, for an OpenAI call."""
+    slots = completion_slots.get()
+    if slots is None:
+        yield
+        return
+    with metrics.stage('openai_slot_wait'):
+        slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+def generate_plan(prompt, max_tokens=None, stage_name='openai'):
+    """Generate the plan text with OpenAI, raising PlanError on failure."""
+    completion_kwargs = plan_completion_kwargs(prompt, max_tokens)
+    # Don't queue for admission behind an open breaker
+    check_circuit('openai')
+    with completion_slot():
+        admit_openai_call(completion_kwargs)
+        try:
+            # Reuse the process-wide OpenAI client
+            client = get_openai_client()
+            with metrics.stage(stage_name), openai_call():
+                response = client.chat.completions.create(**completion_kwargs)
+            record_token_usage(response)
+            return response.choices[0].message.content.strip()
+        except CircuitOpen as e:
+            raise circuit_open_error(e)
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            raise PlanError(_('Unable to generate trip plan. Please try again later.'), 'OPENAI_ERROR')
+
+def generate_trip_plan(params, location_data):
+    """Plan text for a trip: one completion, or chunked ones for a long trip."""
+    if use_chunked_generation(params):
+        return generate_chunked_plan(params, location_data)
+    return generate_plan(build_trip_prompt(params, location_data), plan_max_tokens(params))
+
+def use_chunked_generation(params):
+    """Whether the trip is long enough (PLAN_CHUNKED_MIN_DAYS) to generate in day chunks."""
+    min_days = settings.PLAN_CHUNKED_MIN_DAYS
+    return min_days > 0 and trip_days(params) >= max(min_days, 2)
+
+def chunked_plan_requests(params, location_data):
+    """(prompt, max_tokens) for the overview and then each chunk of days, in plan order."""
+    requests = [(build_overview_prompt(params, location_data), settings.PLAN_OVERVIEW_MAX_TOKENS)]
+    for chunk in day_chunks(params, settings.PLAN_CHUNK_DAYS, settings.PLAN_MAX_CHUNKS):
+        requests.append((build_chunk_prompt(params, location_data, chunk), plan_max_tokens(chunk)))
+    return requests
+
+def generate_chunked_plan(params, location_data):
+    """
+    Generate a long trip as an overview plus one itinerary per PLAN_CHUNK_DAYS
+    days, with at most PLAN_CHUNK_MAX_WORKERS completions in flight, and join
+    the parts in order. Wall time follows the slowest part instead of growing
+    with the trip length; if any part fails the plan fails with PlanError.
+    POIs repeated across parts are merged later by parse_pois_from_plan.
+    """
+    requests = chunked_plan_requests(params, location_data)
+    metrics.count('openai_plan_chunks', len(requests), 'Completions made for chunked plans')
+    
+    max_workers = min(settings.PLAN_CHUNK_MAX_WORKERS, len(requests))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='plan-chunk')
+    try:
+        with metrics.stage('openai'):
+            futures = [
+                metrics.submit_with_context(executor, generate_plan, prompt, max_tokens, 'openai_chunk')
+                for prompt, max_tokens in requests
+            ]
+            parts = [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return join_plan_parts(parts)
+
+def join_plan_parts(parts):
+    return '\n\n'.join(part for part in parts if part)
+
+@contextmanager
+def openai_call():
+    """
+    Record an OpenAI request (including the client's own retries) as an
+    upstream call and report it to the circuit breaker, which raises
+    CircuitOpen instead of letting the call start while it is open. Only
+    errors that say OpenAI is failing count against the breaker; a rejected
+    request (400, 413, ...) is still recorded as a failed call.
+    """
+    breaker = get_breaker('openai')
+    breaker.before_call()
+    started = time.perf_counter()
+    ok = False
+    upstream_failed = False
+    try:
+        yield
+        ok = True
+    except Exception as e:
+        upstream_failed = is_upstream_failure(e)
+        raise
+    finally:
+        metrics.observe_upstream('openai', time.perf_counter() - started, ok)
+        if ok or upstream_failed:
+            breaker.record(ok)
+        else:
+            breaker.release()
+
+def record_token_usage(response):
+    """Count the prompt and completion tokens reported by a chat completion."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    metrics.count('openai_prompt_tokens', usage.prompt_tokens or 0, 'OpenAI prompt tokens used')
+    metrics.count('openai_completion_tokens', usage.completion_tokens or 0, 'OpenAI completion tokens used')
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None)
+    if cached_tokens is not None:
+        metrics.count('openai_cached_prompt_tokens', cached_tokens, 'OpenAI prompt tokens served from the prompt cache')
+
+def build_plan_response(params, location_data, plan, pois):
+    """Build the JSON payload returned for a generated plan."""
+    return {
+        'destination': params['destination'],
+        'coordinates': {
+            'lat': location_data['latitude'], 
+            'lon': location_data['longitude'],
+            'formatted_address': location_data['address']
+        },
+        'dates': {
+            'start': params['start_date'],
+            'end': params['end_date']
+        },
+        'language': params['language'],
+        'plan': plan,
+        'generated_at': location_data['raw'].get('timestamp', ''),
+        'attribution': 'Powered by OpenAI GPT-4o',
+        'pois': pois
+    }
+
+def run_plan_pipeline(params):
+    """
+    Run the full plan pipeline for validated request params:
+    geocode destination -> prompt -> OpenAI -> POI extraction and geocoding.
+    Returns the response payload, raises PlanError on failure.
+    """
+    location_data = geocode_destination(params['destination'])
+    plan = generate_trip_plan(params, location_data)
     
-    return fallback_icons.get(poi_type, '📍')
+    # Extract POIs from the plan
+    pois, modified_plan = extract_pois_from_plan(
+        plan, params['language'], params['destination'], defer_geocoding=params['defer_geocoding']
+    )
+    
+    with metrics.stage('store'):
+        return store_plan(params, build_plan_response(params, location_data, modified_plan, pois))
+
+def store_plan(params, payload):
+    """
+    Persist a generated plan when PLAN_STORE_ENABLED is set and add its
+    'plan_id' to the payload. A failed write is logged and the plan is still
+    returned, just without an id.
+    """
+    if not settings.PLAN_STORE_ENABLED:
+        return payload
+    try:
+        payload['plan_id'] = str(Plan.objects.store(params, payload).id)
+    except (DatabaseError, ValidationError) as e:
+        logger.error(f"Failed to store plan for {params['destination']}: {str(e)}")
+    return payload
+
+def plan_cache_key(params):
+    """Cache key for a plan request: normalized destination, dates, language and geocoding mode."""
+    fields = ('destination', 'start_date', 'end_date', 'language', 'defer_geocoding')
+    return '|'.join(normalize_cache_key(params[field]) for field in fields)
+
+def cached_plan_pipeline(params):
+    """
+    Run the plan pipeline through the plan cache when PLAN_CACHE_ENABLED is set.
+    Concurrent identical requests share one pipeline run.
+    Returns (payload, cache_status) where cache_status is 'HIT', 'MISS', or
+    None when the cache is disabled.
+    """
+    key = plan_cache_key(params)
+    if not settings.PLAN_CACHE_ENABLED:
+        # Still coalesce concurrent identical requests within this process
+        return plan_flight.do(key, lambda: run_plan_pipeline(params)), None
+    
+    found, payload = plan_cache.get(key)
+    if found and payload is not None:
+        metrics.count('plan_cache_hits', help_text='Plan requests answered from the plan cache')
+        return payload, 'HIT'
+    
+    metrics.count('plan_cache_misses', help_text='Plan requests not found in the plan cache')
+    
+    def compute():
+        payload = run_plan_pipeline(params)
+        plan_cache.set(key, payload)
+        return payload
+    
+    return plan_flight.do(key, compute, lookup=lambda: plan_cache.get(key)), 'MISS'
+
+def plan_json_response(payload, cache_status=None):
+    """JsonResponse for a plan payload, reporting whether it came from the plan cache."""
+    if cache_status is None:
+        return JsonResponse(payload)
+    
+    response = JsonResponse(dict(payload, cached=cache_status == 'HIT'))
+    response['X-Plan-Cache'] = cache_status
+    return response
+
+def timed_response(response, timings):
+    """Expose a request's stage timings as a Server-Timing header and a structured log line."""
+    response['Server-Timing'] = timings.server_timing()
+    fields = dict(timings.log_fields(), endpoint=timings.name, status=response.status_code)
+    logger.info(
+        f"Plan request timings: {' '.join(f'{key}={value}' for key, value in fields.items())}",
+        extra={'plan_request': fields}
+    )
+    return response
 
 @method_decorator(csrf_exempt, name='dispatch')
 class TripPlanView(View):
     def post(self, request):
+        with metrics.track_request('plan_trip') as timings:
+            response = self.plan(request)
+        return timed_response(response, timings)
+    
+    def plan(self, request):
         try:
-            data = json.loads(request.body)
-            destination = data.get('destination')
-            start_date = data.get('start_date')
-            end_date = data.get('end_date')
-            language = data.get('language', 'en')  # Get language from frontend, default to English
-            
-            # Also check Accept-Language header
-            accept_language = request.headers.get('Accept-Language', '')
-            if not language and accept_language:
-                # Parse Accept-Language header (e.g., "en-US,en;q=0.9,es;q=0.8")
-                primary_lang = accept_language.split(',')[0].split(';')[0].split('-')[0]
-                if primary_lang in [lang[0] for lang in settings.LANGUAGES]:
-                    language = primary_lang
-
-            # Validate required fields
-            if not destination:
-                return JsonResponse({
-                    'error': _('Destination is required'),
-                    'error_code': 'MISSING_DESTINATION'
-                }, status=400)
+            params = parse_plan_request(request)
             
-            if not start_date:
-                return JsonResponse({
-                    'error': _('Start date is required'),
-                    'error_code': 'MISSING_START_DATE'
-                }, status=400)
+            # Return enhanced response
+            return plan_json_response(*cached_plan_pipeline(params))
             
-            if not end_date:
-                return JsonResponse({
-                    'error': _('End date is required'),
-                    'error_code': 'MISSING_END_DATE'
-                }, status=400)
-
-            # Map language code to language name for OpenAI prompt
-            lang_map = {
-                'en': 'English', 'es': 'Spanish', 'fr': 'French', 'de': 'German', 'it': 'Italian',
-                'pt': 'Portuguese', 'ru': 'Russian', 'ja': 'Japanese', 'ko': 'Korean', 'zh-cn': 'Chinese',
-                'zh-tw': 'Chinese', 'zh': 'Chinese', 'ar': 'Arabic', 'hi': 'Hindi', 'tr': 'Turkish', 
-                'nl': 'Dutch', 'pl': 'Polish', 'sv': 'Swedish', 'da': 'Danish', 'no': 'Norwegian', 
-                'fi': 'Finnish', 'cs': 'Czech', 'sk': 'Slovak', 'hu': 'Hungarian', 'ro': 'Romanian', 
-                'bg': 'Bulgarian', 'el': 'Greek', 'he': 'Hebrew', 'th': 'Thai', 'vi': 'Vietnamese', 
-                'id': 'Indonesian', 'ms': 'Malay', 'uk': 'Ukrainian', 'fa': 'Persian', 'sr': 'Serbian', 
-                'hr': 'Croatian', 'sl': 'Slovenian', 'et': 'Estonian', 'lv': 'Latvian', 'lt': 'Lithuanian'
-            }
-            language_name = lang_map.get(language, 'English')
+        except PlanError as e:
+            return e.to_response()
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'error': _('Invalid JSON data provided'),
+                'error_code': 'INVALID_JSON'
+            }, status=400)
+        except Exception as e:
+            logger.error(f"Unexpected error in TripPlanView: {str(e)}")
+            return JsonResponse({
+                'error': _('An unexpected error occurred. Please try again later.'),
+                'error_code': 'UNEXPECTED_ERROR'
+            }, status=500)
 
-            # Geocode destination
-            location_data = geocode_with_google_maps(destination)
-            if not location_data:
-                return JsonResponse({
-                    'error': _('Unable to locate the destination. Please try again later.'),
-                    'error_code': 'GEOCODING_ERROR'
-                }, status=500)
-
-            # Compose enhanced prompt for OpenAI
-            prompt = f"""
-            Plan a detailed trip to {destination} (latitude: {location_data['latitude']}, longitude: {location_data['longitude']}) from {start_date} to {end_date}.
-            
-            Please provide a comprehensive itinerary that includes:
-            1. Day-by-day activities and attractions
-            2. Local restaurants and food recommendations
-            3. Transportation tips within the destination
-            4. Cultural insights and local customs
-            5. Practical travel tips (weather, what to pack, etc.)
-            6. Budget-friendly and luxury options where applicable
-            
-            CRITICAL: For each point of interest (POI) mentioned in your plan, you MUST highlight it using this exact format:
-            <poi type="attraction" name="Eiffel Tower" icon="🗼">Eiffel Tower</poi>
-            <poi type="restaurant" name="Le Jules Verne" icon="🍽️">Le Jules Verne restaurant</poi>
-            <poi type="hotel" name="Hotel Ritz" icon="🏨">Hotel Ritz</poi>
-            <poi type="museum" name="Louvre Museum" icon="🏛️">Louvre Museum</poi>
-            <poi type="park" name="Luxembourg Gardens" icon="🌳">Luxembourg Gardens</poi>
-            <poi type="shopping" name="Champs-Élysées" icon="🛍️">Champs-Élysées shopping district</poi>
-            <poi type="transport" name="Charles de Gaulle Airport" icon="✈️">Charles de Gaulle Airport</poi>
-            
-            POI types and suggested icons:
-            - attraction: landmarks, monuments, towers, bridges, palaces, castles, churches, temples (🗽🗼🏰⛪🛕🕌🕍🏛️⛲)
-            - restaurant: restaurants, cafes, bars, bistros, pubs (🍽️☕🍺🍕🥐🍦)
-            - hotel: hotels, hostels, inns, resorts, guesthouses (🏨🏖️🏢🏡)
-            - museum: museums, galleries, exhibitions (🏛️🖼️)
-            - park: parks, gardens, zoos, aquariums (🌳🌺🦁🐠🌲🏖️🏞️⛰️)
-            - shopping: malls, markets, shopping districts, boutiques (🛍️🛒👗🏬)
-            - transport: airports, train stations, metro stations, ports (✈️🚉🚇🚌🚂🚢🅿️)
-            
-            IMPORTANT: You MUST include at least 5-10 POIs in your plan, each wrapped in the <poi> tags with appropriate icons. Choose the most relevant emoji for each specific place.
-            
-            Make the plan engaging, practical, and culturally sensitive. Include specific place names, addresses, and estimated costs where possible.
+def stream_plan_events(params, location_data, completion_kwargs):
+    """
+    Generate the Server-Sent Events for a streamed trip plan, from the
+    completion described by `completion_kwargs` (already admitted).
+    
+    Events: 'meta' with the destination coordinates, 'token' for each chunk of
+    plan text, 'poi' when a POI tag completes (and again with its coordinates
+    once geocoded), then 'done' with the full response payload or 'error'.
+    """
+    destination = params['destination']
+    yield sse_event('meta', build_plan_response(params, location_data, '', []))
+    
+    parser = IncrementalPoiParser(get_fallback_icon)
+    executor = ThreadPoolExecutor(max_workers=settings.POI_GEOCODE_MAX_WORKERS, thread_name_prefix='poi-geocode')
+    pending = {}
+    geocoded = []
+    
+    def resolved_pois(timeout=0):
+        # Yield POIs whose geocode has finished, waiting at most `timeout` seconds
+        if not pending:
+            return
+        done, _not_done = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            poi = pending.pop(future)
+            poi['coordinates'] = future.result()
+            geocoded.append(poi)
+            yield poi
+    
+    stream = None
+    try:
+        try:
+            with openai_call():
+                stream = get_openai_client().chat.completions.create(
+                    stream=True,
+                    # The final chunk then reports token usage
+                    stream_options={'include_usage': True},
+                    **completion_kwargs
+                )
+        except CircuitOpen as e:
+            yield sse_event('error', circuit_open_error(e).to_dict())
+            return
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            yield sse_event('error', PlanError(_('Unable to generate trip plan. Please try again later.'), 'OPENAI_ERROR').to_dict())
+            return
+        
+        for chunk in stream:
+            if getattr(chunk, 'usage', None) is not None:
+                record_token_usage(chunk)
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            yield sse_event('token', {'text': text})
             
-            Please answer in {language_name} and format the response in a clear, readable structure.
-            """
+            for poi in parser.feed(text):
+                if params['defer_geocoding']:
+                    mark_coordinates_pending([poi])
+                    yield sse_event('poi', poi)
+                    continue
+                # A place known to the gazetteer is sent once, with coordinates
+                needs_geocoding = gazetteer_lookup([poi], destination)
+                yield sse_event('poi', poi)
+                if not needs_geocoding:
+                    continue
+                future = executor.submit(geocode_poi, poi['name'], destination, settings.POI_GEOCODE_TIMEOUT)
+                pending[future] = poi
             
-            try:
-                # Initialize OpenAI client inside the view method
-                client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=2000,
-                    temperature=0.7
-                )
-                plan = response.choices[0].message.content.strip()
-            except Exception as e:
-                logger.error(f"OpenAI API error: {str(e)}")
-                return JsonResponse({
-                    'error': _('Unable to generate trip plan. Please try again later.'),
-                    'error_code': 'OPENAI_ERROR'
-                }, status=500)
-
-            # Extract POIs from the plan
-            pois, modified_plan = extract_pois_from_plan(plan, language, destination)
+            for poi in resolved_pois():
+                yield sse_event('poi', poi)
+        
+        # Generation is done; give the remaining geocodes until the deadline
+        deadline = time.monotonic() + settings.POI_GEOCODE_DEADLINE
+        while pending and time.monotonic() < deadline:
+            for poi in resolved_pois(timeout=deadline - time.monotonic()):
+                yield sse_event('poi', poi)
+        for poi in pending.values():
+            logger.warning(f"Geocoding POI '{poi['name']}' missed the {settings.POI_GEOCODE_DEADLINE}s deadline")
+        
+        gazetteer_remember(geocoded, destination)
+        pois, modified_plan = parser.finish()
+        payload = store_plan(params, build_plan_response(params, location_data, modified_plan, pois))
+        if settings.PLAN_CACHE_ENABLED:
+            plan_cache.set(plan_cache_key(params), payload)
+        yield sse_event('done', payload)
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in TripPlanStreamView: {str(e)}")
+        yield sse_event('error', PlanError(_('An unexpected error occurred. Please try again later.'), 'UNEXPECTED_ERROR').to_dict())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if stream is not None:
+            stream.close()
 
-            # Return enhanced response
-            return JsonResponse({
-                'destination': destination,
-                'coordinates': {
-                    'lat': location_data['latitude'], 
-                    'lon': location_data['longitude'],
-                    'formatted_address': location_data['address']
-                },
-                'dates': {
-                    'start': start_date,
-                    'end': end_date
-                },
-                'language': language,
-                'plan': modified_plan,
-                'generated_at': location_data['raw'].get('timestamp', ''),
-                'attribution': 'Powered by OpenAI GPT-4o',
-                'pois': pois
-            })
+@method_decorator(csrf_exempt, name='dispatch')
+class TripPlanStreamView(View):
+    """
+    Streaming variant of TripPlanView that forwards the plan as Server-Sent
+    Events while it is being generated. Request validation and destination
+    geocoding errors are still returned as regular JSON responses.
+    """
+    
+    def post(self, request):
+        try:
+            params = parse_plan_request(request)
+            
+            # A cached plan is sent as a single 'done' event
+            if settings.PLAN_CACHE_ENABLED:
+                found, payload = plan_cache.get(plan_cache_key(params))
+                if found and payload is not None:
+                    return self.event_stream_response(request, iter([sse_event('done', dict(payload, cached=True))]), 'HIT')
             
+            location_data = geocode_destination(params['destination'])
+            completion_kwargs = plan_completion_kwargs(build_trip_prompt(params, location_data), plan_max_tokens(params))
+            check_circuit('openai')
+            admit_openai_call(completion_kwargs)
+        except PlanError as e:
+            return e.to_response()
         except json.JSONDecodeError:
             return JsonResponse({
                 'error': _('Invalid JSON data provided'),
                 'error_code': 'INVALID_JSON'
             }, status=400)
         except Exception as e:
-            logger.error(f"Unexpected error in TripPlanView: {str(e)}")
+            logger.error(f"Unexpected error in TripPlanStreamView: {str(e)}")
             return JsonResponse({
                 'error': _('An unexpected error occurred. Please try again later.'),
                 'error_code': 'UNEXPECTED_ERROR'
             }, status=500)
+        
+        cache_status = 'MISS' if settings.PLAN_CACHE_ENABLED else None
+        return self.event_stream_response(request, stream_plan_events(params, location_data, completion_kwargs), cache_status)
+    
+    def event_stream_response(self, request, events, cache_status=None):
+        response = StreamingHttpResponse(response_stream(request, events), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Tell nginx not to buffer the event stream
+        response['X-Accel-Buffering'] = 'no'
+        if cache_status:
+            response['X-Plan-Cache'] = cache_status
+        return response
+
+def run_plan_batch(items, accept_language='', language_code=None):
+    """
+    Run a batch of plan requests and yield one result dict per request, in
+    completion order. Every unique destination is geocoded once up front; the
+    plans then run with at most PLAN_BATCH_CONCURRENCY OpenAI calls at a time,
+    counting the chunk completions of long trips.
+    POI geocodes repeated across plans are shared through the geocode cache and
+    single-flight, so each unique query reaches Google once.
+    """
+    valid = {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise PlanError(_('Invalid JSON data provided'), 'INVALID_JSON', status=400)
+            valid[index] = validate_plan_params(item, accept_language)
+        except PlanError as e:
+            yield dict(e.to_dict(), index=index, status=e.status)
+    
+    slots = threading.BoundedSemaphore(max(1, settings.PLAN_BATCH_CONCURRENCY))
+    
+    def run(function, *args):
+        # Worker threads don't inherit the request's active language
+        with using_completion_slots(slots), translation.override(language_code):
+            return function(*args)
+    
+    # Geocode each unique destination once before any OpenAI call
+    destinations = {normalize_cache_key(params['destination']): params['destination'] for params in valid.values()}
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.POI_GEOCODE_MAX_WORKERS, len(destinations) or 1))) as executor:
+        list(executor.map(lambda destination: run(prefetch_destination, destination), destinations.values()))
+    
+    # Identical requests in the batch are planned once
+    groups = {}
+    for index, params in valid.items():
+        groups.setdefault(plan_cache_key(params), []).append(index)
+    
+    with ThreadPoolExecutor(max_workers=settings.PLAN_BATCH_CONCURRENCY, thread_name_prefix='plan-batch') as executor:
+        futures = {executor.submit(run, cached_plan_pipeline, valid[indexes[0]]): indexes for indexes in groups.values()}
+        for future in as_completed(futures):
+            for index in futures[future]:
+                yield batch_result(index, future)
+
+def prefetch_destination(destination):
+    """
+    Geocode a batch destination ahead of its plans. The response is already
+    streaming, so a refused call (admission control or an open circuit
+    breaker) is only logged: each plan's own geocode_destination then
+    reports it as that item's error line.
+    """
+    try:
+        geocode_with_google_maps(destination)
+    except (AdmissionRejected, CircuitOpen) as e:
+        logger.warning(f"Batch geocode of '{destination}' refused: {str(e)}")
+
+def batch_result(index, future):
+    """NDJSON line for one batch item, from the future running its plan."""
+    try:
+        payload, cache_status = future.result()
+        result = {'index': index, 'status': 200, 'result': payload}
+        if cache_status:
+            result['cached'] = cache_status == 'HIT'
+        return result
+    except PlanError as e:
+        return dict(e.to_dict(), index=index, status=e.status)
+    except Exception as e:
+        logger.error(f"Unexpected error in plan batch item {index}: {str(e)}")
+        return {
+            'index': index,
+            'status': 500,
+            'error': _('An unexpected error occurred. Please try again later.'),
+            'error_code': 'UNEXPECTED_ERROR'
+        }
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TripPlanBatchView(View):
+    """
+    Batch variant of TripPlanView for offline itinerary generation.
+    
+    Takes {"requests": [<plan request>, ...]} and streams NDJSON, one line per
+    plan as soon as it finishes: {"index": i, "status": 200, "result": {...}}
+    or {"index": i, "status": <code>, "error": ..., "error_code": ...}.
+    """
+    
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'error': _('Invalid JSON data provided'),
+                'error_code': 'INVALID_JSON'
+            }, status=400)
+        
+        items = data.get('requests') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return JsonResponse({
+                'error': _('A non-empty list of requests is required'),
+                'error_code': 'MISSING_REQUESTS'
+            }, status=400)
+        
+        if len(items) > settings.PLAN_BATCH_MAX_REQUESTS:
+            return JsonResponse({
+                'error': _('Too many requests in one batch'),
+                'error_code': 'BATCH_TOO_LARGE'
+            }, status=400)
+        
+        language_code = translation.get_language()
+        results = run_plan_batch(items, request.headers.get('Accept-Language', ''), language_code)
+        response = StreamingHttpResponse(
+            response_stream(request, self.ndjson_lines(results, language_code)), content_type='application/x-ndjson'
+        )
+        # Tell nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def ndjson_lines(self, results, language_code):
+        # The stream is consumed after the view returns; keep the request's language active
+        with translation.override(language_code):
+            for result in results:
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+
+# All plan jobs of this process share PLAN_JOB_WORKERS completions at a time
+job_completion_slots = threading.BoundedSemaphore(max(1, settings.PLAN_JOB_WORKERS))
+
+def run_plan_job(params, language_code=None):
+    """Plan job body: run the pipeline and return (status_code, payload)."""
+    with using_completion_slots(job_completion_slots), translation.override(language_code):
+        try:
+            payload, cache_status = cached_plan_pipeline(params)
+            if cache_status:
+                payload = dict(payload, cached=cache_status == 'HIT')
+            return 200, payload
+        except PlanError as e:
+            return e.status, e.to_dict()
+        except Exception as e:
+            logger.error(f"Unexpected error in plan job: {str(e)}")
+            return 500, {
+                'error': _('An unexpected error occurred. Please try again later.'),
+                'error_code': 'UNEXPECTED_ERROR'
+            }
+
+def job_response(request, job, status=200):
+    """JsonResponse describing a plan job, with the URL to poll it."""
+    body = dict(job, status_url=request.build_absolute_uri(reverse('trip_plan_job', args=[job['job_id']])))
+    return JsonResponse(body, status=status)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TripPlanJobView(View):
+    """
+    Job mode for plan generation: POST takes the same body as TripPlanView and
+    returns 202 with a job ID right away; the plan is generated in the
+    background and fetched from TripPlanJobStatusView.
+    """
+    
+    def post(self, request):
+        try:
+            params = parse_plan_request(request)
+        except PlanError as e:
+            return e.to_response()
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'error': _('Invalid JSON data provided'),
+                'error_code': 'INVALID_JSON'
+            }, status=400)
+        
+        job = plan_jobs.submit(run_plan_job, params, translation.get_language())
+        return job_response(request, job, status=202)
+
+def job_wait_seconds(request, max_wait):
+    """The ?wait= long-poll time of a job status request, capped at max_wait."""
+    try:
+        return min(max(float(request.GET.get('wait', 0)), 0), max_wait)
+    except ValueError:
+        return 0
+
+def job_not_found_response():
+    return JsonResponse({
+        'error': _('Job not found or expired'),
+        'error_code': 'JOB_NOT_FOUND'
+    }, status=404)
+
+class TripPlanJobStatusView(View):
+    """
+    Status and result of a plan job. Pass ?wait=<seconds> to long-poll until
+    the job finishes, capped at PLAN_JOB_SYNC_MAX_WAIT: a long poll holds a
+    WSGI worker, so it is off by default (ASGI deployments serve
+    AsyncTripPlanJobStatusView, which allows up to PLAN_JOB_MAX_WAIT).
+    """
+    
+    def get(self, request, job_id):
+        wait_seconds = job_wait_seconds(request, settings.PLAN_JOB_SYNC_MAX_WAIT)
+        job = plan_jobs.wait(job_id, wait_seconds) if wait_seconds else plan_jobs.get(job_id)
+        if job is None:
+            return job_not_found_response()
+        return job_response(request, job)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class POICoordinatesView(View):
+    """
+    Resolve coordinates for POIs of a plan generated with defer_geocoding.
+    
+    Body: {"destination": "Paris", "pois": [{"id": 1, "name": "Eiffel Tower"}, ...]}
+    ("names": ["Eiffel Tower", ...] is accepted as well), or for a stored plan
+    {"plan_id": "...", "ids": [1, 2]}, which resolves the listed POIs (all POIs
+    still missing coordinates when "ids" is omitted) and saves their
+    coordinates. All names are geocoded in one concurrent, cached batch.
+    """
+    
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'error': _('Invalid JSON data provided'),
+                'error_code': 'INVALID_JSON'
+            }, status=400)
+        
+        if not isinstance(data, dict):
+            data = {}
+        if data.get('plan_id'):
+            return self.stored_plan_coordinates(data['plan_id'], data.get('ids'))
+        
+        items = data.get('pois')
+        if not items and isinstance(data.get('names'), list):
+            items = [{'name': name} for name in data['names']]
+        if not isinstance(items, list) or not items:
+            return JsonResponse({
+                'error': _('A non-empty list of POIs is required'),
+                'error_code': 'MISSING_POIS'
+            }, status=400)
+        
+        if len(items) > settings.POI_COORDINATES_MAX_ITEMS:
+            return too_many_pois_response()
+        
+        items = [item if isinstance(item, dict) else {'name': item} for item in items]
+        if not all(isinstance(item.get('name'), str) and item['name'] for item in items):
+            return JsonResponse({
+                'error': _('Every POI needs a name'),
+                'error_code': 'MISSING_POI_NAME'
+            }, status=400)
+        
+        destination = data.get('destination')
+        return JsonResponse({
+            'destination': destination,
+            'pois': resolve_poi_coordinates(items, destination)
+        })
+    
+    def stored_plan_coordinates(self, plan_id, ids=None):
+        if ids is not None and not isinstance(ids, list):
+            return JsonResponse({
+                'error': _('A non-empty list of POIs is required'),
+                'error_code': 'MISSING_POIS'
+            }, status=400)
+        if ids is not None and not all(isinstance(poi_id, int) and not isinstance(poi_id, bool) for poi_id in ids):
+            return JsonResponse({
+                'error': _('POI ids must be integers'),
+                'error_code': 'INVALID_POI_IDS'
+            }, status=400)
+        
+        plan = get_stored_plan(plan_id)
+        if plan is None:
+            return plan_not_found_response()
+        
+        if ids is None:
+            pois = [poi for poi in plan.pois.all() if poi.coordinates is None]
+        else:
+            wanted = set(ids)
+            pois = [poi for poi in plan.pois.all() if poi.poi_id in wanted]
+        
+        if len(pois) > settings.POI_COORDINATES_MAX_ITEMS:
+            return too_many_pois_response()
+        
+        destination = plan.trip.destination
+        results = resolve_poi_coordinates([{'id': poi.poi_id, 'name': poi.name} for poi in pois], destination)
+        
+        # Save what was found so the stored plan no longer needs geocoding
+        resolved = []
+        for poi, result in zip(pois, results):
+            if result['coordinates'] is not None:
+                poi.latitude = result['coordinates']['lat']
+                poi.longitude = result['coordinates']['lon']
+                resolved.append(poi)
+        if resolved:
+            POI.objects.bulk_update(resolved, ['latitude', 'longitude'])
+        
+        return JsonResponse({
+            'plan_id': str(plan.id),
+            'destination': destination,
+            'pois': results
+        })
+
+def too_many_pois_response():
+    return JsonResponse({
+        'error': _('Too many POIs in one request'),
+        'error_code': 'TOO_MANY_POIS'
+    }, status=400)
+
+def resolve_poi_coordinates(items, destination=None):
+    """Geocode a list of {'id', 'name'} items, each unique name once."""
+    unique = {}
+    for item in items:
+        unique.setdefault(item['name'].lower(), {'name': item['name'], 'coordinates': None})
+    geocode_pois(list(unique.values()), destination)
+    
+    results = []
+    for item in items:
+        result = {'name': item['name'], 'coordinates': unique[item['name'].lower()]['coordinates']}
+        if 'id' in item:
+            result['id'] = item['id']
+        results.append(result)
+    return results
+
+def get_stored_plan(plan_id):
+    """A stored Plan with its trip and POIs loaded (two queries), or None."""
+    try:
+        return Plan.objects.with_pois().get(pk=plan_id)
+    except (Plan.DoesNotExist, ValidationError):
+        return None
+
+def plan_not_found_response():
+    return JsonResponse({
+        'error': _('Plan not found'),
+        'error_code': 'PLAN_NOT_FOUND'
+    }, status=404)
+
+class PlanDetailView(View):
+    """Serve a stored plan by id in the same shape as TripPlanView."""
+    
+    def get(self, request, plan_id):
+        plan = get_stored_plan(plan_id)
+        if plan is None:
+            return plan_not_found_response()
+        return JsonResponse(plan.to_payload())
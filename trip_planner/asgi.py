@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_planner.settings')
+# Route /api/plan-trip/ to the async plan pipeline when served over ASGI
+os.environ.setdefault('PLANNER_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
+
+# static_asset_serve is only routed with DEBUG on (WhiteNoise serves the files
+# otherwise): load its assets into memory before the first request
+if settings.DEBUG:
+    from .views import get_asset_registry  # noqa: E402
+
+    get_asset_registry()
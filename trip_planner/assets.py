@@ -0,0 +1,246 @@
+"""
+In-memory view of the React build output.
+
+The asset manifest is parsed once and kept in memory; its mtime is checked at
+most every ASSET_MANIFEST_CHECK_INTERVAL seconds, and a new build is picked up
+on the first check after the file changes. Static files are served from an
+AssetRegistry built from STATIC_ROOT when the server starts (see
+trip_planner/wsgi.py and asgi.py), which is rebuilt along with it.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:  # optional: serve gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml', 'image/x-icon',
+    'text/css', 'text/html', 'text/javascript', 'text/plain',
+}
+MIN_COMPRESS_SIZE = 256
+# Brotli's default quality (11) takes about 15s for the whole build; 9 is within
+# a few percent of its size in a second, which keeps worker startup quick
+BROTLI_QUALITY = 9
+# Preferred coding first
+COMPRESSORS = {'gzip': lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {'br': lambda content: brotli.compress(content, quality=BROTLI_QUALITY), **COMPRESSORS}
+
+# Used when there is no manifest or it cannot be read
+DEFAULT_MAIN_CSS = 'css/main.98bfbf88.css'
+DEFAULT_MAIN_JS = 'js/main.aaa2335a.js'
+
+
+def parse_manifest(manifest):
+    """Template context entries for the bundles listed in asset-manifest.json."""
+    files = manifest.get('files', {})
+    # Clean up paths (remove ./static/ prefix if present)
+    return {
+        'main_css': files.get('main.css', DEFAULT_MAIN_CSS).replace('./static/', ''),
+        'main_js': files.get('main.js', DEFAULT_MAIN_JS).replace('./static/', ''),
+        'additional_chunks': [
+            value.replace('./static/', '')
+            for key, value in files.items()
+            if key.startswith('static/js/') and key != 'static/js/main.js' and key.endswith('.js')
+        ],
+    }
+
+
+DEFAULT_ASSETS = parse_manifest({})
+
+
+class AssetManifest:
+    """
+    The parsed manifest at `path`. `get()` returns (version, assets) where
+    version changes whenever a different manifest has been loaded, so callers
+    can key their own caches on it.
+    """
+
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._assets = DEFAULT_ASSETS
+        self._version = 0
+        self._next_check = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._refresh()
+                    self._next_check = now + self.check_interval
+        return self._version, self._assets
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self._version:
+            return
+
+        assets = DEFAULT_ASSETS
+        if mtime is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    assets = parse_manifest(json.load(f))
+            except (json.JSONDecodeError, IOError, AttributeError) as e:
+                logger.warning(f"Could not read asset manifest: {e}")
+
+        self._mtime = mtime
+        self._assets = assets
+        self._version += 1
+
+
+class Asset:
+    """One static file held in memory with its precompressed variants."""
+
+    def __init__(self, path, content, mtime, content_type, cache_control):
+        self.path = path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.last_modified = http_date(mtime)
+        self.mtime = int(mtime)
+        self.variants = {None: content}
+        if content is not None and content_type in COMPRESSIBLE_TYPES and len(content) >= MIN_COMPRESS_SIZE:
+            for encoding, compress in COMPRESSORS.items():
+                compressed = compress(content)
+                if len(compressed) < len(content):
+                    self.variants[encoding] = compressed
+        digest = hashlib.sha256(content).hexdigest()[:32] if content is not None else f'{self.mtime:x}'
+        self.etags = {encoding: f'"{digest}-{encoding}"' if encoding else f'"{digest}"' for encoding in self.variants}
+
+    @property
+    def in_memory(self):
+        return self.variants[None] is not None
+
+
+class AssetRegistry:
+    """
+    Index of the files under `root`, by path relative to it, plus the request
+    paths mapped to files in `aliases` (SPECIAL_ASSETS), which also get the
+    Cache-Control from `asset_cache`. Files up to `max_file_size` bytes are
+    kept in memory with gzip (and brotli, when the brotli package is
+    installed) variants and strong ETags; larger ones are only indexed.
+    Lookups never touch the filesystem.
+    """
+
+    def __init__(self, root, aliases, fallback_dirs, content_types, cache_settings, asset_cache, max_file_size):
+        self.assets = {}
+        self.aliases = {}
+        self.fallback_dirs = fallback_dirs
+        self.size = 0
+        special_files = set(aliases.values())
+
+        for directory, _dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                path = os.path.relpath(full_path, root).replace(os.sep, '/')
+                try:
+                    stat = os.stat(full_path)
+                    content = None
+                    if stat.st_size <= max_file_size:
+                        with open(full_path, 'rb') as f:
+                            content = f.read()
+                except OSError as e:
+                    logger.warning(f"Could not load static asset {path}: {e}")
+                    continue
+
+                content_type = content_types.get(os.path.splitext(filename)[1].lower())
+                if content_type is None:
+                    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                cache_control = None
+                if path in special_files:
+                    cache_setting = asset_cache.get(path, asset_cache.get('default', 'long'))
+                    cache_control = cache_settings[cache_setting]
+                asset = Asset(path, content, stat.st_mtime, content_type, cache_control)
+                self.assets[path] = asset
+                self.size += sum(len(variant) for variant in asset.variants.values() if variant is not None)
+
+        for requested, path in aliases.items():
+            if path in self.assets:
+                self.aliases[requested] = self.assets[path]
+
+    def find(self, path):
+        """The asset for a request path, trying the fallback directories like before, or None."""
+        asset = self.aliases.get(path) or self.assets.get(path)
+        if asset is None:
+            for directory in self.fallback_dirs:
+                asset = self.assets.get(f'{directory}/{path}')
+                if asset is not None:
+                    break
+        return asset
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _sep, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def asset_response(request, asset):
+    """
+    Serve an in-memory asset: the smallest variant the client accepts, with
+    ETag and Last-Modified, or 304 Not Modified for a matching conditional
+    request.
+    """
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    encoding = next((coding for coding in ('br', 'gzip') if coding in asset.variants and coding in accepted), None)
+
+    headers = {
+        'ETag': asset.etags[encoding],
+        'Last-Modified': asset.last_modified,
+    }
+    if asset.cache_control:
+        headers['Cache-Control'] = asset.cache_control
+    if len(asset.variants) > 1:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # If-None-Match uses the weak comparison, so W/"x" matches "x"
+        requested = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        not_modified = '*' in requested or bool(requested & set(asset.etags.values()))
+    else:
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        not_modified = if_modified_since is not None and asset.mtime <= if_modified_since
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        content = asset.variants[encoding]
+        response = HttpResponse(b'' if request.method == 'HEAD' else content, content_type=asset.content_type)
+        response['Content-Length'] = len(content)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
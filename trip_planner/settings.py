@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -21,6 +22,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', 'YOUR_GOOGLE_MAPS_API_KEY')
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -58,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Add locale middleware
     'django.middleware.common.CommonMiddleware',
+    'planner.middleware.PlanRequestLimitMiddleware',  # Per-client limits and load shedding
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -189,8 +192,193 @@ RTL_LANGUAGES = ['ar', 'he', 'fa', 'ur']
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# Seconds between checks of asset-manifest.json for a new frontend build
+ASSET_MANIFEST_CHECK_INTERVAL = float(os.getenv('ASSET_MANIFEST_CHECK_INTERVAL', '2'))
+# Static files up to this size are served from memory with gzip/brotli variants
+STATIC_ASSET_MAX_FILE_SIZE = int(os.getenv('STATIC_ASSET_MAX_FILE_SIZE', str(1024 * 1024)))
+
+# Cache
+# Defaults to a per-process memory cache; point it at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', 'trip-planner'),
+    }
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Google Maps Geocoding client
+# One pooled keep-alive session per worker process.
+GOOGLE_GEOCODE_URL = os.getenv('GOOGLE_GEOCODE_URL', 'https://maps.googleapis.com/maps/api/geocode/json')
+GEOCODE_POOL_SIZE = int(os.getenv('GEOCODE_POOL_SIZE', '16'))
+GEOCODE_CONNECT_TIMEOUT = float(os.getenv('GEOCODE_CONNECT_TIMEOUT', '3.05'))
+GEOCODE_READ_TIMEOUT = float(os.getenv('GEOCODE_READ_TIMEOUT', '10'))
+GEOCODE_MAX_RETRIES = int(os.getenv('GEOCODE_MAX_RETRIES', '2'))  # on 5xx and OVER_QUERY_LIMIT
+GEOCODE_BACKOFF_FACTOR = float(os.getenv('GEOCODE_BACKOFF_FACTOR', '0.5'))
+
+# POI geocoding
+# Geocodes for the POIs of a plan run concurrently on a bounded thread pool.
+POI_GEOCODE_MAX_WORKERS = int(os.getenv('POI_GEOCODE_MAX_WORKERS', '8'))
+POI_GEOCODE_TIMEOUT = float(os.getenv('POI_GEOCODE_TIMEOUT', '5'))  # seconds per geocode call
+POI_GEOCODE_DEADLINE = float(os.getenv('POI_GEOCODE_DEADLINE', '10'))  # seconds for all POIs of a plan
+# Default for the per-request defer_geocoding flag: return POIs without
+# coordinates and let clients fetch them from /api/pois/coordinates/
+POI_GEOCODE_DEFERRED = os.getenv('POI_GEOCODE_DEFERRED', 'false').lower() == 'true'
+POI_COORDINATES_MAX_ITEMS = int(os.getenv('POI_COORDINATES_MAX_ITEMS', '100'))
+
+# Plan completion size
+# max_tokens for a plan grows with the trip length: BASE + PER_DAY * days,
+# clamped to [MIN, MAX] (a 3-day trip gets 2000 with the defaults)
+PLAN_MAX_TOKENS_BASE = int(os.getenv('PLAN_MAX_TOKENS_BASE', '500'))
+PLAN_MAX_TOKENS_PER_DAY = int(os.getenv('PLAN_MAX_TOKENS_PER_DAY', '500'))
+PLAN_MAX_TOKENS_MIN = int(os.getenv('PLAN_MAX_TOKENS_MIN', '1000'))
+PLAN_MAX_TOKENS_MAX = int(os.getenv('PLAN_MAX_TOKENS_MAX', '8000'))
+
+# Longest trip a plan request may ask for, in days; longer ones get 400 TRIP_TOO_LONG
+PLAN_MAX_TRIP_DAYS = max(1, int(os.getenv('PLAN_MAX_TRIP_DAYS', '30')))
+
+# Chunked plan generation
+# Trips of at least PLAN_CHUNKED_MIN_DAYS days (0 = never) are generated as
+# PLAN_CHUNK_DAYS-day chunks plus a short overview, in parallel completions
+# (at most PLAN_CHUNK_MAX_WORKERS at once per request), and merged. Chunks grow
+# beyond PLAN_CHUNK_DAYS days so that a trip never takes more than PLAN_MAX_CHUNKS
+PLAN_CHUNKED_MIN_DAYS = int(os.getenv('PLAN_CHUNKED_MIN_DAYS', '6'))
+PLAN_CHUNK_DAYS = max(1, int(os.getenv('PLAN_CHUNK_DAYS', '3')))
+PLAN_MAX_CHUNKS = max(1, int(os.getenv('PLAN_MAX_CHUNKS', '10')))
+PLAN_CHUNK_MAX_WORKERS = max(1, int(os.getenv('PLAN_CHUNK_MAX_WORKERS', '4')))
+PLAN_OVERVIEW_MAX_TOKENS = int(os.getenv('PLAN_OVERVIEW_MAX_TOKENS', '800'))
+
+# Plan storage
+# Generated plans are saved with their trip and POIs and served again from
+# /api/plans/<plan_id>/ without another OpenAI call
+PLAN_STORE_ENABLED = os.getenv('PLAN_STORE_ENABLED', 'true').lower() == 'true'
+
+# Place gazetteer
+# POI coordinates resolved once are saved in the Place table and reused by
+# later plans for the same destination instead of calling Google again
+GAZETTEER_ENABLED = os.getenv('GAZETTEER_ENABLED', 'true').lower() == 'true'
+
+# Geocoding cache
+# An in-process LRU in front of the Django cache named by GEOCODE_CACHE_ALIAS.
+GEOCODE_CACHE_ALIAS = os.getenv('GEOCODE_CACHE_ALIAS', 'default')
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(60 * 60 * 24 * 30)))  # 30 days
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', str(60 * 60)))  # 1 hour
+GEOCODE_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_LOCAL_MAX_ENTRIES', '2048'))
+
+# OpenAI client
+# One client (and connection pool) per worker process. OPENAI_BASE_URL can point
+# at a local stand-in server for offline load testing.
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', '60'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+
+# Upstream admission control
+# Token buckets that keep calls under each upstream's quota (0 = no limit).
+# Calls queue for up to *_ADMISSION_MAX_WAIT seconds and are otherwise rejected
+# with GEOCODING_RATE_LIMITED / OPENAI_RATE_LIMITED (503 with Retry-After).
+# The limits are per worker process unless ADMISSION_SHARED counts them in the
+# Django cache named by ADMISSION_CACHE_ALIAS, which all workers must share.
+GEOCODE_QPS = float(os.getenv('GEOCODE_QPS', '0'))
+GEOCODE_ADMISSION_MAX_WAIT = float(os.getenv('GEOCODE_ADMISSION_MAX_WAIT', '2'))
+OPENAI_RPM = float(os.getenv('OPENAI_RPM', '0'))
+OPENAI_TPM = float(os.getenv('OPENAI_TPM', '0'))
+OPENAI_ADMISSION_MAX_WAIT = float(os.getenv('OPENAI_ADMISSION_MAX_WAIT', '10'))
+ADMISSION_SHARED = os.getenv('ADMISSION_SHARED', 'false').lower() == 'true'
+ADMISSION_CACHE_ALIAS = os.getenv('ADMISSION_CACHE_ALIAS', 'default')
+
+# Circuit breakers
+# After *_BREAKER_FAILURES consecutive failed calls (0 = off) an upstream's
+# calls fail fast with 503 GEOCODING_UNAVAILABLE / OPENAI_UNAVAILABLE for
+# *_BREAKER_RESET_TIMEOUT seconds; then one trial call decides whether the
+# breaker closes again. Breaker states are shown by /health/ and /health/ready/.
+GEOCODE_BREAKER_FAILURES = int(os.getenv('GEOCODE_BREAKER_FAILURES', '5'))
+GEOCODE_BREAKER_RESET_TIMEOUT = float(os.getenv('GEOCODE_BREAKER_RESET_TIMEOUT', '30'))
+OPENAI_BREAKER_FAILURES = int(os.getenv('OPENAI_BREAKER_FAILURES', '5'))
+OPENAI_BREAKER_RESET_TIMEOUT = float(os.getenv('OPENAI_BREAKER_RESET_TIMEOUT', '60'))
+
+# Serve /api/plan-trip/ with the async pipeline (set by trip_planner/asgi.py)
+PLANNER_ASYNC_VIEWS = os.getenv('PLANNER_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Plan response cache
+# Opt-in cache of complete /api/plan-trip/ responses keyed on the normalized
+# (destination, start_date, end_date, language). The in-process tier holds at
+# most PLAN_CACHE_MAX_ENTRIES plans.
+PLAN_CACHE_ENABLED = os.getenv('PLAN_CACHE_ENABLED', 'false').lower() == 'true'
+PLAN_CACHE_ALIAS = os.getenv('PLAN_CACHE_ALIAS', 'default')
+PLAN_CACHE_TTL = int(os.getenv('PLAN_CACHE_TTL', str(60 * 60 * 6)))  # 6 hours
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv('PLAN_CACHE_MAX_ENTRIES', '256'))
+
+# Request coalescing (single-flight)
+# Concurrent identical geocodes and plans always share one computation within a
+# process. The *_SHARED options also take a lock in the Django cache so that only
+# one worker computes a key while the others wait for the cached result.
+GEOCODE_SINGLE_FLIGHT_SHARED = os.getenv('GEOCODE_SINGLE_FLIGHT_SHARED', 'false').lower() == 'true'
+GEOCODE_SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv('GEOCODE_SINGLE_FLIGHT_LOCK_TIMEOUT', '15'))
+PLAN_SINGLE_FLIGHT_SHARED = os.getenv('PLAN_SINGLE_FLIGHT_SHARED', 'false').lower() == 'true'
+PLAN_SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv('PLAN_SINGLE_FLIGHT_LOCK_TIMEOUT', '90'))
+
+# Extra keyword -> icon pairs for POIs without an icon, checked after the
+# built-in English keywords, e.g. '{"torre": "🗼", "musée": "🏛️"}'
+POI_ICON_EXTRA_KEYWORDS = json.loads(os.getenv('POI_ICON_EXTRA_KEYWORDS', '{}'))
+
+# Batch plan endpoint (/api/plan-trip/batch/)
+PLAN_BATCH_MAX_REQUESTS = int(os.getenv('PLAN_BATCH_MAX_REQUESTS', '500'))
+PLAN_BATCH_CONCURRENCY = int(os.getenv('PLAN_BATCH_CONCURRENCY', '4'))  # concurrent OpenAI calls, chunks included
+
+# Plan jobs (/api/plan-trip/jobs/)
+# Jobs are stored in the database, so every worker can answer status polls;
+# 'thread' runs them on an in-process pool, 'sync' runs them inline (useful for tests).
+# ?wait= long polls are capped at PLAN_JOB_MAX_WAIT under ASGI and at
+# PLAN_JOB_SYNC_MAX_WAIT under WSGI, where a long poll holds a worker thread.
+PLAN_JOB_EXECUTOR = os.getenv('PLAN_JOB_EXECUTOR', 'thread')
+PLAN_JOB_WORKERS = int(os.getenv('PLAN_JOB_WORKERS', '4'))  # jobs, and OpenAI calls across them, at a time
+PLAN_JOB_TTL = int(os.getenv('PLAN_JOB_TTL', str(60 * 60)))  # 1 hour
+PLAN_JOB_MAX_WAIT = float(os.getenv('PLAN_JOB_MAX_WAIT', '25'))  # seconds, below the proxy timeout
+PLAN_JOB_SYNC_MAX_WAIT = float(os.getenv('PLAN_JOB_SYNC_MAX_WAIT', '0'))
+
+# Plan request limits (planner.middleware.PlanRequestLimitMiddleware)
+# POSTs under PLAN_LIMIT_PATHS are shed with 503 once this process runs
+# PLAN_MAX_IN_FLIGHT of them, and limited per client (IP address, or one of
+# PLAN_API_KEYS sent in PLAN_API_KEY_HEADER) to a number of requests per
+# PLAN_RATE_LIMIT_WINDOW seconds and of concurrent requests, with 429. Client
+# counters live in the PLAN_LIMIT_CACHE_ALIAS cache. 0 turns a limit off.
+# The per-IP limits are off by default: behind nginx every request comes from
+# 127.0.0.1 unless CLIENT_IP_HEADER=X-Real-IP is set, and with the default
+# LocMemCache each worker counts separately. Set them together with
+# CLIENT_IP_HEADER and a shared cache.
+# The POI coordinates endpoint geocodes up to POI_COORDINATES_MAX_ITEMS names per call, so it is limited too
+PLAN_LIMIT_PATHS = [
+    path for path in os.getenv('PLAN_LIMIT_PATHS', '/api/plan-trip/,/api/pois/coordinates/').split(',') if path
+]
+PLAN_LIMIT_CACHE_ALIAS = os.getenv('PLAN_LIMIT_CACHE_ALIAS', 'default')
+PLAN_MAX_IN_FLIGHT = int(os.getenv('PLAN_MAX_IN_FLIGHT', '0'))
+PLAN_RATE_LIMIT_WINDOW = int(os.getenv('PLAN_RATE_LIMIT_WINDOW', '60'))
+PLAN_RATE_LIMIT_PER_IP = int(os.getenv('PLAN_RATE_LIMIT_PER_IP', '0'))
+PLAN_RATE_LIMIT_PER_KEY = int(os.getenv('PLAN_RATE_LIMIT_PER_KEY', '60'))
+PLAN_CONCURRENCY_PER_IP = int(os.getenv('PLAN_CONCURRENCY_PER_IP', '0'))
+PLAN_CONCURRENCY_PER_KEY = int(os.getenv('PLAN_CONCURRENCY_PER_KEY', '8'))
+PLAN_CONCURRENCY_TTL = int(os.getenv('PLAN_CONCURRENCY_TTL', '180'))  # seconds, above the longest request
+PLAN_LIMIT_RETRY_AFTER = int(os.getenv('PLAN_LIMIT_RETRY_AFTER', '5'))
+PLAN_API_KEY_HEADER = os.getenv('PLAN_API_KEY_HEADER', 'X-API-Key')
+PLAN_API_KEYS = frozenset(key for key in os.getenv('PLAN_API_KEYS', '').split(',') if key)
+CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', '')
+
+# Readiness
+# /health/ready/ reports 503 when the database or cache is unreachable, or when
+# an upstream's calls over the last UPSTREAM_HEALTH_WINDOW seconds (once there
+# are at least READINESS_MIN_CALLS of them) fail or slow down past these limits
+UPSTREAM_HEALTH_WINDOW = float(os.getenv('UPSTREAM_HEALTH_WINDOW', '60'))
+READINESS_MIN_CALLS = int(os.getenv('READINESS_MIN_CALLS', '5'))
+READINESS_MAX_ERROR_RATE = float(os.getenv('READINESS_MAX_ERROR_RATE', '0.5'))
+READINESS_MAX_P95_SECONDS = {
+    'geocode': float(os.getenv('READINESS_GEOCODE_MAX_P95', '5')),
+    'openai': float(os.getenv('READINESS_OPENAI_MAX_P95', '60')),
+}
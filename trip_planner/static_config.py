@@ -29,6 +29,9 @@ SPECIAL_ASSETS = {
     'static/robots.txt': 'robots.txt',
 }
 
+# Subdirectories of STATIC_ROOT searched when a requested path is not found
+STATIC_FALLBACK_DIRS = ['css', 'js', 'static']
+
 # Content type mappings for special assets
 CONTENT_TYPES = {
     '.js': 'application/javascript',
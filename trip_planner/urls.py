@@ -19,12 +19,15 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
-from .views import ReactAppView, health_check, static_asset_serve
+from .views import ReactAppView, health_check, liveness, metrics_view, readiness, static_asset_serve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('planner.urls')),
     path('health/', health_check, name='health_check'),
+    path('health/live/', liveness, name='liveness'),
+    path('health/ready/', readiness, name='readiness'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 # Clean static asset serving for development
@@ -1,59 +1,60 @@
-import json
 import os
+import threading
+import uuid
 from django.views.generic import TemplateView
 from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection
 from django.http import JsonResponse, Http404
 from django.views.static import serve as static_serve
 from django.http import HttpResponse
-from pathlib import Path
-from .static_config import SPECIAL_ASSETS, CONTENT_TYPES, CACHE_SETTINGS, ASSET_CACHE
+from django.template.loader import render_to_string
+from planner import metrics
+from planner.admission import limiter_gauges
+from planner.circuitbreaker import OPEN, breaker_states, get_breaker
+from planner.middleware import in_flight
+from planner.views import geocode_cache, geocode_flight, plan_cache, plan_flight
+from .assets import AssetManifest, AssetRegistry, asset_response
+from .static_config import SPECIAL_ASSETS, STATIC_FALLBACK_DIRS, CONTENT_TYPES, CACHE_SETTINGS, ASSET_CACHE
+
+
+asset_manifest = AssetManifest(
+    os.path.join(settings.STATIC_ROOT, 'asset-manifest.json'),
+    check_interval=settings.ASSET_MANIFEST_CHECK_INTERVAL,
+)
+# (manifest version, AssetRegistry); built at startup, rebuilt with each new build
+_asset_registry = (None, None)
+_asset_registry_lock = threading.Lock()
 
 
 class ReactAppView(TemplateView):
     """
     Custom view for serving the React application with dynamic asset loading.
     Reads the asset manifest to provide the correct file names for CSS and JS bundles.
+    
+    The manifest is held in memory (see AssetManifest) and the rendered page is
+    cached until a new manifest is loaded, so serving the SPA shell, including
+    every deep link on the catch-all route, does no disk I/O. The template must
+    therefore not depend on the request.
     """
     template_name = 'index.html'
+    manifest = asset_manifest
+    # (manifest version, rendered HTML) shared by all requests
+    rendered = (None, None)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Try to read asset manifest for dynamic asset loading
-        try:
-            manifest_path = os.path.join(settings.STATIC_ROOT, 'asset-manifest.json')
-            if os.path.exists(manifest_path):
-                with open(manifest_path, 'r') as f:
-                    manifest = json.load(f)
-                
-                # Extract main CSS and JS files
-                context['main_css'] = manifest.get('files', {}).get('main.css', 'css/main.98bfbf88.css')
-                context['main_js'] = manifest.get('files', {}).get('main.js', 'js/main.aaa2335a.js')
-                
-                # Clean up paths (remove ./static/ prefix if present)
-                context['main_css'] = context['main_css'].replace('./static/', '')
-                context['main_js'] = context['main_js'].replace('./static/', '')
-                
-                # Get additional chunks
-                context['additional_chunks'] = []
-                for key, value in manifest.get('files', {}).items():
-                    if key.startswith('static/js/') and key != 'static/js/main.js' and key.endswith('.js'):
-                        chunk_path = value.replace('./static/', '')
-                        context['additional_chunks'].append(chunk_path)
-            else:
-                # Fallback to default assets if manifest doesn't exist
-                context['main_css'] = 'css/main.98bfbf88.css'
-                context['main_js'] = 'js/main.aaa2335a.js'
-                context['additional_chunks'] = []
-                
-        except (json.JSONDecodeError, IOError, KeyError) as e:
-            # Fallback to default assets if there's any error
-            context['main_css'] = 'css/main.98bfbf88.css'
-            context['main_js'] = 'js/main.aaa2335a.js'
-            context['additional_chunks'] = []
-            print(f"Warning: Could not read asset manifest: {e}")
-        
+        _version, assets = self.manifest.get()
+        context.update(assets)
         return context
+    
+    def get(self, request, *args, **kwargs):
+        version, _assets = self.manifest.get()
+        rendered_version, html = ReactAppView.rendered
+        if rendered_version != version:
+            html = render_to_string(self.template_name, self.get_context_data())
+            ReactAppView.rendered = (version, html)
+        return HttpResponse(html)
 
 
 def health_check(request):
@@ -62,45 +63,134 @@ def health_check(request):
     """
     return JsonResponse({
         'status': 'healthy',
-        'message': 'Trip Planner API is running'
+        'message': 'Trip Planner API is running',
+        'geocode_cache': geocode_cache.stats(),
+        'circuit_breakers': breaker_states()
     })
 
 
+def get_asset_registry():
+    """The AssetRegistry for STATIC_ROOT, rebuilt when a new asset manifest is loaded."""
+    global _asset_registry
+    version, _assets = asset_manifest.get()
+    if _asset_registry[0] != version:
+        with _asset_registry_lock:
+            if _asset_registry[0] != version:
+                registry = AssetRegistry(
+                    settings.STATIC_ROOT,
+                    aliases=SPECIAL_ASSETS,
+                    fallback_dirs=STATIC_FALLBACK_DIRS,
+                    content_types=CONTENT_TYPES,
+                    cache_settings=CACHE_SETTINGS,
+                    asset_cache=ASSET_CACHE,
+                    max_file_size=settings.STATIC_ASSET_MAX_FILE_SIZE,
+                )
+                _asset_registry = (version, registry)
+    return _asset_registry[1]
+
+
+def liveness(request):
+    """Liveness probe: the process is up and serving requests."""
+    return JsonResponse({'status': 'alive'})
+
+
+def readiness(request):
+    """
+    Readiness probe for the load balancer. Checks the database and cache
+    connections and summarizes the recent calls to each upstream from the
+    in-process counters (no live upstream probes). Returns 503 when any check
+    fails so traffic can be taken off this node.
+    
+    Each upstream check also reports its circuit breaker. An open breaker
+    does not fail the check by itself: it affects every node alike, and the
+    node still answers from its caches and fails the rest fast.
+    """
+    checks = {
+        'database': check_database(),
+        'cache': check_cache(),
+    }
+    for upstream in ('geocode', 'openai'):
+        checks[upstream] = check_upstream(upstream)
+    
+    ready = all(check['ok'] for check in checks.values())
+    return JsonResponse({'status': 'ready' if ready else 'unavailable', 'checks': checks}, status=200 if ready else 503)
+
+
+def check_database():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return {'ok': True}
+    except DatabaseError as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def check_cache():
+    aliases = sorted({'default', settings.GEOCODE_CACHE_ALIAS, settings.PLAN_CACHE_ALIAS})
+    key = f'planner:readiness:{uuid.uuid4().hex}'
+    try:
+        for alias in aliases:
+            backend = caches[alias]
+            backend.set(key, 1, 10)
+            if backend.get(key) != 1:
+                return {'ok': False, 'error': f"cache '{alias}' did not return a value it just stored"}
+            backend.delete(key)
+        return {'ok': True}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def check_upstream(upstream):
+    summary = metrics.upstream_windows[upstream].summary()
+    ok = True
+    if summary['calls'] >= settings.READINESS_MIN_CALLS:
+        max_p95 = settings.READINESS_MAX_P95_SECONDS.get(upstream)
+        ok = summary['error_rate'] <= settings.READINESS_MAX_ERROR_RATE and (
+            max_p95 is None or summary['p95_seconds'] <= max_p95
+        )
+    return dict(
+        summary, ok=ok, window_seconds=settings.UPSTREAM_HEALTH_WINDOW,
+        circuit_breaker=get_breaker(upstream).snapshot(),
+    )
+
+
+def metrics_view(request):
+    """
+    Prometheus metrics for this worker process: plan request and stage
+    durations, upstream calls, token usage, cache/single-flight stats, the
+    tokens left in the upstream admission buckets and circuit breaker states.
+    """
+    gauges = []
+    for cache_name, cache in (('geocode', geocode_cache), ('plan', plan_cache)):
+        for stat, value in cache.stats().items():
+            gauges.append((f'planner_cache_{stat}', 'Two-tier cache statistics', {'cache': cache_name}, value))
+    for flight_name, flight in (('geocode', geocode_flight), ('plan', plan_flight)):
+        for stat, value in flight.stats().items():
+            gauges.append((f'planner_singleflight_{stat}', 'Request coalescing statistics', {'flight': flight_name}, value))
+    gauges.extend(limiter_gauges())
+    gauges.append(('planner_plan_requests_in_flight', 'Plan requests running in this process', {}, in_flight.count))
+    for upstream, breaker in breaker_states().items():
+        gauges.append(('planner_circuit_breaker_open', 'Whether the upstream circuit breaker is open',
+                       {'upstream': upstream}, int(breaker['state'] == OPEN)))
+    
+    return HttpResponse(metrics.registry.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def static_asset_serve(request, path):
     """
     Clean static asset serving that handles special cases like service workers.
     Uses centralized configuration for better maintainability.
+    
+    Files are looked up in the in-memory AssetRegistry (including the special
+    assets and the old subdirectory fallbacks) and served with ETag and
+    Last-Modified, answering conditional requests with 304.
     """
-    # Check if this is a special asset that needs custom handling
-    if path in SPECIAL_ASSETS:
-        file_path = SPECIAL_ASSETS[path]
-        full_path = os.path.join(settings.STATIC_ROOT, file_path)
-        
-        if os.path.exists(full_path):
-            with open(full_path, 'rb') as f:
-                content = f.read()
-            
-            # Determine content type based on file extension
-            file_ext = Path(file_path).suffix.lower()
-            content_type = CONTENT_TYPES.get(file_ext, 'application/octet-stream')
-            
-            response = HttpResponse(content, content_type=content_type)
-            
-            # Set appropriate cache headers
-            cache_setting = ASSET_CACHE.get(file_path, ASSET_CACHE.get('default', 'long'))
-            response['Cache-Control'] = CACHE_SETTINGS[cache_setting]
-            
-            return response
+    asset = get_asset_registry().find(path)
+    if asset is None:
+        raise Http404(f"Static file '{path}' not found")
     
-    # For regular static files, use Django's built-in static serving
-    try:
-        return static_serve(request, path, document_root=settings.STATIC_ROOT)
-    except Http404:
-        # If file not found in STATIC_ROOT, try looking in static subdirectories
-        for subdir in ['css', 'js', 'static']:
-            subdir_path = os.path.join(settings.STATIC_ROOT, subdir, path)
-            if os.path.exists(subdir_path):
-                return static_serve(request, f"{subdir}/{path}", document_root=settings.STATIC_ROOT)
-        
-        # If still not found, raise 404
-        raise Http404(f"Static file '{path}' not found") 
\ No newline at end of file
+    if not asset.in_memory:
+        # Too large to keep in memory; Django's static serving streams it from disk
+        return static_serve(request, asset.path, document_root=settings.STATIC_ROOT)
+    
+    return asset_response(request, asset)
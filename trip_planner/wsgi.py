@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_planner.settings')
 
 application = get_wsgi_application()
+
+# static_asset_serve is only routed with DEBUG on (WhiteNoise serves the files
+# otherwise): load its assets into memory before the first request
+if settings.DEBUG:
+    from .views import get_asset_registry  # noqa: E402
+
+    get_asset_registry()